@@ -0,0 +1,133 @@
+"""
+Batched PeSTO evaluation with NumPy.
+
+Scores many positions at once (EPD sets, rescoring games, all children of a node)
+instead of calling psqt.evaluate() once per position.
+The positions are unpacked into a (N, 12, 64) occupancy tensor, one plane per
+colour and piece type, and the middlegame and endgame sums are matrix products
+of the flattened tensor with the combined PeSTO tables of psqt.
+The results are exactly the same as those of psqt.evaluate(); which positions
+are mates or stalemates has to be told by the caller (see batch_evaluate()).
+"""
+
+import chess
+import numpy as np
+
+from math import inf
+from typing import Iterable, Sequence, Tuple
+
+from psqt import EG_TABLE, MG_TABLE, PHASE, STARTING_PHASE
+
+# positions per matrix product, bounds the memory of the occupancy tensor
+CHUNK_SIZE = 8192
+
+# occupancy planes: white pawn ... white king, black pawn ... black king
+PLANES = [(color, piece_type) for color in (chess.WHITE, chess.BLACK) for piece_type in chess.PIECE_TYPES]
+
+# (768, 2) matrix of the middlegame and endgame values of every plane and square.
+# All the sums are integers far below 2**24, so float32 products are exact.
+WEIGHTS = np.array(
+    [[MG_TABLE[color][piece_type][square], EG_TABLE[color][piece_type][square]]
+     for color, piece_type in PLANES
+     for square in chess.SQUARES],
+    dtype=np.float32,
+)
+PLANE_PHASES = np.array([PHASE[piece_type] for _, piece_type in PLANES], dtype=np.int64)
+
+
+def bitboards_of(board: chess.Board) -> Tuple[int, ...]:
+    """The pawns, knights, bishops, rooks, queens, kings, white and black bitboards of the board"""
+    return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+            board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK])
+
+
+def board_bitboards(boards: Iterable[chess.Board]) -> np.ndarray:
+    """
+    Reads the bitboards of the boards.
+
+    :returns: (N, 8) uint64 array with the bitboards_of() every board
+    """
+    return np.array([bitboards_of(board) for board in boards], dtype=np.uint64).reshape(-1, 8)
+
+
+def occupancy(bitboards: np.ndarray) -> np.ndarray:
+    """
+    Unpacks (N, 8) bitboards as returned by board_bitboards() into the occupancy tensor.
+
+    :returns: (N, 12, 64) uint8 array, [n, plane, square] is 1 if the square holds the piece of the plane
+    """
+    pieces = bitboards[:, :6]
+    planes = np.concatenate((pieces & bitboards[:, 6:7], pieces & bitboards[:, 7:8]), axis=1)
+    # little endian bytes with little endian bits give the squares a1 ... h8
+    planes = np.ascontiguousarray(planes, dtype="<u8").view(np.uint8).reshape(-1, 12, 8)
+    return np.unpackbits(planes, axis=2, bitorder="little")
+
+
+def batch_static_evaluate(positions: Sequence[chess.Board]|np.ndarray,
+                          chunk_size: int = CHUNK_SIZE
+                         ) -> np.ndarray:
+    """
+    Tapered PeSTO evaluation of many positions from white's point of view,
+    the same as psqt.static_evaluate() for each of them.
+
+    :param positions: boards or their (N, 8) bitboards from board_bitboards()
+    :param chunk_size: number of positions unpacked at once
+    :returns: (N,) float64 array of scores
+    """
+    bitboards = positions if isinstance(positions, np.ndarray) else board_bitboards(positions)
+    scores = np.empty(len(bitboards), dtype=np.float64)
+    for start in range(0, len(bitboards), chunk_size):
+        planes = occupancy(bitboards[start:start + chunk_size])
+        sums = planes.reshape(len(planes), -1).astype(np.float32) @ WEIGHTS
+        mg = sums[:, 0].astype(np.float64)
+        eg = sums[:, 1].astype(np.float64)
+        phase = (planes.sum(axis=2, dtype=np.int64) @ PLANE_PHASES) / STARTING_PHASE
+        scores[start:start + chunk_size] = mg*phase + eg*(1-phase)
+    return scores
+
+
+def batch_evaluate(boards: Sequence[chess.Board],
+                   terminal: Sequence[bool]|None = None
+                  ) -> np.ndarray:
+    """
+    Evaluates many positions from white's point of view, the same as psqt.evaluate()
+    for each of them: mates are +-inf, stalemates and insufficient material 0.
+    Finding mates and stalemates takes a legal move generation per board, which costs
+    more than the whole batched scoring, so it is the caller's job as in
+    batch_static_evaluate(): the boards are taken to have a legal move unless terminal says otherwise.
+
+    :param terminal: for every board whether it has no legal move (e.g. known from the caller's
+                     own move generation), None if none of them is a mate or stalemate
+    :returns: (N,) float64 array of scores
+    """
+    bitboards = board_bitboards(boards)
+    scores = batch_static_evaluate(bitboards)
+    # only positions without pawns, rooks and queens can lack mating material
+    for i in np.flatnonzero((bitboards[:, 0] | bitboards[:, 3] | bitboards[:, 4]) == 0):
+        if boards[i].is_insufficient_material():
+            scores[i] = 0
+    if terminal is not None:
+        for i in np.flatnonzero(terminal):
+            board = boards[i]
+            if board.is_check():
+                scores[i] = -inf if board.turn == chess.WHITE else inf
+            else:
+                scores[i] = 0
+    return scores
+
+
+def batch_evaluate_moves(board: chess.Board, moves: Iterable[chess.Move]) -> np.ndarray:
+    """
+    Evaluates the positions after each of the moves, the same as psqt.evaluate(board, move).
+    The board is left unchanged.
+
+    :returns: (N,) float64 array of scores in the order of the moves
+    """
+    children = []
+    terminal = []
+    for move in moves:
+        board.push(move)
+        children.append(board.copy(stack=False))
+        terminal.append(not any(board.generate_legal_moves()))
+        board.pop()
+    return batch_evaluate(children, terminal)
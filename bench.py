@@ -0,0 +1,257 @@
+"""
+Fixed-position benchmark.
+
+Searches a fixed set of positions to a fixed depth, each with new tables, so
+the node counts depend only on the search and the evaluation: their total is
+the signature of the engine, which changes exactly when the search does.
+The time, nodes per second and evaluations per second measure the speed.
+
+The results can be written as JSON and compared with a stored baseline:
+    python bench.py --json bench.json
+    python bench.py --baseline bench.json
+The UCI interface runs the same benchmark with "bench [depth]".
+
+Parallel search is measured by its time to depth and by the depth it reaches
+in a fixed time, against the same run with one thread (the node counts of
+parallel searches vary from run to run, so they are no signature):
+    python bench.py --threads 4
+    python bench.py --movetime 2000 --threads 4
+"""
+
+import argparse
+import chess
+import io
+import json
+import sys
+
+from contextlib import redirect_stdout
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+import engine
+
+from incremental import IncrementalBoard
+from pawns import PAWN_TABLE, pawn_evaluate
+from stats import SearchStats
+from timeman import TimeManager
+from transposition import DEFAULT_HASH_MB
+
+DEFAULT_BENCH_DEPTH = 6
+# the evaluation is timed on every position of the move tree to this depth from the bench positions
+EVAL_TREE_DEPTH = 2
+# nps within this share of the baseline counts as the same speed
+SPEED_TOLERANCE = 0.05
+
+BENCH_FENS = [
+    # the positions of tests/psqt_tests.py
+    chess.STARTING_FEN,
+    "rnbqkb1r/ppp2Qpp/3p1n2/4p3/2B1P3/8/PPPP1PPP/RNB1K1NR b KQkq - 0 1",
+    "rnbqkb1r/ppp2ppp/3p1n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 0 1",
+    "r1bqkb1r/1ppp1ppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQ1RK1 w kq - 0 1",
+    "r2q1rk1/pppb1ppp/2nbpn2/3p4/2PP4/2NBPNB1/PP3PPP/R2Q1RK1 w - - 0 1",
+    "1R2b2k/8/6Q1/p2p4/P2K4/8/8/8 b - - 0 1",
+    # middlegames with tactics, castling, promotions and en passant
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "rnbqkb1r/pp3ppp/4pn2/2pp4/2PP4/2N2N2/PP2PPPP/R1BQKB1R w KQkq c6 0 5",
+    # endgames
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "8/8/4k3/3p4/3P4/4K3/8/8 w - - 0 1",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+]
+
+
+def time_evaluation(board: chess.Board, eval_function: Callable, depth: int = EVAL_TREE_DEPTH) -> Tuple[int, float]:
+    """
+    Evaluates every position of the move tree to the depth once, like the search
+    evaluates its nodes: the positions differ, siblings share their pawn structure.
+    Only the evaluations are timed, not the moves.
+
+    :returns: number of evaluations and their time in seconds
+    """
+    start_time = perf_counter()
+    eval_function(board)
+    eval_time = perf_counter() - start_time
+    evals = 1
+    if depth > 0:
+        for move in list(board.legal_moves):
+            board.push(move)
+            child_evals, child_time = time_evaluation(board, eval_function, depth - 1)
+            board.pop()
+            evals += child_evals
+            eval_time += child_time
+    return evals, eval_time
+
+
+def bench_position(fen: str,
+                   depth: int,
+                   hash_mb: int = DEFAULT_HASH_MB,
+                   eval_function: Callable = pawn_evaluate,
+                   threads: int = 1,
+                   movetime: int|None = None,
+                   timer: TimeManager|None = None
+                  ) -> dict:
+    """
+    Searches one position to the depth with new tables and times its evaluation.
+
+    :param threads: search processes, see engine.go()
+    :param movetime: searches for this many ms instead of to the depth
+    :param timer: timer of the search to the depth, timer.stop() ends it early, a new one if None
+    :returns: the fen, best move, score, depth reached, nodes, time (ms), nps,
+              evals (timed by time_evaluation()) and evals_per_second
+    """
+    PAWN_TABLE.clear()
+    board = IncrementalBoard(fen)
+    stats = SearchStats()
+    if movetime is not None:
+        mode, mode_param, timer = "t", movetime, TimeManager(movetime, movetime)
+    else:
+        mode, mode_param, timer = "d", depth, timer or TimeManager()
+    # the same iterative deepening as a game search, without the info lines
+    with redirect_stdout(io.StringIO()):
+        move = engine.go(board, mode, mode_param, [], eval_function, False, hash_mb,
+                         threads=threads, timer=timer, stats=stats)
+    search_time = stats.elapsed()
+
+    # the pawn hash table starts empty, as for the search
+    PAWN_TABLE.clear()
+    evals, eval_time = time_evaluation(board, eval_function)
+
+    return {
+        "fen": fen,
+        "bestmove": move.uci() if move is not None else "0000",
+        "score": engine.score,
+        "depth": stats.depth,
+        "nodes": stats.total_nodes(),
+        "time": search_time,
+        "nps": stats.nps(),
+        "evals": evals,
+        "evals_per_second": int(evals / eval_time),
+    }
+
+
+def bench(depth: int = DEFAULT_BENCH_DEPTH,
+          fens: List[str]|None = None,
+          hash_mb: int = DEFAULT_HASH_MB,
+          eval_function: Callable = pawn_evaluate,
+          verbose: bool = True,
+          threads: int = 1,
+          movetime: int|None = None,
+          timer: TimeManager|None = None
+         ) -> dict:
+    """
+    Runs the benchmark on the fens (BENCH_FENS if None).
+
+    :param verbose: prints the result of every position as it is done
+    :param threads: search processes, see engine.go()
+    :param movetime: ms per position instead of the fixed depth
+    :param timer: shared by the searches to the depth, after timer.stop()
+                  the benchmark ends with the position being searched
+    :returns: {"depth", "threads", "movetime", "positions": [bench_position() results],
+               "total": nodes, time, nps, average depth, evals_per_second}
+    """
+    fens = fens or BENCH_FENS
+    positions = []
+    for number, fen in enumerate(fens, 1):
+        result = bench_position(fen, depth, hash_mb, eval_function, threads, movetime, timer)
+        positions.append(result)
+        if verbose:
+            print(f"Position {number}/{len(fens)} depth {result['depth']} nodes {result['nodes']} time {round(result['time'])}"
+                  f" nps {result['nps']} evals/s {result['evals_per_second']} bestmove {result['bestmove']} fen {fen}")
+        if timer is not None and timer.stopped:
+            break
+
+    nodes = sum(result["nodes"] for result in positions)
+    time = sum(result["time"] for result in positions)
+    evals = sum(result["evals"] for result in positions)
+    eval_time = sum(result["evals"] / result["evals_per_second"] for result in positions)
+    return {
+        "depth": depth,
+        "threads": threads,
+        "movetime": movetime,
+        "positions": positions,
+        "total": {
+            "nodes": nodes,
+            "time": time,
+            "nps": int(nodes * 1000 / max(time, 1)),
+            "depth": sum(result["depth"] for result in positions) / len(positions),
+            "evals_per_second": int(evals / eval_time),
+        },
+    }
+
+
+def summary(results: dict) -> List[str]:
+    """Lines with the totals, the node count is the signature of the search"""
+    total = results["total"]
+    return [
+        "===========================",
+        f"Total time (ms) : {round(total['time'])}",
+        f"Nodes searched  : {total['nodes']}",
+        f"Nodes/second    : {total['nps']}",
+        f"Average depth   : {total['depth']:.2f}",
+        f"Evals/second    : {total['evals_per_second']}",
+    ]
+
+
+def compare(results: dict, baseline: dict) -> Tuple[List[str], bool]:
+    """
+    Compares results with a baseline from an earlier run.
+
+    :returns: report lines and whether the search is unchanged (the same nodes in every position)
+    """
+    lines = []
+    # baselines from before the parallel benchmark searched with one thread to the depth
+    for setting, default in (("depth", None), ("threads", 1), ("movetime", None)):
+        old_setting = baseline.get(setting, default)
+        if results[setting] != old_setting:
+            return [f"baseline {setting} {old_setting} differs from {setting} {results[setting]}"], False
+    old_positions = {position["fen"]: position for position in baseline["positions"]}
+    unchanged = True
+    for position in results["positions"]:
+        old = old_positions.get(position["fen"])
+        if old is None:
+            lines.append(f"not in the baseline: {position['fen']}")
+            unchanged = False
+        elif old["nodes"] != position["nodes"] or old["bestmove"] != position["bestmove"]:
+            lines.append(f"search changed: nodes {old['nodes']} -> {position['nodes']},"
+                         f" bestmove {old['bestmove']} -> {position['bestmove']}: {position['fen']}")
+            unchanged = False
+
+    old_total, total = baseline["total"], results["total"]
+    lines.append(f"signature {old_total['nodes']} -> {total['nodes']}"
+                 f" ({'unchanged' if unchanged else 'CHANGED'})")
+    for name in ("nps", "evals_per_second"):
+        ratio = total[name] / max(old_total[name], 1)
+        verdict = "faster" if ratio > 1 + SPEED_TOLERANCE else "slower" if ratio < 1 - SPEED_TOLERANCE else "same"
+        lines.append(f"{name} {old_total[name]} -> {total[name]} ({ratio - 1:+.1%}, {verdict})")
+    return lines, unchanged
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Fixed-depth benchmark of the search")
+    parser.add_argument("--depth", type=int, default=DEFAULT_BENCH_DEPTH)
+    parser.add_argument("--hash", type=int, default=DEFAULT_HASH_MB, help="transposition table size in MB")
+    parser.add_argument("--threads", type=int, default=1, help="search processes")
+    parser.add_argument("--movetime", type=int, default=None, help="ms per position instead of the fixed depth")
+    parser.add_argument("--json", help="writes the results to this file")
+    parser.add_argument("--baseline", help="compares the results with this JSON file")
+    args = parser.parse_args(argv)
+
+    results = bench(args.depth, hash_mb=args.hash, threads=args.threads, movetime=args.movetime)
+    print("\n".join(summary(results)))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            lines, unchanged = compare(results, json.load(f))
+        print("\n".join(lines))
+        # a changed signature fails, e.g. for a check of a pure speed optimisation
+        return 0 if unchanged else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
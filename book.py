@@ -0,0 +1,64 @@
+"""
+Polyglot opening book.
+
+The book file is memory-mapped once by chess.polyglot and stays open in the
+interface process for the whole session. A probe is a binary search for the
+Zobrist key of the position in the sorted entries of the file, so a book move
+is played without starting a search.
+"""
+
+import chess
+import chess.polyglot
+import random
+
+from typing import List
+
+# how a move is chosen from the entries of a position
+WEIGHTED = "weighted"  # at random, in proportion to the weights
+BEST = "best"  # the entry with the highest weight
+SELECTIONS = [WEIGHTED, BEST]
+
+DEFAULT_BOOK_DEPTH = 20  # moves
+
+
+class Book:
+    """
+    Opening book read from a Polyglot .bin file.
+
+    :param path: path of the book file
+    :param selection: WEIGHTED or BEST
+    :param max_depth: the book is only used up to this move number
+    :raises OSError: if the file can't be opened or isn't a Polyglot book
+    """
+
+    def __init__(self,
+                 path: str,
+                 selection: str = WEIGHTED,
+                 max_depth: int = DEFAULT_BOOK_DEPTH
+                ):
+        self.path = path
+        self.reader = chess.polyglot.open_reader(path)
+        self.selection = selection
+        self.max_depth = max_depth
+        self.random = random.Random()
+
+    def __len__(self) -> int:
+        return len(self.reader)
+
+    def moves(self, board: chess.Board) -> List[chess.polyglot.Entry]:
+        """The entries of the position, with legal moves only"""
+        return list(self.reader.find_all(board))
+
+    def probe(self, board: chess.Board) -> chess.Move|None:
+        """The book move for the position, None if it is out of the book"""
+        if board.fullmove_number > self.max_depth:
+            return None
+        entries = self.moves(board)
+        if not entries:
+            return None
+        if self.selection == BEST:
+            return max(entries, key=lambda entry: entry.weight).move
+        return self.random.choices(entries, weights=[entry.weight for entry in entries])[0].move
+
+    def close(self):
+        self.reader.close()
@@ -7,12 +7,26 @@ import chess
 import signal
 import sys
 
+from evalcache import EvalCache
+from incremental import IncrementalBoard
+from pawns import PAWN_TABLE, pawn_evaluate
 from psqt import evaluate
-from minimax import minimax
+from minimax import MATE_BOUND, MATE_SCORE, MAX_DEPTH, SearchFeatures, minimax
+from ordering import MoveOrderer
+from smp import LazySMP, root_split_search
+from stats import SearchStats
+from tablebase import Tablebase, wdl_score
+from timeman import SearchAborted, TimeManager
+from transposition import DEFAULT_HASH_MB, TranspositionTable
+from zobrist import game_history
 
 from math import inf
-from time import time
-from typing import Callable, Dict, Literal, Protocol, List
+from typing import Callable, Dict, Literal, Protocol, List, Tuple
+
+# half width of the first aspiration window in centipawns
+ASPIRATION_WINDOW = 50
+# windows wider than this are opened fully
+MAX_ASPIRATION_WINDOW = 1000
 
 # Michael: I'd love to implement logging with this later:
 # from icecream import ic
@@ -23,14 +37,102 @@ def exit(signum, frame):
     global bestmove, score, fen
     if bestmove == "0000":
         board = chess.Board(fen)
-        bestmove = sorted(board.legal_moves, key=lambda move: evaluate(board, move))[0]
-        score = evaluate(board, bestmove)
-    print("info score", score)
+        # evaluate scores from white's point of view, black picks the lowest score
+        sign = 1 if board.turn == chess.WHITE else -1
+        if any(board.generate_legal_moves()):
+            bestmove = max(board.legal_moves, key=lambda move: sign * eval_cache(board, move))
+            score = sign * eval_cache(board, bestmove)
+    print("info score", uci_score(score))
     print("bestmove", bestmove)
     sys.exit(0)
 
-signal.signal(signal.SIGTERM, exit)
-signal.signal(signal.SIGINT, exit)
+# used by exit() when it has to pick a move without a finished search
+eval_cache = EvalCache(evaluate)
+
+
+def uci_score(score: float) -> str:
+    """Formats a score from the search as UCI "cp <centipawns>" or "mate <moves>" """
+    # the evaluation function scores mates as +-inf, that is a mate in one
+    score = max(-MATE_SCORE + 2, min(MATE_SCORE - 1, score))
+    if score >= MATE_BOUND:
+        return f"mate {int(MATE_SCORE - score + 1) // 2}"
+    if score <= -MATE_BOUND:
+        return f"mate -{int(MATE_SCORE + score) // 2}"
+    return f"cp {round(score)}"
+
+
+def info_line(depth: int,
+              stats: SearchStats,
+              tt: TranspositionTable,
+              score: float,
+              pv: List[chess.Move]
+             ) -> str:
+    """UCI info line reported after each finished iteration"""
+    return (f"info depth {depth} seldepth {stats.seldepth} score {uci_score(score)}"
+            f" nodes {stats.total_nodes()} nps {stats.nps()} time {round(stats.elapsed())}"
+            f" hashfull {tt.hashfull()} tbhits {stats.tb_hits} pv {' '.join(move.uci() for move in pv)}")
+
+
+def bestmove_line(bestmove: str, pv: List[chess.Move]) -> str:
+    """UCI bestmove line, with the expected reply from the principal variation to ponder on"""
+    if len(pv) > 1 and pv[0].uci() == bestmove:
+        return f"bestmove {bestmove} ponder {pv[1].uci()}"
+    return f"bestmove {bestmove}"
+
+
+def print_cache_stats(tablebase: Tablebase|None = None):
+    """Reports the hit rates of the pawn hash table of this process and of the tablebase cache"""
+    if PAWN_TABLE.probes:
+        print(f"info string pawn hash probes {PAWN_TABLE.probes} hits {PAWN_TABLE.hits}"
+              f" hitrate {PAWN_TABLE.hit_rate():.3f}")
+    if tablebase is not None and tablebase.probes:
+        print(f"info string tablebase probes {tablebase.probes} found {tablebase.hits}"
+              f" cache hitrate {tablebase.hit_rate():.3f}")
+
+
+def aspiration_search(board: chess.Board,
+                      depth: int,
+                      previous_score: float|None,
+                      searchmoves: List[chess.Move],
+                      eval_function: Callable,
+                      debug: bool,
+                      tt: TranspositionTable,
+                      orderer: MoveOrderer,
+                      features: SearchFeatures|None = None,
+                      timer: TimeManager|None = None,
+                      stats: SearchStats|None = None,
+                      history: List[int]|None = None,
+                      tablebase: Tablebase|None = None
+                     ) -> Tuple[List[Tuple[str, float]], List[chess.Move]]:
+    """
+    Searches the root with a window centred on the score of the previous iteration.
+    If the best score falls outside of the window, the window is widened
+    on that side and the root is searched again.
+
+    :param previous_score: score of the previous iteration, None searches with the full window
+    :param history: keys of the positions of the game before the root, see minimax()
+    :param tablebase: Syzygy tables probed inside the search, see minimax()
+    :raises SearchAborted: if the timer stops the search
+    :returns: root moves ordered from best to worst and the principal variation
+    """
+    window = ASPIRATION_WINDOW
+    if previous_score is None or abs(previous_score) >= MATE_BOUND:
+        alpha, beta = -inf, inf
+    else:
+        alpha, beta = previous_score - window, previous_score + window
+
+    while True:
+        pv: List[chess.Move] = []
+        moves = minimax(board, depth, alpha, beta, searchmoves, eval_function, debug, True, tt, orderer, pv=pv, features=features, timer=timer, stats=stats, history=history, tablebase=tablebase)
+        best_score = moves[0][1]
+        if best_score <= alpha:
+            window *= 4
+            alpha = best_score - window if window < MAX_ASPIRATION_WINDOW else -inf
+        elif best_score >= beta:
+            window *= 4
+            beta = best_score + window if window < MAX_ASPIRATION_WINDOW else inf
+        else:
+            return moves, pv
 
 
 def go(board: chess.Board,
@@ -38,56 +140,183 @@ def go(board: chess.Board,
        mode_param: int,
        searchmoves: List[chess.Move],
        eval_function: Callable,
-       debug: bool
+       debug: bool,
+       hash_mb: int = DEFAULT_HASH_MB,
+       features: SearchFeatures|None = None,
+       threads: int = 1,
+       timer: TimeManager|None = None,
+       stats: SearchStats|None = None,
+       eval_cache_size: int = 0,
+       tt: TranspositionTable|None = None,
+       orderer: MoveOrderer|None = None,
+       tablebase: Tablebase|None = None,
+       smp: LazySMP|None = None
       ):
     """
     Initializes minimax search with given mode and mode parameter.
+    Scores are reported from the point of view of the side to move.
 
-    :param board: current board position
+    :param board: current board position, its move stack is used to detect repetitions
     :param mode: the search mode - "t" for time, "d" for depth
-    :param mode_param: the search mode parameter - ms for time, depth for depth
+    :param mode_param: the search mode parameter - ms for time (used if timer is None), depth for depth
     :param searchmoves: list of moves to search left empty if we want to analyse all moves
     :param debug: If True, minimax will run in debug mode, logging debug information about every move checked
     :param eval_function: the function used to evaluate board position
+    :param hash_mb: size of the transposition table in MB
+    :param features: switchable search features (null move, LMR), defaults if None
+    :param threads: number of search processes, with more than 1 fixed-depth searches
+                    split the root moves between them and timed searches use Lazy SMP
+    :param timer: soft and hard time limits of a timed search; a fixed-depth search
+                  with a timer deepens iteratively (root split iterations with threads),
+                  so timer.stop() can end it early;
+                  a pondering timer holds the bestmove back until ponderhit or stop
+    :param stats: if given, it is reset and filled with the statistics of the search
+    :param eval_cache_size: number of entries of an evaluation cache put in front of eval_function,
+                            0 disables it (cheap incremental evaluations are faster than the hashing),
+                            the EvalCache UCI option
+    :param tt: transposition table kept from earlier searches (single process only), a new one if None
+    :param orderer: move ordering tables kept from earlier searches, new ones if None
+    :param tablebase: Syzygy tables: a root position in them plays the best move by DTZ
+                      without searching, the search scores positions in them by WDL
+    :param smp: shared table kept from earlier searches with its number of processes (threads is then
+                ignored), a new one is made and closed for threads > 1 if None
     """
     global bestmove, score
-    maximizingPlayer = board.turn == chess.WHITE
-    if mode == "d":
-        bestmove, score = minimax(board, mode_param, -inf, inf, maximizingPlayer, searchmoves, eval_function, debug, True)[0]
-        print("score", score)
+    if eval_cache_size > 0:
+        eval_function = EvalCache(eval_function, eval_cache_size)
+    if stats is None:
+        stats = SearchStats()
+    stats.reset()
+    if not any(board.generate_legal_moves()):
+        # mate or stalemate, UCI has the null move for "no move"
+        bestmove, score = "0000", -MATE_SCORE if board.is_check() else 0
+        print("info depth 0 score", uci_score(score))
         print("bestmove", bestmove)
-        return chess.Move.from_uci(bestmove)
-        
-    if mode == "t":
-        start = time() * 1000
-        depth = 1
-
-        while time() * 1000 - start < mode_param:
-            print("info depth", depth)
-            moves_from_search = minimax(board, depth, -inf, inf, maximizingPlayer, searchmoves, eval_function, debug, True)
-            searchmoves = [chess.Move.from_uci(x[0]) for x in moves_from_search]
+        return None
+    if tablebase is not None:
+        ranked = tablebase.root_moves(board, searchmoves)
+        if ranked:
+            move, wdl, _ = ranked[0]
+            bestmove, score = move.uci(), wdl_score(wdl, 1)
+            stats.tb_hits = len(ranked)
+            print(f"info depth 1 score {uci_score(score)} nodes 1 tbhits {stats.tb_hits} pv {bestmove}")
+            if timer is not None:
+                timer.wait_while_pondering()
+            print_cache_stats(tablebase)
+            print("bestmove", bestmove)
+            return move
+    # the moves played so far, for the repetition checks of the search
+    history = game_history(board)
+    root_ply = len(board.move_stack)
+    # one table for the whole search, so deeper iterations reuse the shallower ones
+    own_smp = smp is None and threads > 1
+    if own_smp:
+        smp = LazySMP(threads, hash_mb)
+    if smp is not None:
+        tt = smp.tt
+        if not own_smp:
+            # a shared table kept from the previous moves, its old entries are replaced first
+            tt.new_search()
+        if mode == "t":
+            smp.start(board, searchmoves, eval_function, features, history,
+                      tablebase.directory if tablebase is not None else "")
+    elif tt is None:
+        tt = TranspositionTable(hash_mb)
+    else:
+        # a table kept from the previous moves, its old entries are replaced first
+        tt.new_search()
+    if orderer is None:
+        orderer = MoveOrderer()
+    else:
+        orderer.new_search()
+    try:
+        if mode == "d" and timer is None:
+            pv: List[chess.Move] = []
+            if smp is not None:
+                moves_from_search, pv = root_split_search(board, mode_param, searchmoves, eval_function, features, smp, orderer, stats, history=history, tablebase=tablebase)
+            else:
+                moves_from_search = minimax(board, mode_param, -inf, inf, searchmoves, eval_function, debug, True, tt, orderer, pv=pv, features=features, stats=stats, history=history, tablebase=tablebase)
             bestmove, score = moves_from_search[0]
-            print("info bestmove", bestmove, "score", score)
-            depth += 1
-        print("info score", score)
-        print("bestmove", bestmove)
-        return chess.Move.from_uci(str(bestmove))
+            stats.depth = mode_param
+            print(info_line(mode_param, stats, tt, score, pv))
+            print_cache_stats(tablebase)
+            print(bestmove_line(bestmove, pv))
+            return chess.Move.from_uci(bestmove)
+
+        else:
+            if timer is None:
+                timer = TimeManager(mode_param, mode_param)
+            max_depth = mode_param if mode == "d" else MAX_DEPTH
+            depth = 1
+            previous_score = None
+            last_iteration = 0
+            pv = []
+
+            # the first iteration always runs to the end so we have a move to play
+            while depth <= max_depth and (depth == 1 or timer.can_start_iteration(last_iteration)):
+                print("info depth", depth)
+                iteration_start = timer.elapsed()
+                timer.active = depth > 1
+                try:
+                    if smp is not None and mode == "d":
+                        moves_from_search, pv = root_split_search(board, depth, searchmoves, eval_function, features, smp, orderer, stats, timer, history, tablebase)
+                    else:
+                        moves_from_search, pv = aspiration_search(board, depth, previous_score, searchmoves, eval_function, debug, tt, orderer, features, timer, stats, history, tablebase)
+                except SearchAborted:
+                    # the result of the unfinished iteration can't be trusted,
+                    # the moves it was searching are still on the board
+                    while len(board.move_stack) > root_ply:
+                        board.pop()
+                    break
+                last_iteration = timer.elapsed() - iteration_start
+                searchmoves = [chess.Move.from_uci(x[0]) for x in moves_from_search]
+                bestmove, score = moves_from_search[0]
+                previous_score = score
+                stats.depth = depth
+                if smp is not None:
+                    stats.helper_nodes = smp.helper_nodes()
+                print(info_line(depth, stats, tt, score, pv))
+                depth += 1
+            # a ponder search that ran out of depth keeps its move until ponderhit or stop
+            timer.wait_while_pondering()
+            if smp is not None:
+                stats.helper_nodes = smp.helper_nodes()
+            print_cache_stats(tablebase)
+            print(bestmove_line(str(bestmove), pv))
+            return chess.Move.from_uci(str(bestmove))
+    finally:
+        if own_smp:
+            smp.close()
+        elif smp is not None:
+            smp.stop()
 
 if __name__ == "__main__":
+    # only the command line engine answers termination with a bestmove,
+    # modules importing engine (the worker, bench, match) keep their own handlers
+    signal.signal(signal.SIGTERM, exit)
+    signal.signal(signal.SIGINT, exit)
+
     fen = sys.argv[1]
-    board = chess.Board(fen)
+    # keeps the evaluation up to date as the search makes and unmakes moves
+    board = IncrementalBoard(fen)
     mode = sys.argv[2]
     mode_param = int(sys.argv[3])
     debug = sys.argv[4] == "on"
-    if len(sys.argv) > 5:
-        searchmoves = [chess.Move.from_uci(move) for move in sys.argv[5:]]
+    hash_mb = int(sys.argv[5])
+    threads = int(sys.argv[6])
+    # hard time limit in ms, only used in the "t" mode
+    hard_limit = float(sys.argv[7])
+    if len(sys.argv) > 8:
+        searchmoves = [chess.Move.from_uci(move) for move in sys.argv[8:]]
     else:
         searchmoves = []
     
     bestmove = "0000"
     score = 0
     
-    go(board, mode, mode_param, searchmoves, evaluate, debug)
+    timer = TimeManager(mode_param, hard_limit) if mode == "t" else None
+
+    go(board, mode, mode_param, searchmoves, pawn_evaluate, debug, hash_mb, threads=threads, timer=timer)
     
     """
     fen = chess.STARTING_FEN
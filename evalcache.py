@@ -0,0 +1,69 @@
+"""
+Evaluation cache.
+
+Remembers the scores of an evaluation function by the Zobrist key of the
+position, so positions reached again (as children being ordered, as leaves,
+in the next iteration) are not evaluated again. The table has a fixed number
+of slots in two flat arrays; a new position replaces whatever was stored in
+its slot.
+"""
+
+import chess
+
+from array import array
+from typing import Callable
+
+from zobrist import child_hash, zobrist_hash
+
+DEFAULT_EVAL_CACHE_SIZE = 1 << 16  # entries
+# limit of the EvalCache UCI option
+MAX_EVAL_CACHE_SIZE = 1 << 24
+
+
+class EvalCache:
+    """
+    Cached evaluation function, called like psqt.evaluate: cache(board) or cache(board, move).
+
+    :param eval_function: the evaluation function to cache, called as eval_function(board)
+    :param size: number of entries, rounded down to a power of two
+    """
+
+    def __init__(self, eval_function: Callable, size: int = DEFAULT_EVAL_CACHE_SIZE):
+        self.eval_function = eval_function
+        self.size = 1 << (max(size, 1).bit_length() - 1)
+        self.mask = self.size - 1
+        self.keys = array("Q", bytes(8 * self.size))
+        self.scores = array("d", bytes(8 * self.size))
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, board: chess.Board, move: chess.Move|None = None) -> float:
+        key = zobrist_hash(board)
+        if move is not None:
+            key = child_hash(board, key, move)
+
+        index = key & self.mask
+        # key 0 marks an empty slot
+        if key and self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+
+        self.misses += 1
+        if move is None:
+            score = self.eval_function(board)
+        else:
+            board.push(move)
+            score = self.eval_function(board)
+            board.pop()
+        self.keys[index] = key
+        self.scores[index] = score
+        return score
+
+    def clear(self):
+        self.keys = array("Q", bytes(8 * self.size))
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
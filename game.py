@@ -0,0 +1,53 @@
+"""
+The game the GUI is playing, as set by the UCI position command.
+
+The GUI sends the whole game with every position command (the starting
+position and all the moves played). The board with its move stack is kept
+between the commands, so usually only the new moves are pushed, and the search
+gets the full history for its repetition checks.
+"""
+
+import chess
+
+from typing import List, Type
+
+
+class Game:
+    """
+    Board of the current game.
+
+    :param board_class: type of the board, e.g. incremental.IncrementalBoard for the search
+    """
+
+    def __init__(self, board_class: Type[chess.Board] = chess.Board):
+        self.board_class = board_class
+        self.fen = chess.STARTING_FEN
+        self.moves: List[str] = []
+        self.board = board_class(self.fen)
+
+    def set_position(self, fen: str, moves: List[str]) -> chess.Board:
+        """
+        Sets the position to fen followed by the moves (in uci).
+        Moves the previous position shares with the new one are kept: the board
+        only pops back to the common part and pushes the rest. It is rebuilt
+        only when the starting position changes.
+
+        :raises ValueError: if the fen or a move can't be parsed, the game is left as it was
+        """
+        old_moves = self.moves if fen == self.fen else []
+        common = 0
+        for old, new in zip(old_moves, moves):
+            if old != new:
+                break
+            common += 1
+        # parsed before the board is touched, so a bad move can't leave half of the line on it
+        new_moves = [chess.Move.from_uci(move) for move in moves[common:]]
+        if fen != self.fen:
+            self.board = self.board_class(fen)
+            self.fen = fen
+        for _ in range(len(old_moves) - common):
+            self.board.pop()
+        for move in new_moves:
+            self.board.push(move)
+        self.moves = list(moves)
+        return self.board
@@ -0,0 +1,155 @@
+"""
+Incrementally updated PeSTO evaluation.
+
+IncrementalBoard is a chess.Board that keeps the PeSTO middlegame and endgame
+sums (material + piece-square tables, white minus black) and the game phase
+up to date as moves are pushed and popped, so the evaluation of a position is
+just the tapered blend of two numbers instead of a scan of the whole board.
+The result is always exactly the same as psqt.static_evaluate().
+The sums use the combined tables of psqt (MG_TABLE, EG_TABLE).
+"""
+
+import chess
+
+from typing import List, Tuple
+
+from psqt import EG_TABLE, MG_TABLE, PHASE, STARTING_PHASE, fast_static_evaluate
+from zobrist import PIECE_KEYS
+
+
+class IncrementalBoard(chess.Board):
+    """
+    chess.Board with running PeSTO sums and the Zobrist key of the pawns (see pawns.py).
+    push() updates them in O(1) from the move, pop() restores the previous ones.
+    Any other change of the pieces (set_fen, set_piece_at, ...) recomputes them.
+    """
+
+    mg: int
+    eg: int
+    phase: int
+    pawn_key: int
+    _eval_stack: List[Tuple[int, int, int, int]]
+
+    def refresh(self):
+        """Recomputes the sums from the pieces on the board"""
+        mg = eg = phase = pawn_key = 0
+        for color in chess.COLORS:
+            for piece_type in chess.PIECE_TYPES:
+                for square in chess.scan_forward(self.pieces_mask(piece_type, color)):
+                    mg += MG_TABLE[color][piece_type][square]
+                    eg += EG_TABLE[color][piece_type][square]
+                    phase += PHASE[piece_type]
+            for square in chess.scan_forward(self.pawns & self.occupied_co[color]):
+                pawn_key ^= PIECE_KEYS[color][chess.PAWN][square]
+        self.mg, self.eg, self.phase, self.pawn_key = mg, eg, phase, pawn_key
+        self._eval_stack = []
+
+    def evaluation(self) -> float:
+        """Tapered evaluation from white's point of view, same as psqt.static_evaluate()"""
+        phase = self.phase / STARTING_PHASE
+        return self.mg*phase + self.eg*(1-phase)
+
+    def push(self, move: chess.Move):
+        self._eval_stack.append((self.mg, self.eg, self.phase, self.pawn_key))
+        # null moves don't move any piece
+        if move:
+            self._update(move)
+        super().push(move)
+
+    def pop(self) -> chess.Move:
+        move = super().pop()
+        if self._eval_stack:
+            self.mg, self.eg, self.phase, self.pawn_key = self._eval_stack.pop()
+        else:
+            # the move was pushed before a copy() with a limited stack
+            self.refresh()
+        return move
+
+    def _update(self, move: chess.Move):
+        """Applies the move to the sums, called before the move is pushed"""
+        us = self.turn
+        them = not us
+        from_square = move.from_square
+        to_square = move.to_square
+        piece_type = self.piece_type_at(from_square)
+        mg_us, eg_us = MG_TABLE[us], EG_TABLE[us]
+
+        mg = self.mg - mg_us[piece_type][from_square]
+        eg = self.eg - eg_us[piece_type][from_square]
+        phase = self.phase
+        pawn_key = self.pawn_key
+        if piece_type == chess.PAWN:
+            pawn_key ^= PIECE_KEYS[us][chess.PAWN][from_square]
+
+        if piece_type == chess.KING and self.is_castling(move):
+            rank = chess.square_rank(from_square)
+            kingside = chess.square_file(to_square) > chess.square_file(from_square)
+            if self.rooks & self.occupied_co[us] & chess.BB_SQUARES[to_square]:
+                # king takes rook notation (chess960)
+                rook_from = to_square
+            else:
+                rook_from = chess.square(7 if kingside else 0, rank)
+            king_to = chess.square(6 if kingside else 2, rank)
+            rook_to = chess.square(5 if kingside else 3, rank)
+            mg += (mg_us[chess.KING][king_to]
+                   - mg_us[chess.ROOK][rook_from] + mg_us[chess.ROOK][rook_to])
+            eg += (eg_us[chess.KING][king_to]
+                   - eg_us[chess.ROOK][rook_from] + eg_us[chess.ROOK][rook_to])
+        else:
+            if self.occupied_co[them] & chess.BB_SQUARES[to_square]:
+                captured_square = to_square
+                captured = self.piece_type_at(to_square)
+            elif piece_type == chess.PAWN and to_square == self.ep_square:
+                captured_square = to_square - 8 if us == chess.WHITE else to_square + 8
+                captured = chess.PAWN
+            else:
+                captured = None
+            if captured:
+                mg -= MG_TABLE[them][captured][captured_square]
+                eg -= EG_TABLE[them][captured][captured_square]
+                phase -= PHASE[captured]
+                if captured == chess.PAWN:
+                    pawn_key ^= PIECE_KEYS[them][chess.PAWN][captured_square]
+
+            new_type = move.promotion or piece_type
+            mg += mg_us[new_type][to_square]
+            eg += eg_us[new_type][to_square]
+            phase += PHASE[new_type] - PHASE[piece_type]
+            if new_type == chess.PAWN:
+                pawn_key ^= PIECE_KEYS[us][chess.PAWN][to_square]
+
+        self.mg, self.eg, self.phase, self.pawn_key = mg, eg, phase, pawn_key
+
+    # python-chess calls clear_stack() whenever the pieces are set up from scratch
+    # (constructor, set_fen, reset, set_piece_at, ...)
+    def clear_stack(self):
+        super().clear_stack()
+        self.refresh()
+
+    def apply_mirror(self):
+        super().apply_mirror()
+        self.refresh()
+
+    def copy(self, *, stack: bool|int = True) -> "IncrementalBoard":
+        board = super().copy(stack=stack)
+        # the copy is built by setting the bitboards directly
+        board.refresh()
+        if stack:
+            stack = len(self.move_stack) if stack is True else stack
+            board._eval_stack = self._eval_stack[-stack:] if stack else []
+        return board
+
+    def root(self) -> "IncrementalBoard":
+        board = super().root()
+        board.refresh()
+        return board
+
+
+def incremental_evaluate(board: chess.Board) -> float:
+    """
+    Evaluation function for the search, from white's point of view.
+    Reads the running sums of an IncrementalBoard, other boards are evaluated from scratch.
+    """
+    if isinstance(board, IncrementalBoard):
+        return board.evaluation()
+    return fast_static_evaluate(board)
@@ -1,55 +1,92 @@
 #!../venv/bin/python
 import asyncio
 import chess
-import os
-import subprocess
+import multiprocessing
 import sys
 
 from re import split as rsplit
 from typing import Dict, List, Tuple
 
-
-def get_resource_path(relative_path):
-    """ Get absolute path to resource, works for dev and for PyInstaller """
-    try:
-        # PyInstaller creates a temp folder and stores path in _MEIPASS
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
-
-    return os.path.join(base_path, relative_path)
-
-
-engine_script = get_resource_path('engine.py')
+from book import BEST, DEFAULT_BOOK_DEPTH, SELECTIONS, WEIGHTED, Book
+from evalcache import MAX_EVAL_CACHE_SIZE
+from game import Game
+from timeman import DEFAULT_MOVE_OVERHEAD, allocate, allocate_movetime
+from worker import EngineWorker
+
+# UCI options set by the GUI with setoption
+options = {
+    "Hash": 16,
+    "Threads": 1,
+    "Move Overhead": DEFAULT_MOVE_OVERHEAD,
+    "Ponder": False,
+    "Book File": "",
+    "Book Depth": DEFAULT_BOOK_DEPTH,
+    "Book Selection": WEIGHTED,
+    "SyzygyPath": "",
+    "EvalCache": 0,
+}
+# the opening book of the Book File option, opened once for the session
+book: Book|None = None
 
 
 def debug_print(*message, **kwargs):
     """Used for debugging purposes when debug mode is on"""
     global debug
-    print(*message, **kwargs)
+    # the GUI reads our stdout through a pipe, which python would buffer
+    print(*message, **kwargs, flush=True)
     if debug:
         with open("debug.txt", "a") as f:
             f.write(f"Engine: {message}\n")
             
 
+async def stdin_reader() -> asyncio.StreamReader|None:
+    """
+    Connects an asyncio stream reader to stdin.
+    Returns None where stdin can't be read asynchronously (e.g. the Windows event loop).
+    """
+    reader = asyncio.StreamReader()
+    try:
+        await asyncio.get_running_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+        )
+    except (NotImplementedError, OSError, ValueError):
+        return None
+    return reader
+
+
 async def read_input(input_queue, output_queue):
+    reader = await stdin_reader()
+    loop = asyncio.get_running_loop()
     while True:
-        gui_input = await asyncio.get_event_loop().run_in_executor(None, input)
-        await input_queue.put(gui_input)
-        if gui_input == "quit" or gui_input == "quit\n":
+        if reader is not None:
+            gui_input = (await reader.readline()).decode()
+        else:
+            gui_input = await loop.run_in_executor(None, sys.stdin.readline)
+        # end of input means the GUI is gone
+        if not gui_input:
+            gui_input = "quit"
+        await input_queue.put(gui_input.rstrip("\r\n"))
+        if gui_input.strip() == "quit":
             break
 
 
 async def print_from_queue(output_queue):
     while True:
-        while not output_queue.empty():
-            debug_print(await output_queue.get())
-        await asyncio.sleep(0.1)
+        debug_print(await output_queue.get())
 
 
 async def uci(output_queue):
     await output_queue.put("id name PuffinChess")
     await output_queue.put("id authors Michael Ruman and Peter Popluhar")
+    await output_queue.put("option name Hash type spin default 16 min 1 max 4096")
+    await output_queue.put("option name Threads type spin default 1 min 1 max 256")
+    await output_queue.put(f"option name Move Overhead type spin default {DEFAULT_MOVE_OVERHEAD} min 0 max 5000")
+    await output_queue.put("option name Ponder type check default false")
+    await output_queue.put("option name Book File type string default <empty>")
+    await output_queue.put(f"option name Book Depth type spin default {DEFAULT_BOOK_DEPTH} min 1 max 100")
+    await output_queue.put(f"option name Book Selection type combo default {WEIGHTED} var {WEIGHTED} var {BEST}")
+    await output_queue.put("option name SyzygyPath type string default <empty>")
+    await output_queue.put(f"option name EvalCache type spin default 0 min 0 max {MAX_EVAL_CACHE_SIZE}")
     await output_queue.put("uciok")
 
 
@@ -66,43 +103,114 @@ async def set_debug(token: str, output_queue):
 
 
 async def setoption(tokens: list[str], output_queue):
-    await output_queue.put(f"Unknown option {tokens[0]}")
+    # setoption name <id> [value <x>]
+    global book
+    if len(tokens) < 2 or tokens[0] != "name":
+        await output_queue.put(f"Invalid setoption command {' '.join(tokens)}")
+        return
+    if "value" in tokens:
+        name = " ".join(tokens[1:tokens.index("value")])
+        value = " ".join(tokens[tokens.index("value") + 1:])
+    else:
+        name = " ".join(tokens[1:])
+        value = ""
+
+    match name:
+        case "Hash":
+            try:
+                options["Hash"] = min(max(int(value), 1), 4096)
+            except ValueError:
+                await output_queue.put(f"Invalid value for Hash: {value}")
+        case "Threads":
+            try:
+                options["Threads"] = min(max(int(value), 1), 256)
+            except ValueError:
+                await output_queue.put(f"Invalid value for Threads: {value}")
+        case "Move Overhead":
+            try:
+                options["Move Overhead"] = min(max(int(value), 0), 5000)
+            except ValueError:
+                await output_queue.put(f"Invalid value for Move Overhead: {value}")
+        case "Ponder":
+            # the GUI decides when to ponder, the option only tells it that we can
+            options["Ponder"] = value.lower() == "true"
+        case "Book File":
+            if book is not None:
+                book.close()
+                book = None
+            options["Book File"] = "" if value == "<empty>" else value
+            if options["Book File"]:
+                try:
+                    book = Book(options["Book File"], options["Book Selection"], options["Book Depth"])
+                except OSError as error:
+                    await output_queue.put(f"info string Can't open book {options['Book File']}: {error}")
+                else:
+                    await output_queue.put(f"info string Book {options['Book File']} with {len(book)} entries")
+        case "Book Depth":
+            try:
+                options["Book Depth"] = min(max(int(value), 1), 100)
+            except ValueError:
+                await output_queue.put(f"Invalid value for Book Depth: {value}")
+            if book is not None:
+                book.max_depth = options["Book Depth"]
+        case "Book Selection":
+            if value.lower() in SELECTIONS:
+                options["Book Selection"] = value.lower()
+                if book is not None:
+                    book.selection = options["Book Selection"]
+            else:
+                await output_queue.put(f"Invalid value for Book Selection: {value}")
+        case "SyzygyPath":
+            # the worker opens the tables with the next search
+            options["SyzygyPath"] = "" if value == "<empty>" else value
+        case "EvalCache":
+            try:
+                options["EvalCache"] = min(max(int(value), 0), MAX_EVAL_CACHE_SIZE)
+            except ValueError:
+                await output_queue.put(f"Invalid value for EvalCache: {value}")
+        case _:
+            await output_queue.put(f"Unknown option {name}")
 
 
-def ucinewgame():
-    return chess.STARTING_FEN
+def ucinewgame(game: Game):
+    game.set_position(chess.STARTING_FEN, [])
 
 
-def position(tokens: list[str]):
+def position(tokens: list[str], game: Game):
+    # position [startpos | fen <fen>] [moves <move1> ... <movei>]
     if tokens[0] == "fen":
-        internal_fen = " ".join(tokens[1:7])
+        fen = " ".join(tokens[1:7])
+        rest = tokens[7:]
     else:
-        internal_fen = chess.STARTING_FEN
-    board = chess.Board(internal_fen)
-    
-    if len(tokens) > 1 and tokens[1] == "moves":
-        for i in range(2, len(tokens)):
-            board.push(chess.Move.from_uci(tokens[i]))
-    if len(tokens) > 7 and tokens[7] == "moves":
-        for i in range(8, len(tokens)):
-            board.push(chess.Move.from_uci(tokens[i]))
-    internal_fen = board.fen()
-    
-    return internal_fen
+        fen = chess.STARTING_FEN
+        rest = tokens[1:]
+    moves = rest[1:] if rest and rest[0] == "moves" else []
+    game.set_position(fen, moves)
+
 
+def book_move(tokens: list[str], game: Game) -> chess.Move|None:
+    """The move from the opening book for go, None to search"""
+    # analysis, pondering and restricted searches want the engine's own opinion
+    if book is None or {"infinite", "ponder", "searchmoves"} & set(tokens):
+        return None
+    return book.probe(game.board)
 
-async def go(tokens: list[str], 
-             fen: str,
-            ) -> asyncio.subprocess.Process:
-    # we won't support ponder and mate
+
+def go(tokens: list[str],
+       game: Game,
+       worker: EngineWorker
+      ):
+    # we won't support mate
     # and we won't even count nodes
     global debug
 
-    debug_arg = "on" if debug else "off"
-    color = str.split(fen)[1]
+    # go ponder: the position ends with the move we expect the opponent to play,
+    # the search runs until ponderhit (then with the limits of this go) or stop
+    ponder = "ponder" in tokens
+    color = "w" if game.board.turn == chess.WHITE else "b"
     searchmoves = []
     if "searchmoves" in tokens:
-        legal_moves = [str(x) for x in chess.Board(fen).legal_moves]
+        legal_moves = [str(x) for x in game.board.legal_moves]
         
         for move in tokens[tokens.index("searchmoves") + 1:]:
             if move not in legal_moves:
@@ -110,69 +218,42 @@ async def go(tokens: list[str],
             searchmoves.append(move)
             
     if "depth" in tokens:
-        depth = tokens[tokens.index("depth") + 1]
-        engine = await asyncio.create_subprocess_exec(
-            "python", "-u", engine_script, fen, "d", depth, debug_arg, *searchmoves, 
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        return engine
-        
+        depth = int(tokens[tokens.index("depth") + 1])
+        worker.go(game.fen, game.moves, "d", depth, 0, searchmoves, debug, options["Hash"], options["Threads"], ponder, options["SyzygyPath"], options["EvalCache"])
+        return
+
     elif "infinite" in tokens:
-        movetime = "86400000"
+        soft_limit = hard_limit = 86400000
 
     elif "movetime" in tokens:
-        movetime = tokens[tokens.index("movetime") + 1]
+        soft_limit, hard_limit = allocate_movetime(
+            int(tokens[tokens.index("movetime") + 1]), options["Move Overhead"]
+        )
     
     elif color+"time" in tokens:
-        movetime = int(tokens[tokens.index(color+"time") + 1])/40
+        time_left = int(tokens[tokens.index(color+"time") + 1])
+        increment = 0
         if color+"inc" in tokens:
-            movetime += int(tokens[tokens.index(color+"inc") + 1])
-        movetime = str(movetime)
+            increment = int(tokens[tokens.index(color+"inc") + 1])
+        movestogo = None
+        if "movestogo" in tokens:
+            movestogo = int(tokens[tokens.index("movestogo") + 1])
+        soft_limit, hard_limit = allocate(time_left, increment, movestogo, options["Move Overhead"])
 
     else:
-        movetime = "86400000"
+        soft_limit = hard_limit = 86400000
         
-    engine = await asyncio.create_subprocess_exec(
-        "python", "-u", engine_script, fen, "t", movetime, debug_arg, *searchmoves,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    return engine
+    worker.go(game.fen, game.moves, "t", int(soft_limit), int(hard_limit), searchmoves, debug, options["Hash"], options["Threads"], ponder, options["SyzygyPath"], options["EvalCache"])
 
 
-async def engine_handler(engine, output_queue):
-    while True:
-        if engine.stdout.at_eof():
-            break
-        line = await engine.stdout.readline()
-        if line:
-            await output_queue.put(line.decode().rstrip())
-        else:
-            await asyncio.sleep(0.1)
-
-async def engine_error_handler(engine, output_queue):
+async def engine_handler(worker: EngineWorker, output_queue):
+    """Passes the lines printed by the search worker to the GUI"""
+    loop = asyncio.get_running_loop()
     while True:
-        if engine.stderr.at_eof():
+        line = await loop.run_in_executor(None, worker.read_line)
+        if line is None:
             break
-        line = await engine.stderr.readline()
-        if line:
-            await output_queue.put(f"Error: {line.decode().rstrip()}")
-
-
-async def stop(engine, output_queue):
-    try:
-        engine.terminate()
-        await engine.wait()
-    except ProcessLookupError:
-        pass
-    except Exception as e:
-        await output_queue.put(f"Error stopping engine: {e}")
-        
-
-def ponderhit():
-    # Won't implement this
-    pass
+        await output_queue.put(line)
 
 
 async def main():
@@ -185,80 +266,113 @@ async def main():
     input_queue = asyncio.Queue()
     output_queue = asyncio.Queue()
 
-    fen = None
-    engine = None
+    # the board of the game with all its moves, None until the GUI sets a position
+    game = None
+    # one search process for the whole session, it keeps its tables between moves
+    worker = EngineWorker()
 
     reader = asyncio.create_task(read_input(input_queue, output_queue))
     printer = asyncio.create_task(print_from_queue(output_queue))
+    engine_output = asyncio.create_task(engine_handler(worker, output_queue))
 
     while True:
-        if not input_queue.empty():
-            command = await input_queue.get()
-            if debug:
-                with open("debug.txt", "a") as f:
-                    f.write(f"UCI: {command}\n")
-
-            # we split the command with any number of whitespaces as the separator (using regex)
-            tokens = rsplit(pattern=r"[\s\t]+", string=command.strip())
-            if engine and engine.stdout.at_eof():
-                await stop(engine, output_queue)
-                engine = None
-            if engine:
-                    
-                if tokens[0] == "stop":
-                    await stop(engine, output_queue)
-                    engine = None
-                else:
-                    debug_print("Engine is running. Please, use 'stop' to terminate it.")
-            else:     
-                match tokens[0]:
-                    case "uci":
-                        await uci(output_queue)
-
-                    case "debug":
-                        if len(tokens) > 1:
-                            await set_debug(tokens[1], output_queue)
-
-                    case "isready":
-                        await output_queue.put("readyok")
-
-                    case "setoption":
-                        await setoption(tokens[1:], output_queue)
-
-                    case "ucinewgame":
-                        fen = ucinewgame()
-
-                    case "position":
-                        fen = position(tokens[1:])
-
-                    case "go":
-                        if fen is not None:
-                            engine = await go(tokens[1:], fen)
-                            await asyncio.create_task(engine_handler(engine, output_queue))
-                            await asyncio.create_task(engine_error_handler(engine, output_queue))
-                        else:
-                            await output_queue.put("No position specified")
-                            
-                    case "ponderhit":
-                        ponderhit()
-
-                    case "quit":
-                        if engine is not None:
-                            await stop(engine, output_queue)
-                        reader.cancel()
-                        printer.cancel()
-                        asyncio.get_running_loop().stop()
-                        sys.exit()
-
-                    case "parameters":
-                        debug_print(f"debug {debug}, fen {fen}, engine {engine}")
-
-                    case _:
-                        debug_print(f"Unknown command {command}")
-
-        await asyncio.sleep(0.1)
-            
+        command = await input_queue.get()
+        if not command.strip():
+            continue
+        if debug:
+            with open("debug.txt", "a") as f:
+                f.write(f"UCI: {command}\n")
+
+        # we split the command with any number of whitespaces as the separator (using regex)
+        tokens = rsplit(pattern=r"[\s\t]+", string=command.strip())
+        if worker.searching and tokens[0] != "quit":
+            if tokens[0] == "stop":
+                # also a ponder miss: the search is thrown away, its hash entries stay in the worker
+                worker.stop()
+            elif tokens[0] == "ponderhit":
+                worker.ponderhit()
+            elif tokens[0] == "isready":
+                await output_queue.put("readyok")
+            else:
+                debug_print("Engine is running. Please, use 'stop' to terminate it.")
+        else:
+            match tokens[0]:
+                case "uci":
+                    await uci(output_queue)
+
+                case "debug":
+                    if len(tokens) > 1:
+                        await set_debug(tokens[1], output_queue)
+
+                case "isready":
+                    await output_queue.put("readyok")
+
+                case "setoption":
+                    await setoption(tokens[1:], output_queue)
+
+                case "ucinewgame":
+                    game = game or Game()
+                    ucinewgame(game)
+                    worker.new_game()
+
+                case "position":
+                    game = game or Game()
+                    try:
+                        position(tokens[1:], game)
+                    except ValueError as error:
+                        # the game keeps the previous position
+                        await output_queue.put(f"info string Invalid position: {error}")
+
+                case "go":
+                    if game is None:
+                        await output_queue.put("No position specified")
+                    elif (move := book_move(tokens[1:], game)) is not None:
+                        await output_queue.put("info string book move")
+                        await output_queue.put(f"bestmove {move.uci()}")
+                    else:
+                        go(tokens[1:], game, worker)
+
+                case "ponderhit":
+                    # the ponder search already sent its bestmove after a stop
+                    pass
+
+                case "quit":
+                    worker.quit()
+                    reader.cancel()
+                    printer.cancel()
+                    engine_output.cancel()
+                    asyncio.get_running_loop().stop()
+                    sys.exit()
+
+                case "bench":
+                    # bench [depth], the fixed-position benchmark of bench.py
+                    try:
+                        depth = int(tokens[1]) if len(tokens) > 1 else None
+                    except ValueError:
+                        await output_queue.put(f"Invalid depth for bench: {tokens[1]}")
+                    else:
+                        worker.bench(depth, options["Hash"])
+
+                case "perft" | "divide":
+                    # perft <depth>, divide <depth>: move tree counts of the current position
+                    game = game or Game()
+                    try:
+                        depth = int(tokens[1])
+                    except (IndexError, ValueError):
+                        await output_queue.put(f"Usage: {tokens[0]} <depth>")
+                    else:
+                        worker.perft(game.fen, game.moves, depth, tokens[0] == "divide")
+
+                case "parameters":
+                    fen = game.board.fen() if game is not None else None
+                    debug_print(f"debug {debug}, fen {fen}, searching {worker.searching}")
+
+                case _:
+                    debug_print(f"Unknown command {command}")
+
 
 if __name__ == "__main__":
+    # needed by the worker process in the PyInstaller executable
+    multiprocessing.freeze_support()
     debug = False
     asyncio.run(main())
@@ -0,0 +1,310 @@
+"""
+Engine-vs-engine matches over a process pool.
+
+Two engine configurations (search depth or time per move, hash size and the
+SearchFeatures settings) play every opening of a list with both colours.
+The games run concurrently, one per process, each finished game is appended
+to the PGN file as soon as it is done, and the running score is reported as
+W/D/L, an Elo estimate with its 95% error margin and the state of a
+sequential probability ratio test (SPRT) of elo0 against elo1.
+
+    python match.py --engine name=new,depth=4 --engine name=old,depth=4,lmr=0 \\
+        --openings openings.epd --pgn match.pgn --sprt
+"""
+
+import argparse
+import chess
+import chess.pgn
+import io
+import multiprocessing
+import os
+import signal
+import sys
+
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field, fields
+from datetime import date
+from math import log, log10, sqrt
+from typing import Iterable, List, Tuple
+
+import engine
+
+from incremental import IncrementalBoard
+from minimax import SearchFeatures
+from ordering import MoveOrderer
+from pawns import pawn_evaluate
+from timeman import DEFAULT_MOVE_OVERHEAD, TimeManager, allocate_movetime
+from transposition import DEFAULT_HASH_MB, TranspositionTable
+
+# games longer than this are adjudicated as draws
+DEFAULT_MAX_PLIES = 300
+DEFAULT_ELO0 = 0
+DEFAULT_ELO1 = 5
+DEFAULT_ALPHA = 0.05
+DEFAULT_BETA = 0.05
+
+
+@dataclass
+class EngineConfig:
+    """
+    Search settings of one side of a match.
+
+    :param name: name in the PGN and the reports
+    :param depth: fixed search depth, used if movetime is None
+    :param movetime: ms per move
+    :param hash_mb: size of the transposition table, kept for the whole game
+    :param features: null-move pruning and late-move reductions settings
+    """
+    name: str
+    depth: int|None = 4
+    movetime: int|None = None
+    hash_mb: int = DEFAULT_HASH_MB
+    features: SearchFeatures = field(default_factory=SearchFeatures)
+
+    @classmethod
+    def parse(cls, spec: str) -> "EngineConfig":
+        """
+        Reads "name=new,depth=4", "name=old,movetime=100,hash=32,lmr=0";
+        the fields of SearchFeatures can be set by their names.
+        """
+        config = cls(name="")
+        feature_types = {feature.name: feature.type for feature in fields(SearchFeatures)}
+        convert = {bool: lambda text: text.lower() in ("1", "true", "on"), int: int, float: float}
+        for item in filter(None, spec.split(",")):
+            key, _, value = item.partition("=")
+            key = key.strip()
+            if key == "name":
+                config.name = value
+            elif key == "depth":
+                config.depth, config.movetime = int(value), None
+            elif key == "movetime":
+                config.movetime = int(value)
+            elif key == "hash":
+                config.hash_mb = int(value)
+            elif key in feature_types:
+                setattr(config.features, key, convert[feature_types[key]](value))
+            else:
+                raise ValueError(f"unknown engine setting {key}")
+        config.name = config.name or spec
+        return config
+
+
+def read_openings(lines: Iterable[str]) -> List[str]:
+    """FENs of the openings in FEN or EPD lines (blank lines and # comments are skipped)"""
+    openings = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            board = chess.Board(line)
+        except ValueError:
+            board, _ = chess.Board.from_epd(line)
+        openings.append(board.fen())
+    return openings
+
+
+def play_game(number: int,
+              fen: str,
+              white: EngineConfig,
+              black: EngineConfig,
+              max_plies: int = DEFAULT_MAX_PLIES
+             ) -> Tuple[int, str, str]:
+    """
+    Plays one game from the fen, each side searching with its own tables.
+
+    :returns: the game number, the result ("1-0", "0-1", "1/2-1/2") and the game as PGN
+    """
+    board = IncrementalBoard(fen)
+    tables = {color: (TranspositionTable(config.hash_mb), MoveOrderer())
+              for color, config in ((chess.WHITE, white), (chess.BLACK, black))}
+    termination = None
+    while not board.is_game_over(claim_draw=True):
+        if len(board.move_stack) >= max_plies:
+            termination = "adjudication"
+            break
+        config = white if board.turn == chess.WHITE else black
+        tt, orderer = tables[board.turn]
+        if config.movetime is not None:
+            timer = TimeManager(*allocate_movetime(config.movetime, DEFAULT_MOVE_OVERHEAD))
+            mode, mode_param = "t", config.movetime
+        else:
+            timer, mode, mode_param = None, "d", config.depth
+        # the search prints its UCI lines
+        with redirect_stdout(io.StringIO()):
+            move = engine.go(board, mode, mode_param, [], pawn_evaluate, False, config.hash_mb,
+                             features=config.features, timer=timer, tt=tt, orderer=orderer)
+        board.push(move)
+
+    result = "1/2-1/2" if termination else board.result(claim_draw=True)
+    game = chess.pgn.Game.from_board(board)
+    game.headers["Event"] = "Match"
+    game.headers["Date"] = date.today().strftime("%Y.%m.%d")
+    game.headers["Round"] = str(number + 1)
+    game.headers["White"] = white.name
+    game.headers["Black"] = black.name
+    game.headers["Result"] = result
+    if termination:
+        game.headers["Termination"] = termination
+    return number, result, str(game)
+
+
+def _play_game_task(args: tuple) -> Tuple[int, str, str]:
+    return play_game(*args)
+
+
+def _init_pool_process():
+    # the main process handles ctrl+c and terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def expected_score(elo: float) -> float:
+    """Expected score of a player that is elo stronger, logistic model"""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_estimate(wins: int, draws: int, losses: int) -> Tuple[float, float]:
+    """
+    Elo difference from the score and the half width of its 95% confidence interval.
+    Infinite while the score is 0 or 100%.
+    """
+    games = wins + draws + losses
+    if not games:
+        return 0.0, float("inf")
+    score = (wins + draws / 2) / games
+    if score <= 0 or score >= 1:
+        return (float("inf") if score >= 1 else float("-inf")), float("inf")
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * sqrt(variance / games)
+
+    def to_elo(s: float) -> float:
+        s = min(max(s, 1e-9), 1 - 1e-9)
+        return -400 * log10(1 / s - 1)
+
+    # + 0.0 turns the -0.0 of an even score into 0.0
+    elo = to_elo(score) + 0.0
+    return elo, (to_elo(score + margin) - to_elo(score - margin)) / 2
+
+
+def sprt(wins: int,
+         draws: int,
+         losses: int,
+         elo0: float = DEFAULT_ELO0,
+         elo1: float = DEFAULT_ELO1,
+         alpha: float = DEFAULT_ALPHA,
+         beta: float = DEFAULT_BETA
+        ) -> Tuple[float, float, float, str]:
+    """
+    Sequential probability ratio test of H0: elo = elo0 against H1: elo = elo1,
+    with the normal approximation of the log-likelihood ratio of the game scores.
+
+    :returns: the log-likelihood ratio, its lower and upper bounds and
+              "H0" or "H1" once one is accepted, "" while the test goes on
+    """
+    lower, upper = log(beta / (1 - alpha)), log((1 - beta) / alpha)
+    games = wins + draws + losses
+    if not games:
+        return 0.0, lower, upper, ""
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if variance == 0:
+        return 0.0, lower, upper, ""
+    s0, s1 = expected_score(elo0), expected_score(elo1)
+    llr = games * (s1 - s0) * (2 * score - s0 - s1) / (2 * variance)
+    decision = "H1" if llr >= upper else "H0" if llr <= lower else ""
+    return llr, lower, upper, decision
+
+
+def status_line(wins: int, draws: int, losses: int, sprt_result: Tuple[float, float, float, str]) -> str:
+    """Running result of the match from the point of view of the first engine"""
+    elo, margin = elo_estimate(wins, draws, losses)
+    llr, lower, upper, decision = sprt_result
+    verdict = {"H1": "H1 accepted", "H0": "H0 accepted", "": "continue"}[decision]
+    return (f"games {wins + draws + losses} W/D/L {wins}/{draws}/{losses}"
+            f" elo {elo:+.1f} +- {margin:.1f}"
+            f" LLR {llr:.2f} ({lower:.2f}, {upper:.2f}) {verdict}")
+
+
+def run_match(first: EngineConfig,
+              second: EngineConfig,
+              openings: List[str],
+              pgn_path: str,
+              rounds: int = 1,
+              concurrency: int|None = None,
+              max_plies: int = DEFAULT_MAX_PLIES,
+              elo0: float = DEFAULT_ELO0,
+              elo1: float = DEFAULT_ELO1,
+              alpha: float = DEFAULT_ALPHA,
+              beta: float = DEFAULT_BETA,
+              stop_on_sprt: bool = False
+             ) -> Tuple[int, int, int]:
+    """
+    Plays every opening rounds times with both colours, the games concurrently.
+    The PGN of every game is appended to pgn_path as it finishes and the status
+    is printed after it.
+
+    :param concurrency: number of game processes, all the cores if None
+    :param stop_on_sprt: ends the match once the SPRT accepts a hypothesis
+    :returns: wins, draws and losses of the first engine
+    """
+    tasks = []
+    for _ in range(rounds):
+        for fen in openings:
+            tasks.append((len(tasks), fen, first, second, max_plies))
+            tasks.append((len(tasks), fen, second, first, max_plies))
+
+    wins = draws = losses = 0
+    with multiprocessing.Pool(concurrency or os.cpu_count(), _init_pool_process) as pool, \
+            open(pgn_path, "a") as pgn:
+        for number, result, game in pool.imap_unordered(_play_game_task, tasks):
+            pgn.write(game + "\n\n")
+            pgn.flush()
+            first_is_white = tasks[number][2] is first
+            if result == "1/2-1/2":
+                draws += 1
+            elif (result == "1-0") == first_is_white:
+                wins += 1
+            else:
+                losses += 1
+            sprt_result = sprt(wins, draws, losses, elo0, elo1, alpha, beta)
+            print(status_line(wins, draws, losses, sprt_result), flush=True)
+            if stop_on_sprt and sprt_result[3]:
+                pool.terminate()
+                break
+    return wins, draws, losses
+
+
+def main(argv: List[str]):
+    parser = argparse.ArgumentParser(description="Engine-vs-engine match over a process pool")
+    parser.add_argument("--engine", action="append", required=True,
+                        help="twice: name=<name>,depth=<plies> or movetime=<ms>,hash=<MB>,<SearchFeatures field>=<value>")
+    parser.add_argument("--openings", help="FEN or EPD file, the starting position if not given")
+    parser.add_argument("--pgn", default="match.pgn", help="the games are appended to this file")
+    parser.add_argument("--rounds", type=int, default=1, help="times every opening is played with both colours")
+    parser.add_argument("--concurrency", type=int, default=None, help="games at once, all cores by default")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES)
+    parser.add_argument("--elo0", type=float, default=DEFAULT_ELO0)
+    parser.add_argument("--elo1", type=float, default=DEFAULT_ELO1)
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA)
+    parser.add_argument("--beta", type=float, default=DEFAULT_BETA)
+    parser.add_argument("--sprt", action="store_true", help="stops the match when the SPRT is decided")
+    args = parser.parse_args(argv)
+    if len(args.engine) != 2:
+        parser.error("--engine has to be given twice")
+
+    first, second = (EngineConfig.parse(spec) for spec in args.engine)
+    if args.openings:
+        with open(args.openings) as f:
+            openings = read_openings(f)
+    else:
+        openings = [chess.STARTING_FEN]
+    print(f"{first.name} vs {second.name}: {len(openings) * 2 * args.rounds} games")
+    wins, draws, losses = run_match(first, second, openings, args.pgn, args.rounds, args.concurrency,
+                                    args.max_plies, args.elo0, args.elo1, args.alpha, args.beta, args.sprt)
+    print(f"{first.name} vs {second.name}: +{wins} ={draws} -{losses}")
+
+
+if __name__ == "__main__":
+    # needed by the pool processes in the PyInstaller executable
+    multiprocessing.freeze_support()
+    main(sys.argv[1:])
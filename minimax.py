@@ -1,104 +1,305 @@
 import chess
 
-from math import inf
+from dataclasses import dataclass
+from math import inf, log, nextafter
 from typing import Callable, List, Tuple
 
+from ordering import MoveOrderer
+from stats import SearchStats
+from tablebase import Tablebase, wdl_score
+from timeman import TimeManager
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+from zobrist import zobrist_hash
+
+# Mates are scored as MATE_SCORE - distance to mate in plies,
+# so the search prefers shorter mates and the scores stay finite
+# which the null-window searches need.
+MATE_SCORE = 1_000_000
+MATE_BOUND = MATE_SCORE - 1000
+# iterative deepening never goes deeper than this
+MAX_DEPTH = 100
+
+
+@dataclass
+class SearchFeatures:
+    """
+    Switchable selectivity of the search and its parameters.
+
+    Null-move pruning: the side to move passes and if a reduced search still
+    fails high the node is cut off. It is skipped in check, at PV nodes and when
+    the side to move has only pawns left, where zugzwang makes passing unsafe.
+    The reduction is null_move_reduction + depth // null_move_depth_divisor.
+
+    Late-move reductions: quiet moves ordered after the first lmr_min_moves moves
+    are searched to a reduced depth (lmr_base + ln(depth) * ln(move number) / lmr_divisor)
+    and re-searched to full depth if they beat alpha.
+    """
+    null_move: bool = True
+    null_move_min_depth: int = 3
+    null_move_reduction: int = 2
+    null_move_depth_divisor: int = 6
+
+    lmr: bool = True
+    lmr_min_depth: int = 3
+    lmr_min_moves: int = 3
+    lmr_base: float = 0.75
+    lmr_divisor: float = 2.25
+
 
 def minimax(board: chess.Board,
         depth: int,
         alpha: float,
         beta: float,
-        maximizingPlayer: bool,
         searchmoves: List[chess.Move],
         eval_function: Callable,
         debug: bool = False,
-        is_root: bool = False
+        is_root: bool = False,
+        tt: TranspositionTable|None = None,
+        orderer: MoveOrderer|None = None,
+        ply: int = 0,
+        pv: List[chess.Move]|None = None,
+        features: SearchFeatures|None = None,
+        timer: TimeManager|None = None,
+        stats: SearchStats|None = None,
+        history: List[int]|None = None,
+        tablebase: Tablebase|None = None
        ) -> float|List[Tuple[str, float]]:
     """
-    Finds best move for the current player using minimax and alpha-beta pruning.
-    
+    Finds best move for the current player using negamax with alpha-beta pruning
+    and principal variation search: the first move is searched with the full window,
+    the rest with a null window and only re-searched if they fail high.
+    Scores are from the point of view of the side to move.
+
     :param board: current board position
     :param depth: depth to go
     :param alpha: alpha value
     :param beta: beta value
-    :param maximizingPlayer: True if current player is maximizing, False otherwise
-    :param eval_function: the function used to evaluate board position
+    :param searchmoves: moves to search at this node, all legal moves if empty
+    :param eval_function: the function used to evaluate board position (from white's point of view),
+                          the search detects mates and stalemates itself, so it can skip that (psqt.static_evaluate)
     :param debug: If True, prints debug information about every move checked
     :param is_root: True signifies that this is the root node
-    
-    :returns: Either evaluation, or moves ordered from worst to best, in the case of root node
+    :param tt: transposition table used for cutoffs and move ordering, None disables it
+    :param orderer: move orderer shared by the whole search, a new one is made if None
+    :param ply: distance from the root
+    :param pv: if given, it is filled with the principal variation from this node
+    :param features: null-move pruning and late-move reductions settings, defaults if None
+    :param timer: polled for the time limit and stop requests, may raise timeman.SearchAborted
+    :param stats: counters of the search, updated if given
+    :param history: Zobrist keys of the positions before this node (the game and the search path),
+                    repetitions of them are scored as draws, None disables the check
+    :param tablebase: Syzygy tables, positions found in them are scored without searching them
+
+    :returns: Either evaluation, or moves ordered from best to worst, in the case of root node
     """
-    if depth == 0 or board.is_checkmate() or board.is_stalemate() or board.is_insufficient_material():
-        return eval_function(board)
-        
-    if maximizingPlayer:
-        value = -inf
+    if timer is not None:
+        timer.check()
+    if stats is not None:
+        stats.nodes += 1
+        if ply > stats.seldepth:
+            stats.seldepth = ply
+    if board.is_insufficient_material():
+        return 0
+    if depth == 0:
+        # Leaves only look for the first legal move, which is found right away
+        # unless the side to move is in check. Interior nodes find mates and
+        # stalemates from their own move loop, so the legal moves are generated once.
+        if not any(board.generate_legal_moves()):
+            return -MATE_SCORE + ply if board.is_check() else 0
+        if stats is not None:
+            stats.evals += 1
+        score = eval_function(board)
+        return score if board.turn == chess.WHITE else -score
+
+    if tt is not None or history is not None:
+        key = zobrist_hash(board)
+    if history is not None and not is_root and is_repetition(history, key, board.halfmove_clock):
+        return 0
+
+    # WDL results assume a fresh 50-move counter, they can be wrong later on
+    if tablebase is not None and not is_root and board.halfmove_clock == 0 and tablebase.can_probe(board):
+        wdl = tablebase.probe_wdl(board)
+        if wdl is not None:
+            if stats is not None:
+                stats.tb_hits += 1
+            return wdl_score(wdl, ply)
+
+    if not is_root:
+        # mate distance pruning: no line from here can beat a shorter mate found already
+        alpha = max(alpha, -MATE_SCORE + ply)
+        beta = min(beta, MATE_SCORE - ply - 1)
+        if alpha >= beta:
+            return alpha
+
+    # null-window nodes can't change the principal variation
+    is_pv = beta > nextafter(alpha, inf)
+
+    hash_move = None
+    if tt is not None:
+        entry = tt.probe(key)
+        if stats is not None:
+            stats.tt_probes += 1
+            stats.tt_hits += entry is not None
+        if entry is not None:
+            tt_depth, bound, tt_score, hash_move = entry
+            tt_score = score_from_tt(tt_score, ply)
+            if not is_pv and not is_root and tt_depth >= depth:
+                if (bound == EXACT
+                        or (bound == LOWER and tt_score >= beta)
+                        or (bound == UPPER and tt_score <= alpha)):
+                    return tt_score
+    alpha_orig = alpha
+    if orderer is None:
+        orderer = MoveOrderer()
+    if features is None:
+        features = SearchFeatures()
+    in_check = board.is_check()
+
+    if (features.null_move
+            and not is_pv
+            and not is_root
+            and not in_check
+            and depth >= features.null_move_min_depth
+            and beta < MATE_BOUND
+            and board.move_stack and board.move_stack[-1]
+            and board.occupied_co[board.turn] & ~(board.pawns | board.kings)):
+        reduction = features.null_move_reduction + depth // features.null_move_depth_divisor
+        board.push(chess.Move.null())
+        # no repetitions through a null move, it isn't a real move
+        score = -minimax(board, max(depth - 1 - reduction, 0), -beta, -nextafter(beta, -inf), [],
+                         eval_function, debug, tt=tt, orderer=orderer, ply=ply + 1, features=features, timer=timer, stats=stats,
+                         tablebase=tablebase)
+        board.pop()
+        if score >= beta:
+            return beta
+
+    value = -inf
+    best_move = None
+    move_number = 0
+    child_pv: List[chess.Move] = []
+    if is_root:
+        moves: List[Tuple[str, float]] = []
+    if history is not None:
+        history.append(key)
+
+    for move in searchmoves or orderer.pick(board, ply, hash_move):
+
+        if debug:
+            print(f"Checking {move}...")
+            print(f"Current board position: {board.fen()}")
+            print(f"Other params: alpha={alpha}, beta={beta}, depth={depth}, searchmoves={searchmoves}, eval_function={eval_function}, debug={debug}, is_root={is_root}")
+
         if is_root:
-            moves: List[Tuple[str, float]] = []
-        try:
-            for move in searchmoves or sorted(board.legal_moves, key=lambda move: eval_function(board, move), reverse=True):
-
-                if debug:
-                    print(f"Checking {move}...")
-                    print(f"Current board position: {board.fen()}")
-                    print(f"Other params: alpha={alpha}, beta={beta}, depth={depth}, maximizingPlayer={maximizingPlayer}, searchmoves={searchmoves}, eval_function={eval_function}, debug={debug}, is_root={is_root}")
-                    
-                board.push(move)
-                if is_root:
-                    print("info root currmove", move)
-                    moves.append((move.uci(), minimax(board, depth - 1, alpha, beta, False, [], eval_function, debug)))
-                    alpha = max(alpha, moves[-1][1])
-                else:
-                    value = max(value,
-                                minimax(board, depth - 1, alpha, beta, False, [], eval_function, debug)
-                               )
-                    alpha = max(alpha, value)
-                board.pop()
-                
-                if beta <= alpha:
-                    break
-                    
-            if is_root:
-                if debug: print(f"returning sorted({moves})")
-                return sorted(moves, key=lambda x: x[1] or -inf, reverse=True)# + [(str(x), -inf) for x in board.legal_moves if x not in  [move[0] for move in moves]]
-    
-            return value
-        except Exception as e:
-            print(f"board {board.fen}, move {move}")
-            print(e)
-        
-    else:
-        value = inf
+            print("info root currmove", move)
+        move_number += 1
+        quiet = orderer.is_quiet(board, move)
+        board.push(move)
+        child_pv.clear()
+        if best_move is None:
+            score = -minimax(board, depth - 1, -beta, -alpha, [], eval_function, debug,
+                             tt=tt, orderer=orderer, ply=ply + 1, pv=child_pv, features=features, timer=timer, stats=stats, history=history, tablebase=tablebase)
+        else:
+            reduction = 0
+            # not at the root: a root split searches every root move to the full depth
+            if (features.lmr
+                    and not is_root
+                    and quiet
+                    and not in_check
+                    and depth >= features.lmr_min_depth
+                    and move_number > features.lmr_min_moves
+                    and not board.is_check()):
+                reduction = int(features.lmr_base + log(depth) * log(move_number) / features.lmr_divisor)
+                reduction = min(reduction, depth - 2)
+            score = -minimax(board, depth - 1 - reduction, -nextafter(alpha, inf), -alpha, [], eval_function, debug,
+                             tt=tt, orderer=orderer, ply=ply + 1, pv=child_pv, features=features, timer=timer, stats=stats, history=history, tablebase=tablebase)
+            if reduction and score > alpha:
+                score = -minimax(board, depth - 1, -nextafter(alpha, inf), -alpha, [], eval_function, debug,
+                                 tt=tt, orderer=orderer, ply=ply + 1, pv=child_pv, features=features, timer=timer, stats=stats, history=history, tablebase=tablebase)
+            if alpha < score < beta:
+                child_pv.clear()
+                score = -minimax(board, depth - 1, -beta, -alpha, [], eval_function, debug,
+                                 tt=tt, orderer=orderer, ply=ply + 1, pv=child_pv, features=features, timer=timer, stats=stats, history=history, tablebase=tablebase)
+        board.pop()
         if is_root:
-            moves: List[Tuple[str, float]] = []
-        try:
-            for move in searchmoves or sorted(board.legal_moves, key=lambda move: eval_function(board, move)):
-                
-                if debug:
-                    print(f"Checking {move}...")
-                    print(f"Current board position: {board.fen()}")
-                    print(f"Other params: alpha={alpha}, beta={beta}, depth={depth}, maximizingPlayer={maximizingPlayer}, searchmoves={searchmoves}, eval_function={eval_function}, debug={debug}, is_root={is_root}")
-                
-                board.push(move)
-                if is_root:
-                    print("info root currmove", move)
-                    moves.append((move.uci(), minimax(board, depth - 1, alpha, beta, True, [], eval_function, debug)))
-                    beta = min(beta, moves[-1][1])
-                else:
-                    value = min(value,
-                            minimax(board, depth - 1, alpha, beta, True, [], eval_function, debug)
-                            )
-                    beta = min(beta, value)
-                board.pop()
-                
-                if beta <= alpha:
-                    break
-    
-            if is_root:
-                if debug: print(f"returning sorted({moves})")
-                return sorted(moves, key=lambda x: x[1]) #+ [(str(x), inf) for x in board.legal_moves if x not in  [move[0] for move in moves]]
-                
-            return value
-        except Exception as e:
-            print(f"board {board.fen}, move {move}")
-            print(e)
\ No newline at end of file
+            moves.append((move.uci(), score))
+
+        if best_move is None or score > value:
+            value, best_move = score, move
+            if score > alpha:
+                alpha = score
+                if pv is not None:
+                    pv[:] = [move] + child_pv
+
+        if alpha >= beta:
+            orderer.update(board, move, depth, ply)
+            if stats is not None:
+                stats.cutoffs += 1
+                stats.first_move_cutoffs += move_number == 1
+            break
+
+    if history is not None:
+        history.pop()
+
+    if best_move is None:
+        # no legal moves
+        return -MATE_SCORE + ply if in_check else 0
+
+    if tt is not None:
+        store(tt, key, depth, value, alpha_orig, beta, best_move, ply)
+
+    if is_root:
+        if debug: print(f"returning sorted({moves})")
+        return sorted(moves, key=lambda x: x[1], reverse=True)
+
+    return value
+
+
+def is_repetition(history: List[int], key: int, halfmove_clock: int) -> bool:
+    """
+    Whether the position with the key occurred before with the same side to move,
+    looking back to the last capture or pawn move (the positions before can't repeat).
+    """
+    for plies_ago in range(4, min(halfmove_clock, len(history)) + 1, 2):
+        if history[-plies_ago] == key:
+            return True
+    return False
+
+
+def score_to_tt(score: float, ply: int) -> float:
+    """Mate scores are stored relative to the node instead of the root"""
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_tt(score: float, ply: int) -> float:
+    """Inverse of score_to_tt()"""
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def store(tt: TranspositionTable,
+          key: int,
+          depth: int,
+          value: float,
+          alpha: float,
+          beta: float,
+          best_move: chess.Move|None,
+          ply: int
+         ):
+    """
+    Saves the node result into the transposition table with the bound type
+    given by the original alpha-beta window of the node.
+    """
+    if value <= alpha:
+        bound = UPPER
+    elif value >= beta:
+        bound = LOWER
+    else:
+        bound = EXACT
+    tt.store(key, depth, bound, score_to_tt(value, ply), best_move)
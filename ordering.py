@@ -0,0 +1,170 @@
+"""
+Move ordering for the minimax search.
+
+Moves are scored with cheap heuristics that don't touch the board:
+the transposition table move first, then captures and promotions by MVV-LVA
+(most valuable victim, least valuable attacker), then killer moves of the ply
+and finally quiet moves by their history score.
+
+The search gets the moves from MoveOrderer.pick(), which generates them
+in these stages lazily, so a node that cuts off early never generates
+(or checks the legality of) the rest of its moves.
+"""
+
+import chess
+
+from typing import Iterator, List
+
+# rough piece values used only to order captures, indexed by piece type
+ORDER_VALUES = [0, 1, 3, 3, 5, 9, 20]
+
+HASH_MOVE_SCORE = 1_000_000
+CAPTURE_SCORE = 100_000
+KILLER_SCORE = 90_000
+# history scores are kept below the killers
+HISTORY_LIMIT = 80_000
+
+KILLERS_PER_PLY = 2
+MAX_PLY = 128
+
+
+class MoveOrderer:
+    """
+    Orders moves using MVV-LVA, killer moves and a butterfly history table.
+    One orderer is shared by the whole search (root included),
+    the search reports beta cutoffs to it with update().
+    """
+
+    def __init__(self):
+        self.killers: List[List[chess.Move|None]] = [
+            [None] * KILLERS_PER_PLY for _ in range(MAX_PLY)
+        ]
+        # history[color][from_square * 64 + to_square]
+        self.history: List[List[int]] = [[0] * 4096, [0] * 4096]
+
+    def clear(self):
+        """Forgets everything, used between games"""
+        self.__init__()
+
+    def new_search(self):
+        """
+        Prepares the tables for a new search.
+        Killers are position specific so they are dropped,
+        history is only scaled down so it still helps the first iterations.
+        """
+        for ply in self.killers:
+            ply[:] = [None] * KILLERS_PER_PLY
+        for table in self.history:
+            for i in range(4096):
+                table[i] >>= 1
+
+    def score(self, board: chess.Board, move: chess.Move, ply: int) -> int:
+        """Heuristic score of the move, higher is searched earlier"""
+        if board.is_capture(move):
+            if board.is_en_passant(move):
+                victim = chess.PAWN
+            else:
+                victim = board.piece_type_at(move.to_square)
+            attacker = board.piece_type_at(move.from_square)
+            score = CAPTURE_SCORE + 10 * ORDER_VALUES[victim] - ORDER_VALUES[attacker]
+            if move.promotion:
+                score += 10 * ORDER_VALUES[move.promotion]
+            return score
+        if move.promotion:
+            return CAPTURE_SCORE + 10 * ORDER_VALUES[move.promotion]
+        if ply < MAX_PLY and move in self.killers[ply]:
+            return KILLER_SCORE + KILLERS_PER_PLY - self.killers[ply].index(move)
+        return self.history[board.turn][move.from_square * 64 + move.to_square]
+
+    def pick(self,
+             board: chess.Board,
+             ply: int,
+             hash_move: chess.Move|None = None
+            ) -> Iterator[chess.Move]:
+        """
+        Yields the legal moves of the position in stages:
+        hash move, captures and promotions, killer moves, quiet moves.
+        A stage is only generated once the previous one is exhausted
+        and pseudo-legal moves are checked for legality only when reached.
+        The board must be in the same position every time the generator resumes.
+
+        :param board: position to generate the moves for
+        :param ply: distance from the root, used for killer moves
+        :param hash_move: best move from the transposition table
+        """
+        if hash_move is not None and board.is_legal(hash_move):
+            yield hash_move
+        else:
+            hash_move = None
+
+        us = board.occupied_co[board.turn]
+        them = board.occupied_co[not board.turn]
+
+        # captures and promotions
+        promotion_rank = chess.BB_RANK_7 if board.turn == chess.WHITE else chess.BB_RANK_2
+        captures = list(board.generate_pseudo_legal_captures())
+        captures.extend(board.generate_pseudo_legal_moves(
+            board.pawns & us & promotion_rank, ~board.occupied
+        ))
+        captures.sort(key=lambda move: self.score(board, move, ply), reverse=True)
+        for move in captures:
+            if move != hash_move and not board.is_into_check(move):
+                yield move
+
+        # killers
+        killers = self.killers[ply] if ply < MAX_PLY else []
+        searched_killers = []
+        for move in killers:
+            if (move is not None
+                    and move != hash_move
+                    and move not in searched_killers
+                    and not move.promotion
+                    and board.is_pseudo_legal(move)
+                    and not board.is_capture(move)
+                    and not board.is_into_check(move)):
+                searched_killers.append(move)
+                yield move
+
+        # quiet moves
+        history = self.history[board.turn]
+        quiets = [
+            move for move in board.generate_pseudo_legal_moves(chess.BB_ALL, ~them)
+            if not move.promotion
+            and move != hash_move
+            and move not in searched_killers
+            and not board.is_en_passant(move)
+        ]
+        quiets.sort(key=lambda move: history[move.from_square * 64 + move.to_square], reverse=True)
+        for move in quiets:
+            if not board.is_into_check(move):
+                yield move
+
+    def is_quiet(self, board: chess.Board, move: chess.Move) -> bool:
+        """Quiet moves are neither captures nor promotions"""
+        return not move.promotion and not board.is_capture(move)
+
+    def update(self, board: chess.Board, move: chess.Move, depth: int, ply: int):
+        """
+        Records a move that caused a beta cutoff.
+        Must be called with the move not yet pushed (or already popped).
+
+        :param board: position the move was played from
+        :param move: move that caused the cutoff
+        :param depth: remaining depth of the node
+        :param ply: distance of the node from the root
+        """
+        if not self.is_quiet(board, move):
+            return
+
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1:] = killers[:-1]
+                killers[0] = move
+
+        table = self.history[board.turn]
+        index = move.from_square * 64 + move.to_square
+        table[index] += depth * depth
+        if table[index] > HISTORY_LIMIT:
+            for i in range(4096):
+                table[i] >>= 1
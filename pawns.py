@@ -0,0 +1,170 @@
+"""
+Pawn structure evaluation.
+
+Doubled, isolated, backward and passed pawns are scored from the pawn
+bitboards with precomputed masks. The pawn structure rarely changes between
+neighbouring nodes of the search, so the terms are kept in a pawn hash table
+keyed by a Zobrist key of the pawns only, which an IncrementalBoard keeps up
+to date as moves are pushed.
+"""
+
+import chess
+
+from array import array
+from typing import List, Tuple
+
+from incremental import IncrementalBoard, incremental_evaluate
+from psqt import PHASE, STARTING_PHASE
+from zobrist import PIECE_KEYS
+
+# (middlegame, endgame) penalties and bonuses in centipawns
+DOUBLED = (-10, -20)  # per pawn beyond the first on a file
+ISOLATED = (-10, -15)
+BACKWARD = (-8, -10)
+# passed pawn bonus by rank counted from the pawn's own side (index 1 is the starting rank)
+PASSED_MG = [0, 5, 5, 10, 20, 35, 60, 0]
+PASSED_EG = [0, 10, 15, 25, 40, 70, 110, 0]
+
+DEFAULT_PAWN_HASH_SIZE = 1 << 14  # entries
+
+ADJACENT_FILES = [(chess.BB_FILES[file - 1] if file > 0 else 0) | (chess.BB_FILES[file + 1] if file < 7 else 0)
+                  for file in range(8)]
+
+
+def _ranks_ahead(color: chess.Color, rank: int) -> int:
+    """Ranks strictly ahead of the rank from the point of view of the color"""
+    ranks = range(rank + 1, 8) if color == chess.WHITE else range(rank)
+    mask = 0
+    for r in ranks:
+        mask |= chess.BB_RANKS[r]
+    return mask
+
+
+def _masks() -> Tuple[List[List[int]], List[List[int]], List[List[int]]]:
+    """
+    Per color and square:
+    squares in front on the same file,
+    squares an enemy pawn would have to be on to stop a passed pawn (same and adjacent files ahead),
+    squares of own pawns that could still support the pawn (adjacent files, same rank or behind)
+    """
+    front, passed, support = [[0] * 64, [0] * 64], [[0] * 64, [0] * 64], [[0] * 64, [0] * 64]
+    for color in chess.COLORS:
+        for square in chess.SQUARES:
+            file, rank = chess.square_file(square), chess.square_rank(square)
+            ahead = _ranks_ahead(color, rank)
+            front[color][square] = ahead & chess.BB_FILES[file]
+            passed[color][square] = ahead & (chess.BB_FILES[file] | ADJACENT_FILES[file])
+            support[color][square] = ~ahead & ADJACENT_FILES[file] & chess.BB_ALL
+    return front, passed, support
+
+
+FRONT_SPAN, PASSED_SPAN, SUPPORT_SPAN = _masks()
+PAWN_KEYS = [PIECE_KEYS[chess.BLACK][chess.PAWN], PIECE_KEYS[chess.WHITE][chess.PAWN]]
+
+
+def pawn_key(board: chess.Board) -> int:
+    """Zobrist key of the pawns of both sides, an IncrementalBoard keeps it as board.pawn_key"""
+    key = 0
+    for color in chess.COLORS:
+        keys = PAWN_KEYS[color]
+        for square in chess.scan_forward(board.pawns & board.occupied_co[color]):
+            key ^= keys[square]
+    return key
+
+
+def pawn_terms(white_pawns: int, black_pawns: int) -> Tuple[int, int]:
+    """
+    Pawn structure score from white's point of view.
+
+    :returns: (middlegame, endgame) score, white minus black
+    """
+    mg = eg = 0
+    for color, ours, theirs, sign in ((chess.WHITE, white_pawns, black_pawns, 1),
+                                      (chess.BLACK, black_pawns, white_pawns, -1)):
+        front, passed, support = FRONT_SPAN[color], PASSED_SPAN[color], SUPPORT_SPAN[color]
+        attacks = chess.BB_PAWN_ATTACKS[color]
+        for file_mask in chess.BB_FILES:
+            count = (ours & file_mask).bit_count()
+            if count > 1:
+                mg += sign * DOUBLED[0] * (count - 1)
+                eg += sign * DOUBLED[1] * (count - 1)
+
+        for square in chess.scan_forward(ours):
+            file = square & 7
+            if not ours & ADJACENT_FILES[file]:
+                mg += sign * ISOLATED[0]
+                eg += sign * ISOLATED[1]
+            elif not ours & support[square]:
+                # no pawn can defend it and the enemy pawns control the square in front
+                stop = square + 8 if color == chess.WHITE else square - 8
+                if attacks[stop] & theirs:
+                    mg += sign * BACKWARD[0]
+                    eg += sign * BACKWARD[1]
+            if not theirs & passed[square] and not ours & front[square]:
+                rank = square >> 3 if color == chess.WHITE else 7 - (square >> 3)
+                mg += sign * PASSED_MG[rank]
+                eg += sign * PASSED_EG[rank]
+    return mg, eg
+
+
+class PawnTable:
+    """
+    Pawn hash table: pawn structure scores by pawn key in flat arrays,
+    a new structure replaces whatever was stored in its slot.
+
+    :param size: number of entries, rounded down to a power of two
+    """
+
+    def __init__(self, size: int = DEFAULT_PAWN_HASH_SIZE):
+        self.size = 1 << (max(size, 1).bit_length() - 1)
+        self.mask = self.size - 1
+        self.keys = array("Q", bytes(8 * self.size))
+        self.mg = array("i", bytes(4 * self.size))
+        self.eg = array("i", bytes(4 * self.size))
+        self.probes = 0
+        self.hits = 0
+
+    def score(self, key: int, white_pawns: int, black_pawns: int) -> Tuple[int, int]:
+        """(middlegame, endgame) pawn structure score of the pawns with the given key"""
+        self.probes += 1
+        index = key & self.mask
+        # key 0 (no pawns at all) is also the empty slot, it is cheap to compute anyway
+        if key and self.keys[index] == key:
+            self.hits += 1
+            return self.mg[index], self.eg[index]
+        mg, eg = pawn_terms(white_pawns, black_pawns)
+        self.keys[index] = key
+        self.mg[index] = mg
+        self.eg[index] = eg
+        return mg, eg
+
+    def clear(self):
+        self.keys = array("Q", bytes(8 * self.size))
+        self.probes = 0
+        self.hits = 0
+
+    def hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes else 0.0
+
+
+# shared by all the searches of the process
+PAWN_TABLE = PawnTable()
+
+
+def pawn_evaluate(board: chess.Board) -> float:
+    """
+    Evaluation function for the search, from white's point of view:
+    incremental_evaluate() plus the tapered pawn structure terms from PAWN_TABLE.
+    """
+    pawns = board.pawns
+    white_pawns = pawns & board.occupied_co[chess.WHITE]
+    black_pawns = pawns & board.occupied_co[chess.BLACK]
+    if isinstance(board, IncrementalBoard):
+        key, phase = board.pawn_key, board.phase
+    else:
+        key = pawn_key(board)
+        phase = sum(PHASE[piece_type] * board.pieces_mask(piece_type, color).bit_count()
+                    for piece_type in chess.PIECE_TYPES for color in chess.COLORS)
+    mg, eg = PAWN_TABLE.score(key, white_pawns, black_pawns)
+    phase /= STARTING_PHASE
+    return incremental_evaluate(board) + mg*phase + eg*(1-phase)
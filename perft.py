@@ -0,0 +1,190 @@
+"""
+Perft: counts the leaf nodes of the legal move tree to a fixed depth.
+
+The counts of well-known positions are published, so perft checks move
+generation (castling, en passant, promotions, pins, checks) and its speed
+measures move generation and make/unmake, the machinery the search runs on.
+The last ply is bulk-counted: the legal moves there are counted, not made.
+hash_perft() adds a table of the counts of positions already seen, which
+pays off at large depths where transpositions are frequent.
+
+    python perft.py 5
+    python perft.py 4 --fen "<fen>" --divide
+    python perft.py --suite
+The UCI interface has "perft <depth>" and "divide <depth>" for the current position.
+"""
+
+import argparse
+import chess
+import sys
+
+from array import array
+from time import perf_counter
+from typing import List, Tuple
+
+from timeman import TimeManager
+from zobrist import zobrist_hash
+
+DEFAULT_PERFT_HASH_SIZE = 1 << 20  # entries
+# the suite skips counts above this, deeper counts take minutes in Python
+SUITE_MAX_NODES = 5_000_000
+
+# standard positions with their published counts for depths 1, 2, ...
+REFERENCE_POSITIONS = [
+    (chess.STARTING_FEN,
+     [20, 400, 8902, 197281, 4865609, 119060324]),
+    ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603, 193690690]),
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624, 11030083]),
+    ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333, 15833292]),
+    ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487, 89941194]),
+    ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594, 164075551]),
+]
+
+
+def perft(board: chess.Board, depth: int, timer: TimeManager|None = None) -> int:
+    """
+    Number of leaf nodes at the depth, the board is left unchanged.
+
+    :param timer: polled at the nodes above the last ply, timer.stop() aborts the count
+    :raises SearchAborted: if the timer stops the count, the moves of the path stay on the board
+    """
+    if depth <= 1:
+        # bulk counting: the moves of the last ply are only counted
+        return board.legal_moves.count() if depth == 1 else 1
+    if timer is not None:
+        timer.check()
+    nodes = 0
+    for move in board.generate_legal_moves():
+        board.push(move)
+        nodes += perft(board, depth - 1, timer)
+        board.pop()
+    return nodes
+
+
+def divide(board: chess.Board, depth: int, timer: TimeManager|None = None) -> List[Tuple[chess.Move, int]]:
+    """perft() of the position after every legal move, for finding the move generation bug"""
+    counts = []
+    for move in list(board.legal_moves):
+        board.push(move)
+        counts.append((move, perft(board, depth - 1, timer)))
+        board.pop()
+    return counts
+
+
+class PerftTable:
+    """
+    Counts of positions at a remaining depth by Zobrist key, in flat arrays;
+    a new position replaces whatever was stored in its slot.
+
+    :param size: number of entries, rounded down to a power of two
+    """
+
+    def __init__(self, size: int = DEFAULT_PERFT_HASH_SIZE):
+        self.size = 1 << (max(size, 1).bit_length() - 1)
+        self.mask = self.size - 1
+        self.keys = array("Q", bytes(8 * self.size))
+        self.depths = array("B", bytes(self.size))
+        self.counts = array("Q", bytes(8 * self.size))
+        self.probes = 0
+        self.hits = 0
+
+    def hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes else 0.0
+
+
+def hash_perft(board: chess.Board, depth: int, table: PerftTable, timer: TimeManager|None = None) -> int:
+    """perft() that looks up and stores the counts of positions two or more plies from the leaves"""
+    if depth <= 1:
+        return board.legal_moves.count() if depth == 1 else 1
+    if timer is not None:
+        timer.check()
+    key = zobrist_hash(board)
+    # the same position counts differently at different depths
+    index = (key ^ depth * 0x9E3779B97F4A7C15) & table.mask
+    table.probes += 1
+    if table.keys[index] == key and table.depths[index] == depth:
+        table.hits += 1
+        return table.counts[index]
+    nodes = 0
+    for move in board.generate_legal_moves():
+        board.push(move)
+        nodes += hash_perft(board, depth - 1, table, timer)
+        board.pop()
+    table.keys[index] = key
+    table.depths[index] = depth
+    table.counts[index] = nodes
+    return nodes
+
+
+def run(board: chess.Board,
+        depth: int,
+        show_divide: bool = False,
+        table: PerftTable|None = None,
+        timer: TimeManager|None = None
+       ) -> Tuple[int, float]:
+    """
+    Counts the nodes to the depth and prints them, move by move with show_divide.
+
+    :param table: used for a hash perft if given
+    :param timer: stops the count, see perft()
+    :raises SearchAborted: if the timer stops the count
+    :returns: nodes and time in ms
+    """
+    start_time = perf_counter()
+    if show_divide:
+        nodes = 0
+        for move in list(board.legal_moves):
+            board.push(move)
+            count = hash_perft(board, depth - 1, table, timer) if table is not None else perft(board, depth - 1, timer)
+            board.pop()
+            print(f"{move.uci()}: {count}")
+            nodes += count
+    else:
+        nodes = hash_perft(board, depth, table, timer) if table is not None else perft(board, depth, timer)
+    time = (perf_counter() - start_time) * 1000
+    print(f"Nodes searched: {nodes}")
+    print(f"info depth {depth} nodes {nodes} time {round(time)} nps {int(nodes * 1000 / max(time, 1))}")
+    return nodes, time
+
+
+def suite(max_nodes: int = SUITE_MAX_NODES, table: PerftTable|None = None) -> bool:
+    """Checks the reference positions up to counts of max_nodes, returns whether all of them match"""
+    ok = True
+    for fen, counts in REFERENCE_POSITIONS:
+        board = chess.Board(fen)
+        for depth, expected in enumerate(counts, 1):
+            if expected > max_nodes:
+                break
+            start_time = perf_counter()
+            nodes = hash_perft(board, depth, table) if table is not None else perft(board, depth)
+            time = (perf_counter() - start_time) * 1000
+            ok &= nodes == expected
+            print(f"{'ok' if nodes == expected else 'FAILED'} depth {depth} nodes {nodes} expected {expected}"
+                  f" nps {int(nodes * 1000 / max(time, 1))} fen {fen}")
+    return ok
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Move generation node counts")
+    parser.add_argument("depth", type=int, nargs="?", default=4)
+    parser.add_argument("--fen", default=chess.STARTING_FEN)
+    parser.add_argument("--divide", action="store_true", help="counts per root move")
+    parser.add_argument("--hash", type=int, default=0, help="entries of the perft hash table, 0 for none")
+    parser.add_argument("--suite", action="store_true", help="checks the reference positions")
+    parser.add_argument("--max-nodes", type=int, default=SUITE_MAX_NODES, help="largest count checked by --suite")
+    args = parser.parse_args(argv)
+
+    table = PerftTable(args.hash) if args.hash else None
+    if args.suite:
+        return 0 if suite(args.max_nodes, table) else 1
+    run(chess.Board(args.fen), args.depth, args.divide, table)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -6,6 +6,7 @@ Code adapted from https://github.com/luccabb/lazy_smp/blob/master/psqt.py
 import chess
 
 from math import inf
+from typing import List
 
 #piece values
 MG_PIECE_VALUES = {
@@ -190,6 +191,28 @@ STARTING_PHASE = sum([PIECE_PHASE_VALUES[i]
                  )
 
 
+def _signed_table(pesto: dict, values: dict) -> List[List[List[int]]]:
+    """
+    table[color][piece_type][square] = piece value + piece-square value,
+    negated for black so that summing over all pieces gives white minus black
+    """
+    table = [[[0] * 64 for _ in range(7)] for _ in range(2)]
+    for piece_type in chess.PIECE_TYPES:
+        for square in chess.SQUARES:
+            # the tables are written from white's point of view with a8 first
+            table[chess.WHITE][piece_type][square] = pesto[piece_type][square ^ 56] + values[piece_type]
+            table[chess.BLACK][piece_type][square] = -(pesto[piece_type][square] + values[piece_type])
+    return table
+
+
+# combined tables with the piece values and colour mirroring folded in,
+# indexed [color][piece_type][square]
+MG_TABLE = _signed_table(MG_PESTO, MG_PIECE_VALUES)
+EG_TABLE = _signed_table(EG_PESTO, EG_PIECE_VALUES)
+# phase values indexed by piece type
+PHASE = [0] + [PIECE_PHASE_VALUES[piece_type] for piece_type in chess.PIECE_TYPES]
+
+
 def get_phase(board: chess.Board):
     """
     DEPRECATED
@@ -207,22 +230,38 @@ def get_phase(board: chess.Board):
 
 
 def evaluate(board: chess.Board, move: chess.Move|None = None):
+    """
+    Evaluates the position from white's point of view.
+    Mates are scored as +-inf, stalemates and insufficient material as 0.
+
+    :param board: position to evaluate
+    :param move: if given, the position after this move is evaluated (the board is left unchanged)
+    """
     if move: board.push(move)
 
     # we will only check mates, stalemates and insufficient material
     # as the other ones are artifially added to make long human games shorter ergo less boring
-    if board.is_checkmate():
-        if board.outcome().winner == chess.WHITE:
-            if move: board.pop()
-            return inf
+    # Looking for one legal move is enough to tell both mates and stalemates
+    if not any(board.generate_legal_moves()):
+        if board.is_check():
+            score = -inf if board.turn == chess.WHITE else inf
         else:
-            if move:board.pop()
-            return -inf
-            
-    if board.is_stalemate() or board.is_insufficient_material():
-        if move: board.pop()
-        return 0
-    
+            score = 0
+    elif board.is_insufficient_material():
+        score = 0
+    else:
+        score = static_evaluate(board)
+
+    # The board is a pointer so you need to set it back if move was given
+    if move: board.pop()
+    return score
+
+
+def static_evaluate(board: chess.Board):
+    """
+    Tapered PeSTO evaluation from white's point of view without checking
+    whether the game has ended. Used by the search, which detects that itself.
+    """
     phase = 0
     mg = {
         chess.WHITE: 0,
@@ -259,10 +298,57 @@ def evaluate(board: chess.Board, move: chess.Move|None = None):
     mg_score = mg[chess.WHITE] - mg[chess.BLACK]
     eg_score = eg[chess.WHITE] - eg[chess.BLACK]
 
-    # The board is a pointer so you need to set it back if move was given
-    if move: board.pop()
     return mg_score*phase + eg_score*(1-phase)
 
 
+def fast_evaluate(board: chess.Board, move: chess.Move|None = None):
+    """
+    Same as evaluate(), with the same results, but the position is evaluated
+    by fast_static_evaluate().
+    """
+    if move: board.push(move)
+
+    if not any(board.generate_legal_moves()):
+        if board.is_check():
+            score = -inf if board.turn == chess.WHITE else inf
+        else:
+            score = 0
+    elif board.is_insufficient_material():
+        score = 0
+    else:
+        score = fast_static_evaluate(board)
 
-    
+    if move: board.pop()
+    return score
+
+
+def fast_static_evaluate(board: chess.Board):
+    """
+    Same as static_evaluate(), but it only visits the occupied squares,
+    read from the bitboards, and looks each piece up in the combined tables.
+    """
+    mg = eg = phase = 0
+    for color in chess.COLORS:
+        occupied = board.occupied_co[color]
+        mg_table = MG_TABLE[color]
+        eg_table = EG_TABLE[color]
+        for piece_type, pieces in ((chess.PAWN, board.pawns),
+                                   (chess.KNIGHT, board.knights),
+                                   (chess.BISHOP, board.bishops),
+                                   (chess.ROOK, board.rooks),
+                                   (chess.QUEEN, board.queens),
+                                   (chess.KING, board.kings)):
+            mask = pieces & occupied
+            if not mask:
+                continue
+            phase += PHASE[piece_type] * mask.bit_count()
+            mg_row = mg_table[piece_type]
+            eg_row = eg_table[piece_type]
+            while mask:
+                square = (mask & -mask).bit_length() - 1
+                mg += mg_row[square]
+                eg += eg_row[square]
+                mask &= mask - 1
+
+    phase /= STARTING_PHASE
+    return mg*phase + eg*(1-phase)
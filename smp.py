@@ -0,0 +1,326 @@
+"""
+Parallel search: Lazy SMP and root splitting.
+
+Lazy SMP (shared memory parallel search):
+
+Helper processes search the same root as the main search, each with its own
+move ordering tables, half of them one ply deeper and each with the root moves
+in a different order. They only fill the shared transposition table, which the
+main search then finds its cutoffs and moves in, and report their node counts
+through a shared array.
+The table lives in multiprocessing shared memory and is accessed without locks
+(see transposition.py), so the helpers can simply be terminated when the main
+search is done.
+
+Root splitting (used for fixed-depth searches): the first root move is searched
+by the main process to get a good alpha, the remaining root moves are then
+searched by a process pool against that alpha. The workers share the same table.
+The pool is kept for all the iterations of a search and terminated when the
+search is stopped, like the helpers.
+
+A LazySMP can be kept for the searches of a whole game (the UCI worker does):
+the helpers and the pool are stopped after every search, the shared table stays
+and its entries age like those of a single-process table.
+"""
+
+import chess
+import os
+import signal
+import sys
+
+from math import inf, nextafter
+from multiprocessing import Pool, Process, RawArray, TimeoutError, shared_memory
+from typing import Callable, List, Tuple
+
+from minimax import MAX_DEPTH, SearchFeatures, minimax
+from ordering import MoveOrderer
+from stats import SearchStats
+from tablebase import Tablebase
+from timeman import TimeManager
+from transposition import TranspositionTable, table_bytes
+from zobrist import zobrist_hash
+
+# seconds between two polls of the timer while waiting for the root split workers
+ROOT_SPLIT_POLL = 0.005
+
+
+class LazySMP:
+    """
+    Shared transposition table with helper search processes.
+    Use as a context manager, the helpers and the shared memory
+    are cleaned up on exit, or keep it between searches and close() it.
+
+    :param threads: total number of search processes, the main one included
+    :param hash_mb: size of the shared transposition table in MB
+    """
+
+    def __init__(self, threads: int, hash_mb: int):
+        self.threads = threads
+        self.hash_mb = hash_mb
+        self.shm = shared_memory.SharedMemory(create=True, size=table_bytes(hash_mb))
+        self.tt = TranspositionTable(hash_mb, self.shm.buf)
+        self.helpers: List[Process] = []
+        self.pool = None
+        # nodes searched by each helper (index 0 is the main process), see NodeCounter
+        self.node_counts = RawArray("Q", threads)
+
+    def attach_args(self) -> Tuple[str, int, int]:
+        """Arguments other processes need to attach to the shared table with attach_table()"""
+        return self.shm.name, self.hash_mb, self.tt.age
+
+    def start(self,
+              board: chess.Board,
+              searchmoves: List[chess.Move],
+              eval_function: Callable,
+              features: SearchFeatures|None = None,
+              history: List[int]|None = None,
+              syzygy_path: str = ""
+             ):
+        """
+        Starts threads - 1 helpers searching the given position.
+
+        :param history: keys of the positions of the game before the root, see minimax()
+        :param syzygy_path: directory of the Syzygy tables the helpers open for themselves, empty for none
+        """
+        self.node_counts[:] = [0] * self.threads
+        for helper_id in range(1, self.threads):
+            helper = Process(
+                target=helper_search,
+                args=(board, searchmoves, eval_function, features, history, syzygy_path,
+                      helper_id, self.node_counts, *self.attach_args()),
+                daemon=True,
+            )
+            helper.start()
+            self.helpers.append(helper)
+
+    def helper_nodes(self) -> int:
+        """Nodes the helpers of the running (or last) search have reported so far"""
+        return sum(self.node_counts)
+
+    def root_pool(self, syzygy_path: str = ""):
+        """
+        Process pool of the root split, started on first use and attached to the shared table.
+
+        :param syzygy_path: directory of the Syzygy tables the workers open, empty for none
+        """
+        if self.pool is None:
+            self.pool = Pool(self.threads, init_root_worker, (*self.attach_args(), syzygy_path))
+        return self.pool
+
+    def stop(self):
+        """Terminates the helpers and the root split workers, they hold no locks so this is safe at any time"""
+        for helper in self.helpers:
+            helper.terminate()
+        for helper in self.helpers:
+            helper.join()
+        self.helpers = []
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def close(self):
+        self.stop()
+        self.tt.release()
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def attach_table(shm_name: str, hash_mb: int, age: int) -> Tuple[shared_memory.SharedMemory, TranspositionTable]:
+    """
+    Attaches a search process to the shared table.
+    The process stays quiet (only the main search talks to the GUI)
+    and is stopped by the default signal handlers.
+    """
+    sys.stdout = open(os.devnull, "w")
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    tt = TranspositionTable(hash_mb, shm.buf)
+    tt.age = age
+    return shm, tt
+
+
+def open_tablebase(syzygy_path: str) -> Tablebase|None:
+    """The Syzygy tables of a search process, None without a path or if they can't be opened"""
+    if not syzygy_path:
+        return None
+    try:
+        return Tablebase(syzygy_path)
+    except OSError:
+        return None
+
+
+class NodeCounter(TimeManager):
+    """
+    Timer of a helper, without limits: polled by the search every node like a TimeManager,
+    it publishes the node count of the helper every check_every nodes.
+
+    :param node_counts: shared array of the node counts of the helpers
+    :param index: slot of this helper in node_counts
+    :param stats: statistics of the helper's search
+    """
+
+    def __init__(self, node_counts, index: int, stats: SearchStats):
+        super().__init__()
+        self.node_counts = node_counts
+        self.index = index
+        self.stats = stats
+
+    def check(self):
+        self.nodes_to_check -= 1
+        if self.nodes_to_check > 0:
+            return
+        self.nodes_to_check = self.check_every
+        self.node_counts[self.index] = self.stats.nodes
+
+
+def helper_search(board: chess.Board,
+                  searchmoves: List[chess.Move],
+                  eval_function: Callable,
+                  features: SearchFeatures|None,
+                  history: List[int]|None,
+                  syzygy_path: str,
+                  helper_id: int,
+                  node_counts,
+                  shm_name: str,
+                  hash_mb: int,
+                  age: int
+                 ):
+    """
+    Iterative deepening of one helper process, runs until terminated.
+    Odd helpers are one ply ahead of the even ones and the root moves
+    are rotated by the helper id, so the helpers don't all search the same subtrees.
+    The helpers see the repetitions and the tablebase results the main search sees,
+    otherwise their entries would disagree with the main search's.
+    The nodes searched are published to node_counts[helper_id].
+    """
+    shm, tt = attach_table(shm_name, hash_mb, age)
+    orderer = MoveOrderer()
+    tablebase = open_tablebase(syzygy_path)
+    stats = SearchStats()
+    counter = NodeCounter(node_counts, helper_id, stats)
+
+    root_moves = searchmoves or list(board.legal_moves)
+    if not root_moves:
+        return
+    for depth in range(1 + helper_id % 2, MAX_DEPTH):
+        shift = helper_id % len(root_moves)
+        root_moves = root_moves[shift:] + root_moves[:shift]
+        moves = minimax(board, depth, -inf, inf, root_moves, eval_function, False, True,
+                        tt, orderer, features=features, timer=counter, stats=stats,
+                        history=history, tablebase=tablebase)
+        node_counts[helper_id] = stats.nodes
+        root_moves = [chess.Move.from_uci(move) for move, _ in moves]
+
+
+# state of a root split worker process, set up by init_root_worker()
+_worker_shm: shared_memory.SharedMemory|None = None
+_worker_tt: TranspositionTable|None = None
+_worker_orderer: MoveOrderer|None = None
+_worker_tablebase: Tablebase|None = None
+
+
+def init_root_worker(shm_name: str, hash_mb: int, age: int, syzygy_path: str):
+    """Initializer of the root split process pool"""
+    global _worker_shm, _worker_tt, _worker_orderer, _worker_tablebase
+    _worker_shm, _worker_tt = attach_table(shm_name, hash_mb, age)
+    _worker_orderer = MoveOrderer()
+    _worker_tablebase = open_tablebase(syzygy_path)
+
+
+def search_root_move(board: chess.Board,
+                     move: chess.Move,
+                     depth: int,
+                     alpha: float,
+                     eval_function: Callable,
+                     features: SearchFeatures|None,
+                     history: List[int]|None
+                    ) -> Tuple[str, float, List[chess.Move], SearchStats]:
+    """
+    Searches one root move in a worker, with a null window at alpha first
+    and with the full window above alpha if it fails high.
+
+    :param history: keys of the positions of the game before the root, see minimax()
+    :returns: uci of the move, its score, the principal variation starting with it
+              and the statistics of the search
+    """
+    if history is not None:
+        # the root is part of the path of its children, as in minimax()
+        history = history + [zobrist_hash(board)]
+    board.push(move)
+    pv: List[chess.Move] = []
+    stats = SearchStats()
+    score = -minimax(board, depth - 1, -nextafter(alpha, inf), -alpha, [], eval_function,
+                     tt=_worker_tt, orderer=_worker_orderer, ply=1, pv=pv, features=features, stats=stats,
+                     history=history, tablebase=_worker_tablebase)
+    if score > alpha:
+        pv.clear()
+        score = -minimax(board, depth - 1, -inf, -alpha, [], eval_function,
+                         tt=_worker_tt, orderer=_worker_orderer, ply=1, pv=pv, features=features, stats=stats,
+                         history=history, tablebase=_worker_tablebase)
+    return move.uci(), score, [move] + pv, stats
+
+
+def _search_root_move_task(args: tuple) -> Tuple[str, float, List[chess.Move], SearchStats]:
+    return search_root_move(*args)
+
+
+def root_split_search(board: chess.Board,
+                      depth: int,
+                      searchmoves: List[chess.Move],
+                      eval_function: Callable,
+                      features: SearchFeatures|None,
+                      smp: LazySMP,
+                      orderer: MoveOrderer,
+                      stats: SearchStats|None = None,
+                      timer: TimeManager|None = None,
+                      history: List[int]|None = None,
+                      tablebase: Tablebase|None = None
+                     ) -> Tuple[List[Tuple[str, float]], List[chess.Move]]:
+    """
+    Fixed-depth search with the root moves split between smp.threads processes.
+    The statistics of the workers are merged into stats.
+
+    :param timer: polled by the main process while the workers search,
+                  the workers are terminated when it stops the search (smp.stop())
+    :param history: keys of the positions of the game before the root, see minimax()
+    :param tablebase: Syzygy tables of the main process, the workers open the same directory
+    :raises SearchAborted: if the timer stops the search
+    :returns: root moves ordered from best to worst, like minimax(is_root=True), and the principal variation
+    """
+    root_moves = searchmoves or list(orderer.pick(board, 0))
+    pv: List[chess.Move] = []
+    moves = minimax(board, depth, -inf, inf, root_moves[:1], eval_function, False, True,
+                    smp.tt, orderer, pv=pv, features=features, timer=timer, stats=stats,
+                    history=history, tablebase=tablebase)
+    if len(root_moves) == 1:
+        return moves, pv
+    alpha = moves[0][1]
+
+    tasks = [(board, move, depth, alpha, eval_function, features, history) for move in root_moves[1:]]
+    pool = smp.root_pool(tablebase.directory if tablebase is not None else "")
+    results = pool.imap_unordered(_search_root_move_task, tasks)
+    for _ in tasks:
+        while True:
+            try:
+                move, score, move_pv, worker_stats = results.next(ROOT_SPLIT_POLL)
+                break
+            except TimeoutError:
+                if timer is not None:
+                    timer.poll()
+        print("info root currmove", move)
+        if stats is not None:
+            stats.merge(worker_stats)
+        moves.append((move, score))
+        if score > alpha:
+            alpha, pv = score, move_pv
+
+    return sorted(moves, key=lambda x: x[1], reverse=True), pv
@@ -0,0 +1,81 @@
+"""
+Search statistics: counters filled in by the search, reported in the UCI
+info lines and readable by benchmarks.
+"""
+
+from dataclasses import asdict, dataclass, fields
+from time import perf_counter
+
+
+@dataclass
+class SearchStats:
+    """
+    Counters of one search.
+
+    :param nodes: positions visited by minimax (null-move searches included)
+    :param evals: leaf positions passed to the evaluation function
+    :param cutoffs: beta cutoffs
+    :param first_move_cutoffs: beta cutoffs by the first move searched at the node
+    :param tt_probes: transposition table lookups
+    :param tt_hits: lookups that found the position
+    :param tb_hits: positions scored by the endgame tablebases
+    :param seldepth: deepest ply reached
+    :param depth: depth of the last completed iteration
+    :param helper_nodes: positions visited by the Lazy SMP helper processes, as they last reported them
+    """
+    nodes: int = 0
+    evals: int = 0
+    cutoffs: int = 0
+    first_move_cutoffs: int = 0
+    tt_probes: int = 0
+    tt_hits: int = 0
+    tb_hits: int = 0
+    seldepth: int = 0
+    depth: int = 0
+    helper_nodes: int = 0
+
+    def __post_init__(self):
+        self.start_time = perf_counter()
+
+    def reset(self):
+        """Zeroes the counters and restarts the clock"""
+        for field in fields(self):
+            setattr(self, field.name, 0)
+        self.start_time = perf_counter()
+
+    def merge(self, other: "SearchStats"):
+        """Adds the counters of another search (e.g. a parallel worker) to these"""
+        for field in fields(self):
+            if field.name in ("seldepth", "depth"):
+                setattr(self, field.name, max(getattr(self, field.name), getattr(other, field.name)))
+            else:
+                setattr(self, field.name, getattr(self, field.name) + getattr(other, field.name))
+
+    def elapsed(self) -> float:
+        """Time since the start (or reset) in ms"""
+        return (perf_counter() - self.start_time) * 1000
+
+    def total_nodes(self) -> int:
+        """Nodes of all the search processes"""
+        return self.nodes + self.helper_nodes
+
+    def nps(self) -> int:
+        """Nodes per second of all the search processes"""
+        return int(self.total_nodes() * 1000 / max(self.elapsed(), 1))
+
+    def first_move_cutoff_rate(self) -> float:
+        """Share of the cutoffs caused by the first move, a measure of move ordering quality"""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def tt_hit_rate(self) -> float:
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def as_dict(self) -> dict:
+        """All counters and the derived rates, e.g. for JSON output"""
+        return {
+            **asdict(self),
+            "time": self.elapsed(),
+            "nps": self.nps(),
+            "first_move_cutoff_rate": self.first_move_cutoff_rate(),
+            "tt_hit_rate": self.tt_hit_rate(),
+        }
@@ -0,0 +1,142 @@
+"""
+Syzygy endgame tablebases.
+
+Positions with few enough pieces are looked up instead of searched:
+the search probes the WDL tables (win/draw/loss) and cuts the subtree off
+with the result, and a root position in the tables picks its move from the
+DTZ tables (distance to the next capture or pawn move), which converts a won
+endgame without any search. The probes go through chess.syzygy, with an LRU
+cache by Zobrist key in front of the WDL probes.
+
+The WDL tables assume the 50-move counter was just reset, so the search only
+probes them right after a capture or pawn move. At the root the DTZ of each
+move and the halfmove clock tell whether a win comes before the 50-move rule,
+otherwise it counts as cursed (and the loss as blessed).
+"""
+
+import chess
+import chess.syzygy
+import os
+
+from collections import OrderedDict
+from typing import List, Tuple
+
+from zobrist import zobrist_hash
+
+# score of a tablebase win, far above any evaluation and below the mate scores
+TB_WIN_SCORE = 20_000
+# score of a cursed win, a draw by the 50-move rule unless the opponent errs
+CURSED_WIN_SCORE = 1
+# plies without a capture or pawn move that end the game in a draw
+FIFTY_MOVE_PLIES = 100
+DEFAULT_TB_CACHE_SIZE = 1 << 16  # entries
+
+
+def wdl_score(wdl: int, ply: int) -> float:
+    """
+    Search score of a WDL result for the side to move.
+    Cursed wins and blessed losses (decided only beyond the 50-move rule) are draws
+    that score a little above and below the real ones, so the search still prefers
+    the side that can win if the opponent errs. Shorter wins score higher like mates.
+    """
+    if wdl == 2:
+        return TB_WIN_SCORE - ply
+    if wdl == -2:
+        return -TB_WIN_SCORE + ply
+    return wdl * CURSED_WIN_SCORE
+
+
+class Tablebase:
+    """
+    Syzygy tables of a directory.
+
+    :param directory: directory with the .rtbw and .rtbz files, several can be separated by os.pathsep
+    :param cache_size: number of WDL results kept in the LRU cache
+    """
+
+    def __init__(self, directory: str, cache_size: int = DEFAULT_TB_CACHE_SIZE):
+        self.directory = directory
+        self.tables = chess.syzygy.Tablebase()
+        for path in filter(None, directory.split(os.pathsep)):
+            self.tables.add_directory(path)
+        # table names are like KRvK, one letter per piece
+        self.max_pieces = max((len(name) - 1 for name in self.tables.wdl), default=0)
+        self.cache_size = cache_size
+        self.cache: OrderedDict[int, int|None] = OrderedDict()
+        self.probes = 0
+        self.cache_hits = 0
+        self.hits = 0
+
+    def can_probe(self, board: chess.Board) -> bool:
+        """Whether the position may be in the tables, the tables have no castling rights"""
+        return board.occupied.bit_count() <= self.max_pieces and not board.castling_rights
+
+    def probe_wdl(self, board: chess.Board) -> int|None:
+        """
+        WDL result for the side to move: 2 win, 1 cursed win, 0 draw, -1 blessed loss, -2 loss,
+        None if the position isn't in the tables.
+        """
+        self.probes += 1
+        key = zobrist_hash(board)
+        if key in self.cache:
+            self.cache_hits += 1
+            self.cache.move_to_end(key)
+            wdl = self.cache[key]
+        else:
+            wdl = self.tables.get_wdl(board) if self.can_probe(board) else None
+            self.cache[key] = wdl
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        self.hits += wdl is not None
+        return wdl
+
+    def root_moves(self, board: chess.Board, searchmoves: List[chess.Move]) -> List[Tuple[chess.Move, int, int]]|None:
+        """
+        Ranks the root moves by the tables, best first: wins by the fewest plies to
+        a capture or pawn move (which resets the 50-move counter), losses by the most.
+        A win or loss that needs more plies than the halfmove clock of the board leaves
+        before the 50-move rule becomes a cursed win or a blessed loss.
+
+        :returns: (move, WDL, DTZ) for every move, both for the side to move at the root,
+                  None if any of the positions isn't in the tables
+        """
+        if not self.can_probe(board):
+            return None
+        ranked = []
+        for move in searchmoves or list(board.legal_moves):
+            zeroing = board.is_zeroing(move)
+            board.push(move)
+            try:
+                wdl = self.tables.get_wdl(board)
+                dtz = self.tables.get_dtz(board)
+            finally:
+                board.pop()
+            if wdl is None or dtz is None:
+                return None
+            self.hits += 1
+            wdl, dtz = -wdl, -dtz
+            if zeroing:
+                # the capture or pawn move of a win is this move
+                if wdl > 0:
+                    dtz = 1
+            elif abs(wdl) == 2 and dtz and board.halfmove_clock + abs(dtz) + 1 > FIFTY_MOVE_PLIES:
+                # this move and the DTZ plies after it don't fit into the 50 moves
+                # (a zeroing move on the 100th ply still comes in time),
+                # a mate (DTZ 0) ends the game before the rule does
+                wdl //= 2
+            ranked.append((move, wdl, dtz))
+        # DTZ is positive in wins and negative in losses, smaller is better in both
+        ranked.sort(key=lambda item: (-item[1], item[2]))
+        return ranked
+
+    def hit_rate(self) -> float:
+        return self.cache_hits / self.probes if self.probes else 0.0
+
+    def clear(self):
+        self.cache.clear()
+        self.probes = 0
+        self.cache_hits = 0
+        self.hits = 0
+
+    def close(self):
+        self.tables.close()
@@ -0,0 +1,50 @@
+import chess
+import copy
+import signal
+
+from bench import BENCH_FENS, bench, compare, time_evaluation
+from pawns import pawn_evaluate
+from timeman import TimeManager
+
+
+def test_bench_is_deterministic():
+    fens = BENCH_FENS[:2] + BENCH_FENS[-2:]
+    first = bench(3, fens, hash_mb=1, verbose=False)
+    second = bench(3, fens, hash_mb=1, verbose=False)
+    assert [position["nodes"] for position in first["positions"]] == [position["nodes"] for position in second["positions"]]
+    assert first["total"]["nodes"] == sum(position["nodes"] for position in first["positions"])
+    # the mated position has no move
+    assert first["positions"][1]["bestmove"] == "0000"
+
+    lines, unchanged = compare(second, first)
+    assert unchanged
+    assert lines[-3].endswith("(unchanged)")
+
+    changed = copy.deepcopy(second)
+    changed["positions"][0]["nodes"] += 1
+    changed["total"]["nodes"] += 1
+    changed["total"]["nps"] = first["total"]["nps"] * 2
+    lines, unchanged = compare(changed, first)
+    assert not unchanged
+    assert lines[0].startswith("search changed")
+    assert "faster" in lines[-2]
+
+
+def test_stopped_bench_ends_early():
+    timer = TimeManager()
+    timer.stop()
+    results = bench(3, BENCH_FENS[:3], hash_mb=1, verbose=False, timer=timer)
+    assert len(results["positions"]) == 1
+
+
+def test_evaluation_is_timed_per_node():
+    board = chess.Board()
+    evals, eval_time = time_evaluation(board, pawn_evaluate)
+    # the root, its 20 children and their 400 children
+    assert evals == 421 and eval_time > 0
+    assert board.fen() == chess.STARTING_FEN
+
+
+def test_import_leaves_the_signal_handlers():
+    # bench imports engine, which must not take over ctrl+c
+    assert signal.getsignal(signal.SIGINT) is signal.default_int_handler
@@ -0,0 +1,49 @@
+import chess
+import chess.polyglot
+import struct
+
+from collections import Counter
+
+from book import BEST, Book
+
+
+def write_book(path, positions):
+    """Writes a Polyglot book with the (board, uci move, weight) entries"""
+    entries = []
+    for board, uci, weight in positions:
+        move = chess.Move.from_uci(uci)
+        raw_move = move.to_square | move.from_square << 6
+        entries.append((chess.polyglot.zobrist_hash(board), raw_move, weight, 0))
+    with open(path, "wb") as f:
+        for entry in sorted(entries):
+            f.write(struct.pack(">QHHI", *entry))
+
+
+def test_probe(tmp_path):
+    start = chess.Board()
+    after_e4 = chess.Board()
+    after_e4.push_uci("e2e4")
+    castling = chess.Board("r3k2r/pppppppp/8/8/8/8/PPPPPPPP/R3K2R w KQkq - 0 1")
+    path = tmp_path / "book.bin"
+    # polyglot books encode castling as the king taking its rook
+    write_book(path, [(start, "e2e4", 3), (start, "d2d4", 1), (after_e4, "c7c5", 1), (castling, "e1h1", 1)])
+
+    book = Book(str(path), BEST)
+    assert len(book) == 4
+    assert book.probe(start) == chess.Move.from_uci("e2e4")
+    assert book.probe(after_e4) == chess.Move.from_uci("c7c5")
+    assert book.probe(castling) == chess.Move.from_uci("e1g1")
+    assert book.probe(chess.Board("4k3/8/8/8/8/8/8/4K3 w - - 0 1")) is None
+
+    # weighted selection follows the weights
+    book.selection = "weighted"
+    book.random.seed(0)
+    picks = Counter(book.probe(start).uci() for _ in range(400))
+    assert set(picks) == {"e2e4", "d2d4"}
+    assert picks["e2e4"] > 2 * picks["d2d4"]
+
+    # out of book after the maximum depth
+    book.max_depth = 1
+    late = chess.Board(chess.STARTING_FEN.replace(" 1", " 2"))
+    assert book.probe(late) is None
+    book.close()
@@ -25,6 +25,7 @@ parent = os.path.dirname(current)
 sys.path.append(parent)
 
 from engine import go
+from minimax import SearchFeatures
 from psqt import evaluate
 
 
@@ -41,7 +42,8 @@ def self_play(mode: Literal["d", "t"],
               mode_param: int,
               fen: str=chess.STARTING_FEN, 
               eval_function: Callable[[chess.Board, Optional[chess.Move]], float]=evaluate, 
-              debug=False
+              debug=False,
+              features: Optional[SearchFeatures]=None
              ) -> chess.pgn.Game:
     """Functionality is clear from the code - create pgn"""
     board = chess.Board(fen)
@@ -62,9 +64,9 @@ def self_play(mode: Literal["d", "t"],
         try:
             start_local = time.time()
             if node is None:
-                node = game.add_variation(go(board, mode, mode_param, [], eval_function, debug))
+                node = game.add_variation(go(board, mode, mode_param, [], eval_function, debug, features=features))
             else:
-                node = node.add_variation(go(board, mode, mode_param, [], eval_function, debug))
+                node = node.add_variation(go(board, mode, mode_param, [], eval_function, debug, features=features))
             board.push(node.move)
             movetime.append(time.time() - start_local)
             print("Time taken:", time.time() - start_local)
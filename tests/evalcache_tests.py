@@ -0,0 +1,72 @@
+import asyncio
+import chess
+import chess.polyglot
+import random
+
+import engine
+import interface
+
+from evalcache import EvalCache
+from psqt import evaluate
+from zobrist import child_hash, zobrist_hash
+
+
+def test_child_hash_matches_polyglot():
+    """Keys computed without pushing must be the polyglot keys of the children"""
+    random.seed(0)
+    fens = [chess.STARTING_FEN,
+            "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+            "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+            "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1"]
+    for fen in fens:
+        board = chess.Board(fen)
+        for _ in range(100):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            key = zobrist_hash(board)
+            assert key == chess.polyglot.zobrist_hash(board), board.fen()
+            for move in moves:
+                child = child_hash(board, key, move)
+                board.push(move)
+                assert child == chess.polyglot.zobrist_hash(board), board.fen()
+                board.pop()
+            board.push(random.choice(moves))
+
+
+def test_eval_cache():
+    board = chess.Board("r1bqkb1r/1ppp1ppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQ1RK1 w kq - 0 1")
+    moves = list(board.legal_moves)
+    cache = EvalCache(evaluate, 1000)
+    assert cache.size == 512
+
+    assert [cache(board, move) for move in moves] == [evaluate(board, move) for move in moves]
+    assert cache.hits == 0 and cache.misses == len(moves)
+    assert [cache(board, move) for move in moves] == [evaluate(board, move) for move in moves]
+    assert cache.hits == len(moves)
+    # the child reached by a push has the same key as the one scored through (board, move)
+    board.push(moves[0])
+    assert cache(board) == evaluate(board)
+    assert cache.hits == len(moves) + 1
+
+    # a cache with a single slot keeps only the last position
+    cache = EvalCache(evaluate, 1)
+    cache(board)
+    cache(board, next(iter(board.legal_moves)))
+    cache(board)
+    assert cache.hits == 0 and cache.misses == 3
+    cache.clear()
+    assert cache.hit_rate() == 0.0
+
+
+def test_search_with_the_cache():
+    board = chess.Board("r1bqkb1r/1ppp1ppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQ1RK1 w kq - 0 1")
+    moves = [engine.go(board, "d", 3, [], evaluate, False, 1, eval_cache_size=size) for size in (0, 1 << 12)]
+    assert moves[0] == moves[1]
+
+
+def test_eval_cache_option():
+    asyncio.run(interface.setoption(["name", "EvalCache", "value", "4096"], asyncio.Queue()))
+    assert interface.options["EvalCache"] == 4096
+    asyncio.run(interface.setoption(["name", "EvalCache", "value", "-1"], asyncio.Queue()))
+    assert interface.options["EvalCache"] == 0
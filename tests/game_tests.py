@@ -0,0 +1,80 @@
+import chess
+import pytest
+
+from math import inf
+
+from game import Game
+from incremental import IncrementalBoard
+from minimax import is_repetition, minimax
+from psqt import static_evaluate
+from zobrist import game_history, zobrist_hash
+
+
+def test_set_position_keeps_common_moves():
+    game = Game(IncrementalBoard)
+    board = game.set_position(chess.STARTING_FEN, ["e2e4", "e7e5"])
+    assert game.set_position(chess.STARTING_FEN, ["e2e4", "e7e5", "g1f3", "b8c6"]) is board
+    assert board.fen() == chess.Board("r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3").fen()
+
+    # a different last move only takes back that move
+    game.set_position(chess.STARTING_FEN, ["e2e4", "e7e5", "g1f3", "g8f6"])
+    expected = chess.Board()
+    for move in ["e2e4", "e7e5", "g1f3", "g8f6"]:
+        expected.push_uci(move)
+    assert board.fen() == expected.fen()
+    assert board.move_stack == expected.move_stack
+    rebuilt = IncrementalBoard(expected.fen())
+    assert (board.mg, board.eg, board.phase) == (rebuilt.mg, rebuilt.eg, rebuilt.phase)
+
+    # a new starting position rebuilds the board
+    fen = "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"
+    board = game.set_position(fen, ["e2e4"])
+    assert board.fen() == "4k3/8/8/8/4P3/8/8/4K3 b - - 0 1"
+    assert len(board.move_stack) == 1
+
+
+
+def test_bad_move_leaves_the_position():
+    game = Game(IncrementalBoard)
+    board = game.set_position(chess.STARTING_FEN, ["e2e4", "e7e5"])
+    fen = board.fen()
+    with pytest.raises(ValueError):
+        game.set_position(chess.STARTING_FEN, ["e2e4", "c7c5", "g1f3", "x9"])
+    assert board.fen() == fen
+    assert game.moves == ["e2e4", "e7e5"]
+    with pytest.raises(ValueError):
+        game.set_position("not a fen", ["e2e4"])
+    assert game.fen == chess.STARTING_FEN
+    # the next position is still set incrementally on the right board
+    game.set_position(chess.STARTING_FEN, ["e2e4", "e7e5", "g1f3"])
+    assert board.fen() == chess.Board("rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2").fen()
+
+def test_repetition_history():
+    board = chess.Board()
+    keys = [zobrist_hash(board)]
+    for move in ["g1f3", "g8f6", "f3g1"]:
+        board.push_uci(move)
+        keys.append(zobrist_hash(board))
+    assert game_history(board) == keys[:-1]
+
+    history = keys[:]
+    board.push_uci("f6g8")
+    assert is_repetition(history, zobrist_hash(board), board.halfmove_clock)
+    # the positions before the last pawn move can't come back
+    board.push_uci("e2e4")
+    assert not is_repetition(history, zobrist_hash(board), board.halfmove_clock)
+    assert game_history(board) == []
+
+
+def test_search_scores_repetitions_as_draws():
+    # black is a queen down, going back to b8 repeats the position after the
+    # first moves and is a draw only when the search knows the game
+    board = chess.Board("rn2k3/8/8/8/8/8/8/QN2K3 w - - 0 1")
+    for move in ["b1c3", "b8c6", "c3b1", "c6b8", "b1c3", "b8c6", "c3b1"]:
+        board.push_uci(move)
+    repeat = [chess.Move.from_uci("c6b8")]
+
+    moves = minimax(board, 2, -inf, inf, repeat, static_evaluate, is_root=True, history=game_history(board))
+    assert moves == [("c6b8", 0)]
+    moves = minimax(board, 2, -inf, inf, repeat, static_evaluate, is_root=True)
+    assert moves[0][1] < -500
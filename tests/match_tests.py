@@ -0,0 +1,47 @@
+import chess
+import chess.pgn
+
+from match import EngineConfig, elo_estimate, read_openings, run_match, sprt
+
+
+def test_engine_config():
+    config = EngineConfig.parse("name=old,movetime=100,hash=8,lmr=0,null_move_reduction=3")
+    assert (config.name, config.movetime, config.hash_mb) == ("old", 100, 8)
+    assert not config.features.lmr
+    assert config.features.null_move_reduction == 3
+    assert EngineConfig.parse("depth=3").depth == 3
+
+
+def test_read_openings():
+    lines = ["# comment", "",
+             chess.STARTING_FEN,
+             'rnbqkbnr/pppppppp/8/8/3P4/8/PPP1PPPP/RNBQKBNR b KQkq - id "d4";']
+    openings = read_openings(lines)
+    assert openings[0] == chess.STARTING_FEN
+    assert chess.Board(openings[1]).piece_at(chess.D4) == chess.Piece(chess.PAWN, chess.WHITE)
+
+
+def test_elo_and_sprt():
+    elo, margin = elo_estimate(30, 40, 30)
+    assert elo == 0 and 0 < margin < 100
+    elo, _ = elo_estimate(60, 20, 20)
+    # a 70% score
+    assert 145 < elo < 150
+
+    assert sprt(0, 0, 0)[3] == ""
+    assert sprt(400, 200, 200)[3] == "H1"
+    assert sprt(200, 200, 400)[3] == "H0"
+    assert sprt(10, 10, 10)[3] == ""
+
+
+def test_run_match(tmp_path):
+    pgn_path = tmp_path / "match.pgn"
+    first = EngineConfig.parse("name=first,depth=1")
+    second = EngineConfig.parse("name=second,depth=1")
+    wins, draws, losses = run_match(first, second, [chess.STARTING_FEN], str(pgn_path), concurrency=2, max_plies=6)
+    # adjudicated after 6 plies
+    assert (wins, draws, losses) == (0, 2, 0)
+    with open(pgn_path) as pgn:
+        games = [chess.pgn.read_game(pgn), chess.pgn.read_game(pgn)]
+    assert {game.headers["White"] for game in games} == {"first", "second"}
+    assert all(len(list(game.mainline_moves())) == 6 for game in games)
@@ -0,0 +1,121 @@
+import chess
+
+from math import inf
+
+from engine import aspiration_search
+from minimax import MATE_SCORE, SearchFeatures, minimax
+from ordering import MoveOrderer
+from psqt import static_evaluate
+from transposition import TranspositionTable
+
+FENS = [
+    chess.STARTING_FEN,
+    "r1bqkb1r/1ppp1ppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQ1RK1 w kq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+]
+# PVS and aspiration windows change which nodes are searched, never the score,
+# unlike the reductions of null move and LMR
+NO_REDUCTIONS = SearchFeatures(null_move=False, lmr=False)
+
+
+def alpha_beta(board, depth, alpha, beta, ply=0):
+    """Plain full-window alpha-beta with the draw and mate rules of minimax()"""
+    if board.is_insufficient_material():
+        return 0
+    moves = list(board.legal_moves)
+    if not moves:
+        return -MATE_SCORE + ply if board.is_check() else 0
+    if depth == 0:
+        score = static_evaluate(board)
+        return score if board.turn == chess.WHITE else -score
+    best = -inf
+    for move in moves:
+        board.push(move)
+        score = -alpha_beta(board, depth - 1, -beta, -alpha, ply + 1)
+        board.pop()
+        best = max(best, score)
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            break
+    return best
+
+
+def test_pvs_with_aspiration_matches_alpha_beta():
+    for fen in FENS:
+        board = chess.Board(fen)
+        expected = alpha_beta(board, 3, -inf, inf)
+        # a previous score far off the real one makes the window fail and widen
+        for previous_score in (None, expected, expected + 300, expected - 300):
+            moves, pv = aspiration_search(board, 3, previous_score, [], static_evaluate, False,
+                                          None, MoveOrderer(), NO_REDUCTIONS)
+            assert moves[0][1] == expected, (fen, previous_score)
+            assert pv[0].uci() == moves[0][0]
+        assert board.fen() == fen
+
+
+def test_principal_variation_is_legal():
+    for fen in FENS:
+        board = chess.Board(fen)
+        tt, orderer = TranspositionTable(1), MoveOrderer()
+        previous_score = None
+        for depth in range(1, 5):
+            moves, pv = aspiration_search(board, depth, previous_score, [], static_evaluate, False, tt, orderer)
+            previous_score = moves[0][1]
+            assert pv and pv[0].uci() == moves[0][0]
+            line = board.copy()
+            for move in pv:
+                assert move in line.legal_moves, (fen, depth, pv)
+                line.push(move)
+
+
+class NullMoveRecorder(chess.Board):
+    """Remembers the positions the search passed in with a null move"""
+
+    def push(self, move):
+        if not move:
+            self.passes.append((self.is_check(), bool(self.occupied_co[self.turn] & ~(self.pawns | self.kings))))
+        super().push(move)
+
+
+def test_no_null_move_in_check_or_pawn_endings():
+    passes = []
+    # the white king is in check at the root
+    for fen in FENS[1:] + ["r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                           "8/8/8/2pK3p/1kP4P/8/6P1/8 w - - 0 1"]:
+        board = NullMoveRecorder(fen)
+        board.passes = []
+        minimax(board, 5, -inf, inf, [], static_evaluate, is_root=True, tt=TranspositionTable(1))
+        assert all(not in_check and has_pieces for in_check, has_pieces in board.passes), fen
+        passes += board.passes
+    # the middlegames do prune with null moves
+    assert passes
+
+
+def test_zugzwang():
+    # trebuchet: whoever moves the king loses the pawn, the spare tempo g3 wins it
+    board = chess.Board("8/8/8/2pK3p/1kP4P/8/6P1/8 w - - 0 1")
+    for null_move in (True, False):
+        moves = minimax(board, 4, -inf, inf, [], static_evaluate, is_root=True, tt=TranspositionTable(1),
+                        features=SearchFeatures(null_move=null_move))
+        assert moves[0][0] == "g2g3"
+    # Ra6 leaves black without a move that doesn't allow mate,
+    # but black has a bishop, so only switching null move off finds it
+    board = chess.Board("kbK5/pp6/1P6/8/8/8/8/R7 w - - 0 1")
+    moves = minimax(board, 4, -inf, inf, [], static_evaluate, is_root=True, tt=TranspositionTable(1),
+                    features=SearchFeatures(null_move=False))
+    assert moves[0] == ("a1a6", MATE_SCORE - 3)
+
+
+def test_lmr_finds_the_same_mates():
+    for fen, depth, features, mate_in in [
+        ("r1b1kb1r/pppp1ppp/5q2/4n3/3KP3/2N3PN/PPP4P/R1BQ1B1R b kq - 0 1", 5, SearchFeatures(), 5),
+        ("kbK5/pp6/1P6/8/8/8/8/R7 w - - 0 1", 4, SearchFeatures(null_move=False), 3),
+    ]:
+        board = chess.Board(fen)
+        for lmr in (True, False):
+            features.lmr = lmr
+            moves = minimax(board, depth, -inf, inf, [], static_evaluate, is_root=True, tt=TranspositionTable(1),
+                            features=features)
+            assert moves[0][1] == MATE_SCORE - mate_in, (fen, lmr)
@@ -0,0 +1,82 @@
+import chess
+
+from ordering import CAPTURE_SCORE, MoveOrderer
+
+FENS = [
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    # quiet promotions, a capture and castling
+    "4k3/1P6/8/3p4/4P3/8/8/4K2R w K - 0 1",
+]
+
+
+def test_pick_yields_every_move_once_in_stages():
+    for fen in FENS:
+        board = chess.Board(fen)
+        legal = list(board.legal_moves)
+        quiets = [move for move in legal if not board.is_capture(move) and not move.promotion]
+        orderer = MoveOrderer()
+        hash_move, killers = quiets[0], quiets[1:3]
+        orderer.killers[2] = list(killers)
+        for number, move in enumerate(quiets[3:]):
+            orderer.history[board.turn][move.from_square * 64 + move.to_square] = number * 10
+
+        picked = list(orderer.pick(board, 2, hash_move))
+        assert sorted(picked, key=chess.Move.uci) == sorted(legal, key=chess.Move.uci)
+        assert board.fen() == fen
+
+        assert picked[0] == hash_move
+        tactical = [move for move in picked if board.is_capture(move) or move.promotion]
+        assert picked[1:1 + len(tactical)] == tactical
+        scores = [orderer.score(board, move, 2) for move in tactical]
+        assert scores == sorted(scores, reverse=True)
+        assert all(score >= CAPTURE_SCORE for score in scores)
+
+        rest = picked[1 + len(tactical):]
+        assert rest[:2] == killers
+        history = [orderer.history[board.turn][move.from_square * 64 + move.to_square] for move in rest[2:]]
+        assert history == sorted(history, reverse=True)
+
+
+def test_captures_by_mvv_lva():
+    board = chess.Board("4k3/8/8/3q4/2P5/4N3/8/4K3 w - - 0 1")
+    picked = list(MoveOrderer().pick(board, 0))
+    # the pawn takes the queen before the knight does
+    assert picked[:2] == [chess.Move.from_uci("c4d5"), chess.Move.from_uci("e3d5")]
+
+
+def test_illegal_hash_move_and_killers_are_skipped():
+    board = chess.Board()
+    orderer = MoveOrderer()
+    orderer.killers[0] = [chess.Move.from_uci("e2e5"), chess.Move.from_uci("g1f3")]
+    picked = list(orderer.pick(board, 0, chess.Move.from_uci("e1e2")))
+    assert picked[0] == chess.Move.from_uci("g1f3")
+    assert len(picked) == len(set(picked)) == 20
+
+
+def test_update_records_killers_and_history():
+    board = chess.Board(FENS[0])
+    orderer = MoveOrderer()
+    quiets = [move for move in orderer.pick(board, 3) if orderer.is_quiet(board, move)]
+    tactical_count = board.legal_moves.count() - len(quiets)
+    # a deep cutoff elsewhere gives another quiet move the best history
+    best_history, killer = quiets[0], quiets[-1]
+    orderer.update(board, best_history, 10, 10)
+    orderer.update(board, killer, 4, 3)
+
+    # the killer comes right after the captures at its own ply, after the best history move at the others
+    assert list(orderer.pick(board, 3))[tactical_count:tactical_count + 2] == [killer, best_history]
+    for ply in (2, 4):
+        assert list(orderer.pick(board, ply))[tactical_count:tactical_count + 2] == [best_history, killer]
+
+    # deeper cutoffs count more in the history, which orders the remaining quiet moves
+    shallow, deep = quiets[-2], quiets[-3]
+    orderer.update(board, shallow, 2, 5)
+    orderer.update(board, deep, 6, 6)
+    rest = list(orderer.pick(board, 0))[tactical_count:]
+    assert rest[:4] == [best_history, deep, killer, shallow]
+
+    # captures are neither killers nor history moves
+    capture = next(move for move in board.legal_moves if board.is_capture(move))
+    orderer.update(board, capture, 8, 7)
+    assert capture not in orderer.killers[7]
+    assert orderer.history[board.turn][capture.from_square * 64 + capture.to_square] == 0
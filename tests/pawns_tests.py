@@ -0,0 +1,61 @@
+import chess
+import random
+
+from incremental import IncrementalBoard, incremental_evaluate
+from pawns import PawnTable, pawn_evaluate, pawn_key, pawn_terms
+
+
+def terms(fen: str):
+    board = chess.Board(fen)
+    return pawn_terms(board.pawns & board.occupied_co[chess.WHITE], board.pawns & board.occupied_co[chess.BLACK])
+
+
+def test_pawn_terms():
+    # doubled and isolated c pawns, isolated passed a pawn and a passed c3
+    assert terms("4k3/8/8/8/8/2P5/P1P5/4K3 w - - 0 1") == (-30, -40)
+    # backward d3, passed c4 and an isolated black e5
+    assert terms("4k3/8/8/4p3/2P5/3P4/8/4K3 w - - 0 1") == (12, 30)
+    assert terms(chess.STARTING_FEN) == (0, 0)
+
+    # the terms are symmetrical
+    random.seed(0)
+    board = chess.Board()
+    for _ in range(300):
+        moves = list(board.legal_moves)
+        if not moves:
+            board = chess.Board()
+            continue
+        board.push(random.choice(moves))
+        mirrored = board.mirror()
+        mg, eg = terms(board.fen())
+        assert terms(mirrored.fen()) == (-mg, -eg)
+
+
+def test_incremental_pawn_key():
+    random.seed(1)
+    for fen in [chess.STARTING_FEN, "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"]:
+        board = IncrementalBoard(fen)
+        for _ in range(200):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(random.choice(moves))
+            assert board.pawn_key == pawn_key(board), board.fen()
+            if random.random() < 0.2:
+                board.pop()
+                assert board.pawn_key == pawn_key(board), board.fen()
+
+
+def test_pawn_table():
+    table = PawnTable(64)
+    board = chess.Board("4k3/8/8/4p3/2P5/3P4/8/4K3 w - - 0 1")
+    white, black = board.pawns & board.occupied_co[chess.WHITE], board.pawns & board.occupied_co[chess.BLACK]
+    assert table.score(pawn_key(board), white, black) == (12, 30)
+    assert table.score(pawn_key(board), white, black) == (12, 30)
+    assert (table.probes, table.hits) == (2, 1)
+
+    # the same evaluation for incremental and plain boards
+    incremental = IncrementalBoard(board.fen())
+    assert pawn_evaluate(incremental) == pawn_evaluate(board)
+    assert pawn_evaluate(incremental) != incremental_evaluate(incremental)
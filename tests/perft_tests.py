@@ -0,0 +1,54 @@
+import chess
+import pytest
+
+from incremental import IncrementalBoard
+from perft import REFERENCE_POSITIONS, PerftTable, divide, hash_perft, perft
+from timeman import SearchAborted, TimeManager
+
+# keeps the suite to a few seconds
+MAX_NODES = 100_000
+
+
+def test_reference_positions():
+    for fen, counts in REFERENCE_POSITIONS:
+        board = chess.Board(fen)
+        for depth, expected in enumerate(counts, 1):
+            if expected > MAX_NODES:
+                break
+            assert perft(board, depth) == expected, (fen, depth)
+        assert board.fen() == fen
+
+
+def test_incremental_board():
+    # the board of the search makes and unmakes moves with its own bookkeeping
+    fen, counts = REFERENCE_POSITIONS[1]
+    board = IncrementalBoard(fen)
+    assert perft(board, 3) == counts[2]
+    assert (board.mg, board.eg) == (IncrementalBoard(fen).mg, IncrementalBoard(fen).eg)
+
+
+def test_divide_and_hash_perft():
+    fen, counts = REFERENCE_POSITIONS[2]
+    board = chess.Board(fen)
+    split = divide(board, 4)
+    assert len(split) == counts[0]
+    assert sum(count for _, count in split) == counts[3]
+
+    table = PerftTable(1 << 12)
+    for depth in range(1, 5):
+        assert hash_perft(board, depth, table) == counts[depth - 1]
+    # counted again from the table
+    assert hash_perft(board, 4, table) == counts[3]
+    assert table.hits > 0
+
+
+def test_stop():
+    fen, counts = REFERENCE_POSITIONS[0]
+    board = chess.Board(fen)
+    timer = TimeManager()
+    assert perft(board, 3, timer) == counts[2]
+    timer.stop()
+    with pytest.raises(SearchAborted):
+        perft(board, 3, timer)
+    with pytest.raises(SearchAborted):
+        hash_perft(chess.Board(fen), 3, PerftTable(1 << 10), timer)
@@ -10,3 +10,118 @@ for i in ["rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
      "1R2b2k/8/6Q1/p2p4/P2K4/8/8/8 b - - 0 1"
      ]:
     print(evaluate(chess.Board(i)))
+
+
+def test_incremental_matches_evaluate():
+    """
+    The running sums of IncrementalBoard must give exactly the same evaluation
+    as psqt.evaluate on every position, through moves of all kinds and take-backs.
+    """
+    import random
+
+    from incremental import IncrementalBoard, incremental_evaluate
+    from psqt import static_evaluate
+
+    random.seed(0)
+    fens = [chess.STARTING_FEN,
+            "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+            "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+            "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+            "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8"]
+    for fen in fens:
+        for _ in range(20):
+            board = IncrementalBoard(fen)
+            for _ in range(150):
+                moves = list(board.legal_moves)
+                if not moves:
+                    break
+                board.push(random.choice(moves))
+                assert incremental_evaluate(board) == static_evaluate(board), board.fen()
+                if not board.is_game_over():
+                    assert incremental_evaluate(board) == evaluate(board), board.fen()
+                if random.random() < 0.2:
+                    board.pop()
+                    assert incremental_evaluate(board) == static_evaluate(board), board.fen()
+            while board.move_stack:
+                board.pop()
+                assert incremental_evaluate(board) == static_evaluate(board), board.fen()
+
+    # chess960 castling is written as the king taking its own rook
+    board = IncrementalBoard("bqnb1rkr/pp3ppp/3ppn2/2p5/5P2/P2P4/NPP1P1PP/BQ1BNRKR w HFhf - 2 9", chess960=True)
+    for _ in range(200):
+        moves = list(board.legal_moves)
+        if not moves:
+            break
+        board.push(random.choice(moves))
+        assert incremental_evaluate(board) == static_evaluate(board), board.fen()
+
+    # positions set up without moves
+    board = IncrementalBoard()
+    board.set_fen(fens[1])
+    assert incremental_evaluate(board) == static_evaluate(board)
+    board.push(next(iter(board.legal_moves)))
+    assert incremental_evaluate(board.copy()) == static_evaluate(board)
+    assert incremental_evaluate(board.copy(stack=False)) == static_evaluate(board)
+    assert incremental_evaluate(board.root()) == static_evaluate(chess.Board(fens[1]))
+    board.apply_mirror()
+    assert incremental_evaluate(board) == static_evaluate(board)
+
+
+def test_fast_evaluate_matches_evaluate():
+    """fast_evaluate reads the bitboards but must give exactly the same results as evaluate"""
+    import random
+
+    from psqt import fast_evaluate
+
+    random.seed(1)
+    # checkmate, stalemate and insufficient material included
+    fens = [chess.STARTING_FEN,
+            "rnbqkb1r/ppp2Qpp/3p1n2/4p3/2B1P3/8/PPPP1PPP/RNB1K1NR b KQkq - 0 1",
+            "7k/5Q2/6K1/8/8/8/8/8 b - - 0 1",
+            "8/8/4k3/8/8/3K4/8/8 w - - 0 1",
+            "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"]
+    for fen in fens:
+        board = chess.Board(fen)
+        assert fast_evaluate(board) == evaluate(board), fen
+        for _ in range(100):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            move = random.choice(moves)
+            assert fast_evaluate(board, move) == evaluate(board, move), board.fen()
+            board.push(move)
+
+
+def test_batch_evaluate_matches_evaluate():
+    """The batched NumPy evaluation must give exactly the same results as evaluate"""
+    import random
+
+    from batch_eval import batch_evaluate, batch_evaluate_moves, batch_static_evaluate, board_bitboards
+    from psqt import static_evaluate
+
+    random.seed(2)
+    boards = [chess.Board("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1"),
+              chess.Board("rnbqkb1r/ppp2Qpp/3p1n2/4p3/2B1P3/8/PPPP1PPP/RNB1K1NR b KQkq - 0 1"),
+              chess.Board("8/8/4k3/8/8/3K4/8/8 w - - 0 1"),
+              chess.Board("8/8/4k3/8/8/3K1B2/8/8 b - - 0 1")]
+    board = chess.Board()
+    while len(boards) < 3000:
+        moves = list(board.legal_moves)
+        if not moves:
+            board = chess.Board()
+            continue
+        board.push(random.choice(moves))
+        boards.append(board.copy(stack=False))
+
+    terminal = [not any(board.generate_legal_moves()) for board in boards]
+    assert list(batch_evaluate(boards, terminal)) == [evaluate(board) for board in boards]
+    # without the terminal flags only the mates and stalemates differ
+    playable = [board for board, end in zip(boards, terminal) if not end]
+    assert list(batch_evaluate(playable)) == [evaluate(board) for board in playable]
+    assert list(batch_static_evaluate(board_bitboards(boards), chunk_size=1000)) == \
+        [static_evaluate(board) for board in boards]
+
+    board = chess.Board("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+    moves = list(board.legal_moves)
+    assert list(batch_evaluate_moves(board, moves)) == [evaluate(board, move) for move in moves]
+    assert len(batch_evaluate([])) == 0
@@ -0,0 +1,184 @@
+import chess
+import io
+import threading
+import time
+
+from contextlib import redirect_stdout
+from multiprocessing import Process
+
+import engine
+
+from math import inf
+from minimax import SearchFeatures, minimax
+from ordering import MoveOrderer
+from pawns import pawn_evaluate
+from psqt import static_evaluate
+from smp import LazySMP, attach_table, root_split_search
+from stats import SearchStats
+from timeman import TimeManager
+from transposition import BUCKET_SIZE, EXACT, LOWER, TranspositionTable
+from zobrist import game_history, zobrist_hash
+
+MIDDLEGAME_FEN = "r1bqkb1r/1ppp1ppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQ1RK1 w kq - 0 1"
+
+
+def search_in_thread(board, depth, threads, timer):
+    """Starts engine.go() like the worker does, returns the thread, its output and the move found"""
+    output = io.StringIO()
+    result = []
+
+    def search():
+        with redirect_stdout(output):
+            result.append(engine.go(board, "d", depth, [], pawn_evaluate, False, 1, threads=threads, timer=timer))
+
+    thread = threading.Thread(target=search)
+    thread.start()
+    return thread, output, result
+
+
+def store_doubled_entry(attach_args, key):
+    """Reads the entry of the key from the shared table and stores a changed copy of it under key + 1"""
+    shm, tt = attach_table(*attach_args)
+    depth, _, score, move = tt.probe(key)
+    tt.store(key + 1, depth + 1, LOWER, score * 2, move)
+    tt.release()
+    shm.close()
+
+
+def test_shared_table_round_trip():
+    move = chess.Move.from_uci("e2e4")
+    with LazySMP(2, 1) as smp:
+        smp.tt.store(12345, 5, EXACT, 12.5, move)
+        process = Process(target=store_doubled_entry, args=(smp.attach_args(), 12345))
+        process.start()
+        process.join(10)
+        assert process.exitcode == 0
+        assert smp.tt.probe(12345 + 1) == (6, LOWER, 25.0, move)
+
+
+def test_torn_entries_are_ignored():
+    tt = TranspositionTable(1)
+    other = TranspositionTable(1)
+    key = 0xDEADBEEF
+    slot = (key & tt.mask) * BUCKET_SIZE
+    tt.store(key, 4, EXACT, 30.0, chess.Move.from_uci("g1f3"))
+    assert tt.probe(key) is not None
+    # a second process wrote its data word between the writes of this entry
+    other.store(key, 7, LOWER, 30.0, None)
+    tt.data[slot] = other.data[slot]
+    assert tt.probe(key) is None
+
+    tt.clear()
+    tt.store(key, 4, EXACT, 30.0, None)
+    # or its score
+    tt.scores[slot] = -30.0
+    assert tt.probe(key) is None
+
+
+def test_helpers_fill_the_shared_table():
+    board = chess.Board(MIDDLEGAME_FEN)
+    with LazySMP(2, 1) as smp:
+        smp.start(board, [], pawn_evaluate, None, game_history(board), "")
+        deadline = time.perf_counter() + 10
+        # only the helper searches, the root is stored when its first iteration is done
+        while smp.tt.probe(zobrist_hash(board)) is None and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        assert smp.tt.probe(zobrist_hash(board)) is not None
+        assert smp.helpers[0].is_alive()
+
+
+def test_helpers_report_their_nodes():
+    board = chess.Board(MIDDLEGAME_FEN)
+    with LazySMP(3, 1) as smp:
+        smp.start(board, [], pawn_evaluate, None, game_history(board), "")
+        time.sleep(1)
+        reported = smp.helper_nodes()
+        assert all(smp.node_counts[1:])
+        time.sleep(0.5)
+        assert smp.helper_nodes() > reported
+
+
+def test_info_lines_count_the_helper_nodes():
+    board = chess.Board(MIDDLEGAME_FEN)
+    stats = SearchStats()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        engine.go(board, "t", 1000, [], pawn_evaluate, False, 1, threads=2, timer=TimeManager(1000, 1000), stats=stats)
+    assert stats.helper_nodes > 0
+    last = [line for line in output.getvalue().splitlines() if " pv " in line][-1].split()
+    assert stats.nodes < int(last[last.index("nodes") + 1]) <= stats.total_nodes()
+
+
+def test_table_kept_between_searches():
+    board = chess.Board(MIDDLEGAME_FEN)
+    with LazySMP(2, 1) as smp, redirect_stdout(io.StringIO()):
+        engine.go(board, "t", 300, [], pawn_evaluate, False, 1, timer=TimeManager(300, 300), smp=smp)
+        # the helpers are stopped, the table stays
+        assert not smp.helpers
+        assert smp.tt.probe(zobrist_hash(board)) is not None
+        smp.tt.store(12345, 50, EXACT, 1.0, None)
+        age = smp.tt.age
+        engine.go(board, "d", 2, [], pawn_evaluate, False, 1, smp=smp)
+        assert smp.tt.age == age + 1
+        assert smp.tt.probe(12345) == (50, EXACT, 1.0, None)
+
+
+def test_root_split_matches_the_serial_search():
+    # reductions depend on the move order, which differs between the processes
+    features = SearchFeatures(null_move=False, lmr=False)
+    repetition = chess.Board()
+    for move in ["g1f3", "g8f6", "f3g1", "f6g8", "g1f3", "g8f6", "f3g1"]:
+        repetition.push_uci(move)
+    for board in [chess.Board(), chess.Board(MIDDLEGAME_FEN), chess.Board("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"),
+                  repetition]:
+        serial = minimax(board, 3, -inf, inf, [], static_evaluate, is_root=True, tt=TranspositionTable(1),
+                         features=features, history=game_history(board))
+        with LazySMP(2, 1) as smp, redirect_stdout(io.StringIO()):
+            split, pv = root_split_search(board, 3, [], static_evaluate, features, smp, MoveOrderer(),
+                                          history=game_history(board))
+        assert split[0] == serial[0], board.fen()
+        assert pv[0].uci() == split[0][0]
+        assert len(split) == board.legal_moves.count()
+
+
+def test_root_split_with_the_default_features():
+    # the children of a depth 3 root are too shallow for null move and LMR,
+    # so with the root not reduced both searches see the same tree
+    for board in [chess.Board(), chess.Board(MIDDLEGAME_FEN), chess.Board("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1")]:
+        serial = minimax(board, 3, -inf, inf, [], static_evaluate, is_root=True, tt=TranspositionTable(1),
+                         history=game_history(board))
+        with LazySMP(2, 1) as smp, redirect_stdout(io.StringIO()):
+            split, _ = root_split_search(board, 3, [], static_evaluate, SearchFeatures(), smp, MoveOrderer(),
+                                         history=game_history(board))
+        assert split[0] == serial[0], board.fen()
+        assert sorted(move for move, _ in split) == sorted(move for move, _ in serial)
+
+
+def test_stop_with_threads():
+    board = chess.Board(MIDDLEGAME_FEN)
+    timer = TimeManager()
+    thread, output, result = search_in_thread(board, 20, 2, timer)
+    time.sleep(1)
+    stopped_at = time.perf_counter()
+    timer.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert time.perf_counter() - stopped_at < 0.5
+    assert result[0] in board.legal_moves
+    assert board.fen() == MIDDLEGAME_FEN
+    assert "bestmove " + result[0].uci() in output.getvalue()
+
+
+def test_ponder_with_threads_holds_the_bestmove():
+    board = chess.Board(MIDDLEGAME_FEN)
+    timer = TimeManager(ponder=True)
+    thread, output, result = search_in_thread(board, 2, 2, timer)
+    # long enough for depth 2 to finish
+    thread.join(2)
+    assert thread.is_alive()
+    assert "info depth 2 " in output.getvalue()
+    assert "bestmove" not in output.getvalue()
+    timer.ponderhit()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert "bestmove " + result[0].uci() in output.getvalue()
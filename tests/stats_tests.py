@@ -0,0 +1,59 @@
+import chess
+import io
+
+from contextlib import redirect_stdout
+from time import perf_counter
+
+from engine import info_line
+from minimax import MATE_SCORE, SearchFeatures
+from ordering import MoveOrderer
+from psqt import static_evaluate
+from smp import LazySMP, root_split_search
+from stats import SearchStats
+from transposition import EXACT, TranspositionTable
+
+
+def test_merge_sums_counters_and_keeps_the_deepest():
+    stats = SearchStats(nodes=100, evals=60, cutoffs=10, first_move_cutoffs=8, tt_probes=50, tt_hits=20,
+                        tb_hits=1, seldepth=9, depth=5)
+    stats.merge(SearchStats(nodes=40, evals=30, cutoffs=4, first_move_cutoffs=1, tt_probes=10, tt_hits=5,
+                            tb_hits=2, seldepth=12, depth=4))
+    assert (stats.nodes, stats.evals, stats.cutoffs, stats.first_move_cutoffs) == (140, 90, 14, 9)
+    assert (stats.tt_probes, stats.tt_hits, stats.tb_hits) == (60, 25, 3)
+    assert (stats.seldepth, stats.depth) == (12, 5)
+    assert stats.first_move_cutoff_rate() == 9 / 14
+
+
+def test_root_split_merges_the_worker_counters():
+    board = chess.Board()
+    stats = SearchStats()
+    with LazySMP(2, 1) as smp, redirect_stdout(io.StringIO()):
+        root_split_search(board, 2, [], static_evaluate, SearchFeatures(), smp, MoveOrderer(), stats)
+    # the first move is searched here, the other 19 by the workers, each with its 20 replies
+    assert stats.nodes >= 20 + 20 * 20
+    assert stats.seldepth == 2
+
+
+def test_info_line():
+    stats = SearchStats(nodes=1000, seldepth=7, tb_hits=3)
+    stats.start_time = perf_counter() - 2
+    tt = TranspositionTable(1)
+    # the first slots of 250 buckets, a quarter of the 1000 sampled slots
+    for key in range(250):
+        tt.store(key, 1, EXACT, 0.0, None)
+    pv = [chess.Move.from_uci("e2e4"), chess.Move.from_uci("e7e5")]
+    line = info_line(5, stats, tt, 35.0, pv)
+    assert line.startswith("info ")
+    assert line.endswith(" pv e2e4 e7e5")
+    assert " score cp 35 " in line
+    tokens = line.replace(" score cp 35", "").split(" pv ")[0].split()[1:]
+    fields = dict(zip(tokens[::2], map(int, tokens[1::2])))
+    assert fields["depth"] == 5
+    assert fields["seldepth"] == 7
+    assert fields["nodes"] == 1000
+    assert 400 <= fields["nps"] <= 500
+    assert 2000 <= fields["time"] < 2500
+    assert fields["hashfull"] == 250
+    assert fields["tbhits"] == 3
+    # mates are given in moves
+    assert "score mate 2 " in info_line(3, stats, tt, MATE_SCORE - 3, pv)
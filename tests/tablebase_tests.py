@@ -0,0 +1,120 @@
+import chess
+
+from math import inf
+
+from minimax import minimax
+from psqt import static_evaluate
+from stats import SearchStats
+from tablebase import CURSED_WIN_SCORE, FIFTY_MOVE_PLIES, TB_WIN_SCORE, Tablebase, wdl_score
+
+
+class QueenTables:
+    """Stands in for chess.syzygy.Tablebase with KQvK: the queen wins unless it is lost"""
+
+    wdl = {"KQvK": None}
+
+    def get_wdl(self, board):
+        if not board.queens:
+            return 0
+        return 2 if board.queens & board.occupied_co[board.turn] else -2
+
+    def get_dtz(self, board):
+        if board.is_checkmate():
+            return 0
+        wdl = self.get_wdl(board)
+        # closer kings are closer to the mate
+        distance = 10 + chess.square_distance(board.king(chess.WHITE), board.king(chess.BLACK))
+        return distance if wdl > 0 else -distance if wdl < 0 else 0
+
+    def close(self):
+        pass
+
+
+def queen_tablebase(tmp_path, cache_size=1 << 16):
+    tablebase = Tablebase(str(tmp_path), cache_size)
+    assert tablebase.max_pieces == 0
+    tablebase.tables = QueenTables()
+    tablebase.max_pieces = 3
+    return tablebase
+
+
+def test_probe_wdl_cache(tmp_path):
+    tablebase = queen_tablebase(tmp_path, cache_size=2)
+    first = chess.Board("8/8/8/4k3/8/8/8/3QK3 w - - 0 1")
+    second = chess.Board("8/8/8/4k3/8/8/8/3QK3 b - - 0 1")
+    third = chess.Board("8/8/8/4k3/8/8/8/Q3K3 b - - 0 1")
+    assert tablebase.probe_wdl(first) == 2
+    assert tablebase.probe_wdl(second) == -2
+    assert tablebase.probe_wdl(first) == 2
+    assert (tablebase.probes, tablebase.cache_hits) == (3, 1)
+    # the least recently used position is dropped
+    tablebase.probe_wdl(third)
+    tablebase.probe_wdl(second)
+    assert tablebase.cache_hits == 1
+    assert tablebase.probe_wdl(chess.Board()) is None
+
+    assert wdl_score(2, 3) == TB_WIN_SCORE - 3
+    # cursed wins and blessed losses are draws that lean towards the side that could win
+    assert wdl_score(1, 3) == -wdl_score(-1, 3) == CURSED_WIN_SCORE
+    assert 0 < CURSED_WIN_SCORE < TB_WIN_SCORE - 100
+
+
+def test_root_moves(tmp_path):
+    tablebase = queen_tablebase(tmp_path)
+    # every move keeps the win, Qc8 mates right away
+    board = chess.Board("k7/8/1K6/8/8/8/8/2Q5 w - - 0 1")
+    ranked = tablebase.root_moves(board, [])
+    assert len(ranked) == board.legal_moves.count()
+    assert ranked[0][0] == chess.Move.from_uci("c1c8")
+    assert ranked[0][1:] == (2, 0)
+    # the losing side holds out as long as it can, by running away from the white king
+    board = chess.Board("8/8/8/3k4/8/8/8/Q3K3 b - - 0 1")
+    ranked = tablebase.root_moves(board, [])
+    assert all(wdl == -2 for _, wdl, _ in ranked)
+    assert ranked[0][2] == min(dtz for _, _, dtz in ranked) == -15
+    assert tablebase.root_moves(chess.Board(), []) is None
+
+
+def test_search_stops_at_tablebase_positions(tmp_path):
+    # taking the knight reaches a won position of the tables
+    board = chess.Board("7k/8/8/3n4/8/8/8/3QK3 w - - 0 1")
+    stats = SearchStats()
+    moves = minimax(board, 3, -inf, inf, [], static_evaluate, is_root=True, stats=stats,
+                    tablebase=queen_tablebase(tmp_path))
+    plain = SearchStats()
+    minimax(board, 3, -inf, inf, [], static_evaluate, is_root=True, stats=plain)
+    assert moves[0] == ("d1d5", TB_WIN_SCORE - 1)
+    assert stats.tb_hits > 0
+    assert stats.nodes < plain.nodes
+
+
+def test_root_moves_and_the_fifty_move_rule(tmp_path):
+    tablebase = queen_tablebase(tmp_path)
+    tablebase.max_pieces = 4
+    # Qxb5 resets the counter, the other wins need at least 12 more plies
+    fen = "k7/8/8/1p6/8/8/8/1Q2K3 w - - {} 80"
+    fresh = tablebase.root_moves(chess.Board(fen.format(0)), [])
+    assert all(wdl == 2 for _, wdl, _ in fresh)
+    late = tablebase.root_moves(chess.Board(fen.format(90)), [])
+    assert late[0] == (chess.Move.from_uci("b1b5"), 2, 1)
+    assert all(wdl == 1 for _, wdl, _ in late[1:])
+    # the zeroing move of a win may land exactly on the 100th ply
+    move = chess.Move.from_uci("b1b2")
+    _, _, dtz = tablebase.root_moves(chess.Board(fen.format(0)), [move])[0]
+    last_chance = FIFTY_MOVE_PLIES - dtz - 1
+    assert tablebase.root_moves(chess.Board(fen.format(last_chance)), [move])[0][1] == 2
+    assert tablebase.root_moves(chess.Board(fen.format(last_chance + 1)), [move])[0][1] == 1
+    # the losing side can reach the 50-move draw
+    board = chess.Board("8/8/8/3k4/8/8/8/Q3K3 b - - 90 80")
+    assert all(wdl == -1 for _, wdl, _ in tablebase.root_moves(board, []))
+    # a mate on the last ply before the rule still wins
+    board = chess.Board("k7/8/1K6/8/8/8/8/2Q5 w - - 99 80")
+    assert tablebase.root_moves(board, [])[0][:2] == (chess.Move.from_uci("c1c8"), 2)
+
+
+def test_search_probes_only_after_captures_and_pawn_moves(tmp_path):
+    # the halfmove clock is only 0 right after a capture or pawn move
+    board = chess.Board("7k/8/8/8/8/8/8/3QK3 w - - 10 60")
+    stats = SearchStats()
+    minimax(board, 2, -inf, inf, [], static_evaluate, is_root=True, stats=stats, tablebase=queen_tablebase(tmp_path))
+    assert stats.tb_hits == 0
@@ -0,0 +1,137 @@
+import chess
+import io
+import pytest
+import threading
+import time
+
+from contextlib import redirect_stdout
+from math import inf
+
+import engine
+
+from pawns import pawn_evaluate
+from timeman import CHECK_EVERY, SearchAborted, TimeManager, allocate, allocate_movetime
+
+
+def test_allocate():
+    # sudden death spreads the time over 40 moves, the hard limit is 4 times the soft one
+    assert allocate(60000, 0, None, 0) == (1500, 6000)
+    assert allocate(60000, 0, 10, 0) == (6000, 24000)
+    assert allocate(60000, 0, 100, 0) == (1500, 6000)
+    # three quarters of the increment are added
+    assert allocate(60000, 1000, None, 0) == (2250, 9000)
+    # the move overhead is taken off the clock first
+    assert allocate(60030, 0, None, 30) == (1500, 6000)
+    # never more than half of the remaining time
+    assert allocate(1000, 2000, None, 0) == (500, 500)
+    assert allocate(60000, 0, 1, 0) == (30000, 30000)
+    assert allocate(10, 0, None, 30) == (1, 1)
+
+
+def test_allocate_movetime():
+    assert allocate_movetime(1000, 30) == (970, 970)
+    assert allocate_movetime(10, 30) == (1, 1)
+
+
+def test_can_start_iteration():
+    timer = TimeManager(100, 400)
+    assert timer.can_start_iteration(0)
+    # the next iteration is expected to take 2.5 times as long as the last one
+    assert timer.can_start_iteration(150)
+    assert not timer.can_start_iteration(200)
+    # past the soft limit
+    timer.start_time -= 0.15
+    assert not timer.can_start_iteration(0)
+    timer = TimeManager(100, 400)
+    timer.stop()
+    assert not timer.can_start_iteration(0)
+
+
+def test_check_aborts_after_the_hard_limit():
+    timer = TimeManager(inf, 10)
+    time.sleep(0.02)
+    # the clock is only read every CHECK_EVERY nodes
+    for _ in range(CHECK_EVERY - 1):
+        timer.check()
+    with pytest.raises(SearchAborted):
+        timer.check()
+    # the first iteration isn't aborted
+    timer.active = False
+    for _ in range(2 * CHECK_EVERY):
+        timer.check()
+
+
+class StopInIteration(TimeManager):
+    """Stops the search in the middle of an iteration, after a number of its nodes"""
+
+    def __init__(self, depth, nodes):
+        super().__init__()
+        self.depth = 1
+        self.stop_depth = depth
+        self.nodes_left = nodes
+
+    def can_start_iteration(self, last_iteration):
+        self.depth += 1
+        return super().can_start_iteration(last_iteration)
+
+    def check(self):
+        if self.depth == self.stop_depth:
+            self.nodes_left -= 1
+            if self.nodes_left == 0:
+                self.stop()
+        super().check()
+
+
+def test_aborted_iteration_is_thrown_away():
+    fen = "r1bqkb1r/1ppp1ppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQ1RK1 w kq - 0 1"
+    board = chess.Board(fen)
+    output = io.StringIO()
+    with redirect_stdout(output):
+        move = engine.go(board, "t", 0, [], pawn_evaluate, False, 1, timer=StopInIteration(4, 200))
+    lines = output.getvalue().splitlines()
+    finished = [line for line in lines if line.startswith("info depth") and " pv " in line]
+    assert finished[-1].startswith("info depth 3 ")
+    assert "info depth 4" in lines
+    # the move of the last completed iteration is played
+    assert finished[-1].split(" pv ")[1].split()[0] == move.uci()
+    assert lines[-1].startswith("bestmove " + move.uci())
+    assert board.fen() == fen
+
+
+def test_ponder_has_no_limits_until_ponderhit():
+    timer = TimeManager(1, 1, ponder=True)
+    time.sleep(0.01)
+    timer.active = True
+    for _ in range(2 * timer.check_every):
+        timer.check()
+    assert timer.can_start_iteration(0)
+
+    # the ponder time is credited: with the soft limit gone the move is played right away
+    timer.ponderhit()
+    assert not timer.pondering
+    assert not timer.can_start_iteration(0)
+
+
+def test_ponderhit_counts_the_hard_limit_from_now():
+    timer = TimeManager(1000, 50, ponder=True)
+    time.sleep(0.02)
+    timer.ponderhit()
+    assert not timer.stopped
+    assert 60 < timer.hard_limit < 1000
+    assert timer.soft_limit == 1000
+
+
+def test_finished_ponder_search_waits():
+    timer = TimeManager(ponder=True)
+    waited = threading.Event()
+
+    def search():
+        timer.wait_while_pondering()
+        waited.set()
+
+    thread = threading.Thread(target=search)
+    thread.start()
+    assert not waited.wait(0.05)
+    timer.stop()
+    thread.join(1)
+    assert waited.is_set()
@@ -0,0 +1,115 @@
+import chess
+
+from math import inf, nextafter
+
+from minimax import MATE_BOUND, MATE_SCORE, minimax, score_from_tt, score_to_tt, store
+from psqt import static_evaluate
+from stats import SearchStats
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+from zobrist import zobrist_hash
+
+E4 = chess.Move.from_uci("e2e4")
+D4 = chess.Move.from_uci("d2d4")
+
+
+def same_bucket_keys(tt, count):
+    """Keys that all map to the first bucket of the table"""
+    return [1 + n * (tt.mask + 1) for n in range(count)]
+
+
+def test_depth_preferred_and_always_replace_slots():
+    tt = TranspositionTable(1)
+    deep, shallow, newer, deeper = same_bucket_keys(tt, 4)
+    tt.store(deep, 5, EXACT, 10.0, E4)
+    # the first slot keeps the deeper result, the second one takes the new one
+    tt.store(shallow, 3, EXACT, 20.0, D4)
+    assert tt.probe(deep) == (5, EXACT, 10.0, E4)
+    assert tt.probe(shallow) == (3, EXACT, 20.0, D4)
+    tt.store(newer, 2, LOWER, 30.0, None)
+    assert tt.probe(deep) is not None
+    assert tt.probe(shallow) is None
+    assert tt.probe(newer) == (2, LOWER, 30.0, None)
+    # a deeper result takes the first slot
+    tt.store(deeper, 6, UPPER, 40.0, None)
+    assert tt.probe(deep) is None
+    assert tt.probe(deeper) == (6, UPPER, 40.0, None)
+
+
+def test_older_searches_are_replaced_first():
+    tt = TranspositionTable(1)
+    old, new = same_bucket_keys(tt, 2)
+    tt.store(old, 8, EXACT, 10.0, E4)
+    tt.new_search()
+    tt.store(new, 1, EXACT, 20.0, None)
+    assert tt.probe(old) is None
+    assert tt.probe(new) == (1, EXACT, 20.0, None)
+
+
+def test_same_position_keeps_its_move():
+    tt = TranspositionTable(1)
+    tt.store(7, 2, LOWER, 10.0, E4)
+    tt.store(7, 3, UPPER, -5.0, None)
+    assert tt.probe(7) == (3, UPPER, -5.0, E4)
+
+
+def test_bound_types():
+    tt = TranspositionTable(1)
+    store(tt, 1, 4, 10.0, 0.0, 20.0, E4, 0)
+    store(tt, 2, 4, 0.0, 0.0, 20.0, E4, 0)
+    store(tt, 3, 4, 20.0, 0.0, 20.0, E4, 0)
+    assert [tt.probe(key)[1] for key in (1, 2, 3)] == [EXACT, UPPER, LOWER]
+
+
+def test_bounds_cut_off_null_window_nodes():
+    board = chess.Board()
+    board.push_uci("e2e4")
+    key = zobrist_hash(board)
+    alpha, beta = 0.0, nextafter(0.0, inf)
+    for bound, score, cutoff in [(EXACT, 5.0, True), (LOWER, 500.0, True), (UPPER, -500.0, True),
+                                 (LOWER, -500.0, False), (UPPER, 500.0, False)]:
+        tt = TranspositionTable(1)
+        tt.store(key, 10, bound, score, None)
+        stats = SearchStats()
+        result = minimax(board, 2, alpha, beta, [], static_evaluate, tt=tt, ply=1, stats=stats)
+        if cutoff:
+            assert (result, stats.nodes) == (score, 1), bound
+        else:
+            assert stats.nodes > 1, bound
+    # too shallow entries only give the move
+    tt = TranspositionTable(1)
+    tt.store(key, 1, EXACT, 5.0, None)
+    stats = SearchStats()
+    minimax(board, 2, alpha, beta, [], static_evaluate, tt=tt, ply=1, stats=stats)
+    assert stats.nodes > 1
+
+
+def test_mate_scores_are_stored_relative_to_the_node():
+    # mate in 5 plies from the root, found 3 plies deep: mate in 2 from the node
+    assert score_to_tt(MATE_SCORE - 5, 3) == MATE_SCORE - 2
+    assert score_to_tt(-MATE_SCORE + 5, 3) == -MATE_SCORE + 2
+    assert score_from_tt(MATE_SCORE - 2, 3) == MATE_SCORE - 5
+    # the same entry seen from another ply
+    assert score_from_tt(MATE_SCORE - 2, 1) == MATE_SCORE - 3
+    assert score_from_tt(-MATE_SCORE + 2, 1) == -MATE_SCORE + 3
+    for score in (0.0, 123.5, -MATE_BOUND + 1):
+        assert score_to_tt(score, 4) == score_from_tt(score, 4) == score
+
+
+def test_clear_and_new_search():
+    tt = TranspositionTable(1)
+    for key in range(2000):
+        tt.store(key, 1, EXACT, 0.0, None)
+    # one key per bucket fills the first slot of each
+    assert tt.hashfull() == 500
+    tt.new_search()
+    assert tt.age == 1
+    # entries of earlier searches don't count
+    assert tt.hashfull() == 0
+    assert tt.probe(5) is not None
+    tt.age = 255
+    tt.new_search()
+    assert tt.age == 0
+    tt.clear()
+    assert tt.age == 0
+    assert tt.probe(5) is None
+    assert tt.hashfull() == 0
@@ -0,0 +1,86 @@
+import chess
+import chess.pgn
+import importlib.util
+import numpy as np
+import os
+import tempfile
+
+import psqt
+import tuner
+
+
+PGN = os.path.join(os.path.dirname(__file__), "..", "game_pgns", "self_play_startpos_depth4.pgn")
+
+
+def test_records_match_static_evaluate():
+    """The linear model of the tuner must give the scores of psqt with the psqt tables"""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = os.path.join(directory, "features.bin")
+        total = tuner.extract(cache, [PGN], chunk_size=7)
+        records = tuner.load(cache)
+        assert total == len(records) > 0
+
+        boards = []
+        with open(PGN) as pgn:
+            game = chess.pgn.read_game(pgn)
+        board = game.board()
+        for move in game.mainline_moves():
+            if (board.ply() >= tuner.SKIP_PLIES and not board.is_check()
+                    and not board.is_capture(move) and not move.promotion):
+                boards.append(board.copy(stack=False))
+            board.push(move)
+
+        scores = tuner.evaluate_records(np.asarray(records), tuner.Parameters.from_psqt())
+        assert list(scores) == [psqt.static_evaluate(board) for board in boards]
+        assert set(records["result"]) == {tuner.RESULTS["1-0"]}
+        del records
+
+
+def test_gradient():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = os.path.join(directory, "features.bin")
+        tuner.extract(cache, [PGN])
+        records = np.array(tuner.load(cache))
+    parameters = tuner.Parameters.from_psqt()
+    gradient = tuner.gradient(records, parameters, 1.5)
+    for array_index, index in ((0, 1), (1, 4), (2, (3, 27)), (3, (0, 52))):
+        array = parameters.arrays()[array_index]
+        value = array[index]
+        array[index] = value + 1e-3
+        higher = tuner.loss(records, parameters, 1.5)
+        array[index] = value - 1e-3
+        lower = tuner.loss(records, parameters, 1.5)
+        array[index] = value
+        assert np.isclose((higher - lower) / 2e-3, gradient[array_index][index], rtol=1e-4, atol=1e-12)
+
+
+def write_and_import(parameters):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tables.py")
+        tuner.write_module(path, parameters)
+        spec = importlib.util.spec_from_file_location("tables", path)
+        tables = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(tables)
+    return tables
+
+
+def test_write_module():
+    """The written module has the names and layout of psqt.py and evaluates like it"""
+    tables = write_and_import(tuner.Parameters.from_psqt())
+    assert tables.MG_PIECE_VALUES == psqt.MG_PIECE_VALUES
+    assert tables.EG_PIECE_VALUES == psqt.EG_PIECE_VALUES
+    assert tables.MG_PESTO == psqt.MG_PESTO
+    assert tables.EG_PESTO == psqt.EG_PESTO
+    assert tables.PIECE_PHASE_VALUES == psqt.PIECE_PHASE_VALUES
+    assert tables.STARTING_PHASE == psqt.STARTING_PHASE
+    board = chess.Board("r1bqkb1r/1ppp1ppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQ1RK1 w kq - 0 1")
+    for function in ("evaluate", "static_evaluate", "fast_evaluate", "fast_static_evaluate"):
+        assert getattr(tables, function)(board) == getattr(psqt, function)(board)
+
+    # the tuned tables are the ones it evaluates with
+    parameters = tuner.Parameters.from_psqt()
+    parameters.mg_values[chess.KNIGHT - 1] += 100
+    parameters.eg_values[chess.KNIGHT - 1] += 100
+    tuned = write_and_import(parameters)
+    board.remove_piece_at(chess.F3)
+    assert tuned.static_evaluate(board) == tuned.fast_static_evaluate(board) == psqt.static_evaluate(board) - 100
@@ -0,0 +1,168 @@
+import chess
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import engine
+
+from timeman import TimeManager
+from worker import STOP, EngineWorker, WorkerState
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_until(read, prefix, timeout=10):
+    """Lines from read() up to and including the first one that starts with the prefix"""
+    lines = []
+    deadline = time.perf_counter() + timeout
+    while not lines or not lines[-1].startswith(prefix):
+        assert time.perf_counter() < deadline, lines
+        lines.append(read(deadline - time.perf_counter()))
+    return lines
+
+
+def worker_reader(worker):
+    def read(timeout):
+        assert worker.output.poll(timeout)
+        return worker.read_line()
+    return read
+
+
+def go_depth(worker, depth):
+    worker.go(chess.STARTING_FEN, [], "d", depth, 0, [], False, 1, 1)
+
+
+def test_go_stop_bestmove():
+    worker = EngineWorker()
+    try:
+        read = worker_reader(worker)
+        go_depth(worker, 30)
+        assert worker.searching
+        read_until(read, "info depth 2 ")
+        worker.stop()
+        stopped_at = time.perf_counter()
+        bestmove = read_until(read, "bestmove", 5)[-1]
+        assert time.perf_counter() - stopped_at < 1
+        assert chess.Move.from_uci(bestmove.split()[1]) in chess.Board().legal_moves
+        assert not worker.searching
+    finally:
+        worker.quit()
+
+
+def test_stop_crossing_its_bestmove_does_not_stop_the_next_search():
+    worker = EngineWorker()
+    try:
+        read = worker_reader(worker)
+        go_depth(worker, 1)
+        read_until(read, "bestmove")
+        # the GUI sent stop while the bestmove was on its way
+        worker.commands.send((STOP, worker.search_id, None))
+        go_depth(worker, 4)
+        lines = read_until(read, "bestmove")
+        assert any(line.startswith("info depth 4 ") for line in lines)
+    finally:
+        worker.quit()
+
+
+def test_stale_and_early_stops():
+    state = WorkerState()
+    first = TimeManager()
+    state.start(1, first)
+    state.finish()
+    # a stop of the finished search
+    state.stop(1)
+    second = TimeManager()
+    state.start(2, second)
+    assert not second.stopped
+    state.finish()
+    # a stop that overtook its go
+    state.stop(3)
+    third = TimeManager()
+    state.start(3, third)
+    assert third.stopped
+
+
+def test_failed_search_leaves_the_game_at_its_position(monkeypatch, capsys):
+    def failing_go(board, *args, **kwargs):
+        board.push(next(iter(board.legal_moves)))
+        board.push(next(iter(board.legal_moves)))
+        raise RuntimeError("search failed")
+
+    monkeypatch.setattr(engine, "go", failing_go)
+    state = WorkerState()
+    state.search(1, chess.STARTING_FEN, ["e2e4"], "d", 3, 0, [], False, 1, 1, False, "", 0)
+    output = capsys.readouterr().out
+    assert "info string RuntimeError: search failed" in output
+    assert "bestmove 0000" in output
+    assert state.game.board.move_stack == [chess.Move.from_uci("e2e4")]
+    # the next position pushes onto the right board
+    board = state.game.set_position(chess.STARTING_FEN, ["e2e4", "e7e5"])
+    assert board.fen() == chess.Board("rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2").fen()
+
+
+def test_shared_table_kept_between_searches(capsys):
+    state = WorkerState()
+    state.search(1, chess.STARTING_FEN, [], "d", 2, 0, [], False, 1, 2, False, "", 0)
+    smp = state.smp
+    state.search(2, chess.STARTING_FEN, ["e2e4"], "d", 2, 0, [], False, 1, 2, False, "", 0)
+    assert state.smp is smp
+    assert smp.tt.age == 2
+    assert "info depth 2 " in capsys.readouterr().out
+    # a new game starts with a new table
+    state.new_game()
+    assert state.smp is None
+    state.search(3, chess.STARTING_FEN, [], "d", 1, 0, [], False, 1, 2, False, "", 0)
+    # and so do other Threads and Hash settings
+    smp = state.smp
+    state.search(4, chess.STARTING_FEN, [], "d", 1, 0, [], False, 1, 3, False, "", 0)
+    assert state.smp is not smp and state.smp.threads == 3
+    state.search(5, chess.STARTING_FEN, [], "d", 1, 0, [], False, 1, 1, False, "", 0)
+    assert state.smp is None
+    state.search(6, chess.STARTING_FEN, [], "d", 1, 0, [], False, 1, 2, False, "", 0)
+    state.close()
+    assert state.smp is None
+
+
+def test_quit_during_a_search_ends_the_worker():
+    worker = EngineWorker()
+    read = worker_reader(worker)
+    go_depth(worker, 30)
+    read_until(read, "info depth 1 ")
+    worker.quit()
+    # quit stopped the search and the worker returned, it wasn't terminated
+    assert worker.process.exitcode == 0
+
+
+def test_isready_and_quit_in_the_interface():
+    interface = subprocess.Popen([sys.executable, "interface.py"], cwd=ROOT, text=True,
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    lines = queue.Queue()
+    threading.Thread(target=lambda: [lines.put(line.rstrip("\n")) for line in interface.stdout], daemon=True).start()
+
+    def read(timeout):
+        return lines.get(timeout=max(timeout, 0))
+
+    def send(command):
+        interface.stdin.write(command + "\n")
+        interface.stdin.flush()
+
+    try:
+        send("position startpos")
+        send("go infinite")
+        read_until(read, "info depth 2 ")
+        send("isready")
+        # answered by the interface while the search goes on
+        assert not any(line.startswith("bestmove") for line in read_until(read, "readyok"))
+        send("stop")
+        read_until(read, "bestmove")
+        send("go infinite")
+        read_until(read, "info depth 1 ")
+        # the worker isn't a daemon, the interface only exits once it has quit
+        send("quit")
+        assert interface.wait(10) == 0
+    finally:
+        if interface.poll() is None:
+            interface.kill()
@@ -0,0 +1,172 @@
+"""
+Time management of timed searches.
+
+The time for a move is split into two limits:
+the soft limit, after which no new iterative deepening iteration is started,
+and the hard limit, at which a running iteration is aborted.
+The search polls the clock through TimeManager.check() every few nodes
+and the aborted iteration is thrown away in favour of the last completed one.
+
+A ponder search runs without limits until ponderhit(), which starts the
+limits of the move the GUI sent with go ponder.
+"""
+
+import threading
+
+from math import inf
+from time import perf_counter
+from typing import Tuple
+
+DEFAULT_MOVE_OVERHEAD = 30  # ms
+DEFAULT_MOVES_TO_GO = 40
+# the hard limit is at most this multiple of the soft limit
+HARD_LIMIT_FACTOR = 4
+# and it never takes more than this share of the remaining time
+MAX_TIME_SHARE = 0.5
+# expected ratio between the times of two consecutive iterations
+BRANCHING_FACTOR = 2.5
+# nodes between two clock polls
+CHECK_EVERY = 512
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when it has to stop immediately"""
+
+
+def allocate(time_left: float,
+             increment: float = 0,
+             movestogo: int|None = None,
+             move_overhead: float = DEFAULT_MOVE_OVERHEAD
+            ) -> Tuple[float, float]:
+    """
+    Computes the soft and hard limits for a move from the clock.
+
+    :param time_left: remaining time on our clock in ms
+    :param increment: increment per move in ms
+    :param movestogo: moves to the next time control, None for sudden death
+    :param move_overhead: time lost per move in communication with the GUI in ms
+    :returns: (soft limit, hard limit) in ms
+    """
+    available = max(time_left - move_overhead, 1)
+    moves = min(movestogo or DEFAULT_MOVES_TO_GO, DEFAULT_MOVES_TO_GO)
+    soft = min(available / moves + increment * 0.75, available * MAX_TIME_SHARE)
+    hard = min(soft * HARD_LIMIT_FACTOR, available * MAX_TIME_SHARE)
+    return max(soft, 1), max(hard, 1)
+
+
+def allocate_movetime(movetime: float,
+                      move_overhead: float = DEFAULT_MOVE_OVERHEAD
+                     ) -> Tuple[float, float]:
+    """Soft and hard limits for a fixed time per move, both in ms"""
+    limit = max(movetime - move_overhead, 1)
+    return limit, limit
+
+
+class TimeManager:
+    """
+    Keeps track of the time used by one search.
+
+    :param soft_limit: ms after which no new iteration is started, inf for no limit
+    :param hard_limit: ms after which the running iteration is aborted, inf for no limit
+    :param check_every: number of nodes between two clock polls
+    :param ponder: the search ponders, the limits only apply after ponderhit()
+    """
+
+    def __init__(self,
+                 soft_limit: float = inf,
+                 hard_limit: float = inf,
+                 check_every: int = CHECK_EVERY,
+                 ponder: bool = False
+                ):
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        self.check_every = check_every
+        self.stopped = False
+        self.active = True
+        self.pondering = ponder
+        # set when pondering ends, with ponderhit() or stop()
+        self.ponder_end = threading.Event()
+        self.start()
+
+    def start(self):
+        """Starts the clock, the search time is counted from here"""
+        self.start_time = perf_counter()
+        self.deadline = inf if self.pondering else self.start_time + self.hard_limit / 1000
+        self.nodes_to_check = self.check_every
+        self.stopped = False
+
+    def elapsed(self) -> float:
+        """Time since start() in ms"""
+        return (perf_counter() - self.start_time) * 1000
+
+    def stop(self):
+        """Asks the search to stop as soon as it polls"""
+        self.stopped = True
+        self.ponder_end.set()
+
+    def ponderhit(self):
+        """
+        The opponent played the move we pondered on, the search goes on as a timed one.
+        The time spent pondering counts towards the soft limit: once it has passed,
+        the move is played right away. The hard limit is counted from now,
+        as our clock only started running now.
+        """
+        elapsed = self.elapsed()
+        self.hard_limit += elapsed
+        self.deadline = self.start_time + self.hard_limit / 1000
+        self.pondering = False
+        if elapsed >= self.soft_limit:
+            self.stop()
+        self.ponder_end.set()
+
+    def wait_while_pondering(self):
+        """
+        Blocks a ponder search that finished on its own until ponderhit() or stop(),
+        the bestmove must not be sent before either of them.
+        """
+        if self.pondering:
+            self.ponder_end.wait()
+
+    def check(self):
+        """
+        Called by the search for every node, polls the clock every check_every nodes
+        and stop requests at every node, so stop is answered right away.
+        Does nothing while the manager is not active (e.g. in the first iteration,
+        which always has to finish so we have a move to play).
+
+        :raises SearchAborted: when the hard limit passed or stop() was called
+        """
+        if self.stopped and self.active:
+            raise SearchAborted
+        self.nodes_to_check -= 1
+        if self.nodes_to_check > 0:
+            return
+        self.nodes_to_check = self.check_every
+        if self.active and perf_counter() >= self.deadline:
+            raise SearchAborted
+
+    def poll(self):
+        """
+        check() for code that waits for other processes instead of searching nodes:
+        looks at the clock and the stop requests right away.
+
+        :raises SearchAborted: when the hard limit passed or stop() was called
+        """
+        if self.active and (self.stopped or perf_counter() >= self.deadline):
+            raise SearchAborted
+
+    def can_start_iteration(self, last_iteration: float) -> bool:
+        """
+        Decides whether there is time for another iteration:
+        the soft limit must not have passed yet and the next iteration,
+        estimated from the time of the last one, has to fit into the hard limit.
+
+        :param last_iteration: time the last iteration took in ms
+        """
+        if self.stopped:
+            return False
+        if self.pondering:
+            return True
+        elapsed = self.elapsed()
+        return (elapsed < self.soft_limit
+                and elapsed + last_iteration * BRANCHING_FACTOR < self.hard_limit)
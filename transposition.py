@@ -0,0 +1,181 @@
+"""
+Transposition table for the minimax search.
+
+Entries are keyed by the polyglot Zobrist hash of the position and stored
+in flat typed arrays (one 64-bit key, one 64-bit packed data word and one
+double score per entry), so the memory use is fixed by the size in MB.
+Entries are grouped into buckets of two slots: the first slot keeps the
+deepest result of the current search, the second one is always replaced.
+
+The arrays can live in any writable buffer, e.g. multiprocessing shared memory,
+so several search processes can share one table without locks. The stored key
+is XORed with the data and the score, so an entry torn by two processes writing
+it at the same time no longer matches its key and is ignored.
+"""
+
+import chess
+import struct
+
+from typing import Optional, Tuple
+
+DEFAULT_HASH_MB = 16
+
+# bound types
+EXACT = 0
+LOWER = 1  # the score is a lower bound (fail high)
+UPPER = 2  # the score is an upper bound (fail low)
+
+ENTRY_SIZE = 24  # key + data + score, 8 bytes each
+BUCKET_SIZE = 2
+
+# layout of the packed data word
+_MOVE_BITS = 16
+_DEPTH_SHIFT = 16
+_BOUND_SHIFT = 24
+_AGE_SHIFT = 26
+_VALID = 1 << 34
+_HAS_MOVE = 1 << 15
+
+# used to reinterpret the score bits as a float
+_DOUBLE = struct.Struct("d")
+_UINT64 = struct.Struct("Q")
+
+
+def encode_move(move: Optional[chess.Move]) -> int:
+    """Packs a move into 16 bits (from, to, promotion and a presence flag)"""
+    if move is None:
+        return 0
+    return (move.from_square
+            | move.to_square << 6
+            | (move.promotion or 0) << 12
+            | _HAS_MOVE)
+
+
+def decode_move(code: int) -> Optional[chess.Move]:
+    """Inverse of encode_move()"""
+    if not code & _HAS_MOVE:
+        return None
+    return chess.Move(code & 63, (code >> 6) & 63, (code >> 12) & 7 or None)
+
+
+def table_entries(size_mb: int) -> int:
+    """Number of entries of a table of the given size"""
+    entries = max(BUCKET_SIZE, size_mb * 1024 * 1024 // ENTRY_SIZE)
+    # round down to a power of two number of buckets so we can mask the key
+    return (1 << ((entries // BUCKET_SIZE).bit_length() - 1)) * BUCKET_SIZE
+
+
+def table_bytes(size_mb: int) -> int:
+    """Size of the buffer needed by a table of the given size"""
+    return table_entries(size_mb) * ENTRY_SIZE
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results.
+
+    :param size_mb: memory used by the table in megabytes
+    :param buffer: writable buffer of at least table_bytes(size_mb) bytes
+                   to keep the table in (e.g. SharedMemory.buf), a new one is allocated if None
+    """
+
+    def __init__(self, size_mb: int = DEFAULT_HASH_MB, buffer=None):
+        self.size = table_entries(size_mb)
+        self.mask = self.size // BUCKET_SIZE - 1
+        self.age = 0
+        if buffer is None:
+            buffer = bytearray(self.size * ENTRY_SIZE)
+        self.buffer = memoryview(buffer)[:self.size * ENTRY_SIZE]
+        self.keys = self.buffer[:8 * self.size].cast("Q")
+        self.data = self.buffer[8 * self.size:16 * self.size].cast("Q")
+        self.scores = self.buffer[16 * self.size:].cast("d")
+        # the same scores seen as integers, used in the key check
+        self.score_bits = self.buffer[16 * self.size:].cast("Q")
+
+    def release(self):
+        """Releases the views of the buffer, needed before closing shared memory"""
+        for view in (self.keys, self.data, self.scores, self.score_bits, self.buffer):
+            view.release()
+
+    def clear(self):
+        """Empties the table"""
+        self.buffer[:] = bytes(len(self.buffer))
+        self.age = 0
+
+    def new_search(self):
+        """
+        Marks the start of a new search (a new `go`), so entries from
+        the previous searches become preferred for replacement.
+        Iterative deepening iterations of one search share the same age.
+        """
+        self.age = (self.age + 1) & 0xFF
+
+    def hashfull(self) -> int:
+        """Per mille of the table used by the current search, estimated from the first 1000 entries"""
+        sample = min(self.size, 1000)
+        used = sum(
+            1 for slot in range(sample)
+            if self.data[slot] & _VALID and (self.data[slot] >> _AGE_SHIFT) & 0xFF == self.age
+        )
+        return used * 1000 // sample
+
+    def probe(self, key: int) -> Optional[Tuple[int, int, float, Optional[chess.Move]]]:
+        """
+        Looks the position up.
+
+        :param key: Zobrist hash of the position
+        :returns: (depth, bound, score, best move) or None if the position is not stored
+        """
+        index = (key & self.mask) * BUCKET_SIZE
+        for slot in range(index, index + BUCKET_SIZE):
+            data = self.data[slot]
+            bits = self.score_bits[slot]
+            if self.keys[slot] ^ data ^ bits == key and data & _VALID:
+                return ((data >> _DEPTH_SHIFT) & 0xFF,
+                        (data >> _BOUND_SHIFT) & 3,
+                        _DOUBLE.unpack(_UINT64.pack(bits))[0],
+                        decode_move(data & ((1 << _MOVE_BITS) - 1)))
+        return None
+
+    def _stored_key(self, slot: int) -> int:
+        return self.keys[slot] ^ self.data[slot] ^ self.score_bits[slot]
+
+    def store(self, key: int, depth: int, bound: int, score: float,
+              move: Optional[chess.Move]):
+        """
+        Saves a search result.
+        The first slot of the bucket is replaced only by deeper (or equally deep)
+        results or when it comes from an older search, the second slot always.
+
+        :param key: Zobrist hash of the position
+        :param depth: remaining depth the position was searched to
+        :param bound: EXACT, LOWER or UPPER
+        :param score: score of the position
+        :param move: best move found, or None
+        """
+        index = (key & self.mask) * BUCKET_SIZE
+        if self._stored_key(index + 1) == key:
+            slot = index + 1
+        else:
+            old = self.data[index]
+            if (self._stored_key(index) == key
+                    or not old & _VALID
+                    or (old >> _AGE_SHIFT) & 0xFF != self.age
+                    or (old >> _DEPTH_SHIFT) & 0xFF <= depth):
+                slot = index
+            else:
+                slot = index + 1
+
+        code = encode_move(move)
+        if move is None and self._stored_key(slot) == key:
+            # keep the best move of the previous search of this position
+            code = self.data[slot] & ((1 << _MOVE_BITS) - 1)
+
+        data = (code
+                | min(depth, 0xFF) << _DEPTH_SHIFT
+                | bound << _BOUND_SHIFT
+                | self.age << _AGE_SHIFT
+                | _VALID)
+        self.scores[slot] = score
+        self.data[slot] = data
+        self.keys[slot] = key ^ data ^ self.score_bits[slot]
@@ -0,0 +1,361 @@
+"""
+Texel tuning of the PeSTO tables.
+
+The tuner fits the piece values and piece-square tables of psqt to the results
+of games: the evaluation e of a position is turned into an expected score
+1 / (1 + 10^(-K*e/400)) and the mean squared difference to the game result
+is minimised. It runs in two steps:
+
+extract: positions and results are streamed from PGN and EPD files in chunks
+         and stored once as sparse feature vectors in a flat binary cache,
+         which is memory-mapped afterwards, so the data never has to fit into memory.
+tune:    K is fitted to the current tables, then the tables are optimised with
+         mini-batch Adam. The evaluation and its gradient are vectorised NumPy
+         gathers and bincounts over the feature indices.
+         The result is written out as a module that can replace psqt.py.
+
+Usage:
+    python tuner.py extract <cache> <pgn/epd files...>
+    python tuner.py tune <cache> <output module> [--epochs N] [--batch-size N] [--lr X] [--k X]
+"""
+
+import argparse
+import chess
+import chess.pgn
+import numpy as np
+import re
+import sys
+
+from math import log
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import psqt
+
+from batch_eval import bitboards_of, occupancy
+from psqt import EG_PESTO, EG_PIECE_VALUES, MG_PESTO, MG_PIECE_VALUES, PIECE_PHASE_VALUES, STARTING_PHASE
+
+MAX_PIECES = 32
+# Features are indices into the signed weight vector: white pieces
+# (piece_type - 1) * 64 + table index, black pieces the same + 384.
+# The table index is the square as written in the psqt tables (a8 first),
+# that is square ^ 56 for white and the square itself for black.
+# Unused feature slots point at PAD, whose weight is always 0.
+PAD = 768
+RECORD = np.dtype([("features", np.uint16, MAX_PIECES), ("phase", np.uint8), ("result", np.uint8)])
+# results are stored as 0 (black won), 1 (draw) and 2 (white won)
+RESULTS = {"1-0": 2, "1/2-1/2": 1, "0-1": 0}
+EPD_RESULT = re.compile(r'"(1-0|0-1|1/2-1/2)"|\[(1\.0|0\.5|0\.0|1|0)\]|\b(1-0|0-1|1/2-1/2)\b')
+EPD_SCORES = {"1.0": 2, "1": 2, "0.5": 1, "0.0": 0, "0": 0}
+
+# positions per chunk when extracting and per mini-batch when tuning
+CHUNK_SIZE = 1 << 16
+BATCH_SIZE = 1 << 14
+SKIP_PLIES = 8
+# the code of psqt.py after its tables starts here, write_module() copies it
+PSQT_CODE_START = "PIECE_PHASE_VALUES = {"
+
+FEATURE_OF_SQUARE = np.array(
+    [(plane % 6) * 64 + (square ^ 56 if plane < 6 else square) + (384 if plane >= 6 else 0)
+     for plane in range(12) for square in range(64)],
+    dtype=np.uint16,
+)
+PLANE_PHASES = np.array([PIECE_PHASE_VALUES[piece_type] for piece_type in chess.PIECE_TYPES] * 2)
+
+
+def read_pgn(path: str, skip_plies: int = SKIP_PLIES) -> Iterator[Tuple[Tuple[int, ...], int]]:
+    """
+    Streams the positions of the games in a PGN file with the results of their games.
+    The opening plies, positions in check and positions where a capture
+    or promotion was played are skipped, as the static evaluation can't judge them.
+
+    :returns: (bitboards_of(board), result code) pairs
+    """
+    with open(path) as pgn:
+        while (game := chess.pgn.read_game(pgn)) is not None:
+            result = RESULTS.get(game.headers.get("Result"))
+            if result is None:
+                continue
+            board = game.board()
+            for move in game.mainline_moves():
+                if (board.ply() >= skip_plies and not board.is_check()
+                        and not board.is_capture(move) and not move.promotion):
+                    yield bitboards_of(board), result
+                board.push(move)
+
+
+def read_epd(path: str) -> Iterator[Tuple[Tuple[int, ...], int]]:
+    """
+    Streams labelled positions from an EPD file. The result may be given as
+    an opcode (c9 "1-0";), in brackets ([0.5]) or as a bare result after the position.
+    Lines without a result are skipped.
+
+    :returns: (bitboards_of(board), result code) pairs
+    """
+    with open(path) as epd:
+        for line in epd:
+            fields = line.split()
+            if len(fields) < 5:
+                continue
+            match = EPD_RESULT.search(" ".join(fields[4:]))
+            if match is None:
+                continue
+            quoted, bracketed, bare = match.groups()
+            result = EPD_SCORES[bracketed] if bracketed else RESULTS[quoted or bare]
+            yield bitboards_of(chess.Board(" ".join(fields[:4]))), result
+
+
+def read_positions(paths: Iterable[str]) -> Iterator[Tuple[Tuple[int, ...], int]]:
+    """Positions of all the files, PGN files are recognised by the suffix, the rest is read as EPD"""
+    for path in paths:
+        yield from read_pgn(path) if path.lower().endswith(".pgn") else read_epd(path)
+
+
+def to_records(bitboards: np.ndarray, results: np.ndarray) -> np.ndarray:
+    """
+    Converts (N, 8) bitboards and their results into feature records.
+    Positions with more than MAX_PIECES pieces are dropped.
+    """
+    planes = occupancy(bitboards).reshape(len(bitboards), -1)
+    rows, columns = np.nonzero(planes)
+    counts = np.bincount(rows, minlength=len(bitboards))
+    slots = np.arange(len(rows)) - (np.cumsum(counts) - counts)[rows]
+    valid = counts <= MAX_PIECES
+
+    records = np.zeros(len(bitboards), dtype=RECORD)
+    records["features"] = PAD
+    keep = slots < MAX_PIECES
+    records["features"][rows[keep], slots[keep]] = FEATURE_OF_SQUARE[columns[keep]]
+    records["phase"] = planes.reshape(len(bitboards), 12, 64).sum(axis=2) @ PLANE_PHASES
+    records["result"] = results
+    return records[valid]
+
+
+def extract(cache_path: str, paths: Iterable[str], chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Streams the positions of the files into the feature cache, one chunk at a time.
+
+    :returns: number of positions in the cache
+    """
+    total = 0
+    with open(cache_path, "wb") as cache:
+        chunk: List[Tuple[int, ...]] = []
+        results: List[int] = []
+        for bitboards, result in read_positions(paths):
+            chunk.append(bitboards)
+            results.append(result)
+            if len(chunk) == chunk_size:
+                total += write_chunk(cache, chunk, results)
+                chunk, results = [], []
+        if chunk:
+            total += write_chunk(cache, chunk, results)
+    return total
+
+
+def write_chunk(cache, chunk: List[Tuple[int, ...]], results: List[int]) -> int:
+    records = to_records(np.array(chunk, dtype=np.uint64), np.array(results, dtype=np.uint8))
+    records.tofile(cache)
+    return len(records)
+
+
+def load(cache_path: str) -> np.ndarray:
+    """Memory-maps the feature cache"""
+    return np.memmap(cache_path, dtype=RECORD, mode="r")
+
+
+class Parameters:
+    """
+    Tunable tables: piece values (6,) and piece-square tables (6, 64)
+    for the middlegame and the endgame, in the layout of psqt.
+    The king values are constant, both sides always have one king.
+    """
+
+    def __init__(self, mg_values: Dict, eg_values: Dict, mg_tables: Dict, eg_tables: Dict):
+        self.mg_values = np.array([mg_values[piece_type] for piece_type in chess.PIECE_TYPES], dtype=np.float64)
+        self.eg_values = np.array([eg_values[piece_type] for piece_type in chess.PIECE_TYPES], dtype=np.float64)
+        self.mg_tables = np.array([mg_tables[piece_type] for piece_type in chess.PIECE_TYPES], dtype=np.float64)
+        self.eg_tables = np.array([eg_tables[piece_type] for piece_type in chess.PIECE_TYPES], dtype=np.float64)
+
+    @classmethod
+    def from_psqt(cls) -> "Parameters":
+        return cls(MG_PIECE_VALUES, EG_PIECE_VALUES, MG_PESTO, EG_PESTO)
+
+    def arrays(self) -> List[np.ndarray]:
+        return [self.mg_values, self.eg_values, self.mg_tables, self.eg_tables]
+
+    def weights(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Signed middlegame and endgame weights of every feature, PAD included"""
+        mg = (self.mg_tables + self.mg_values[:, None]).ravel()
+        eg = (self.eg_tables + self.eg_values[:, None]).ravel()
+        return np.concatenate((mg, -mg, [0.0])), np.concatenate((eg, -eg, [0.0]))
+
+
+def evaluate_records(records: np.ndarray, parameters: Parameters) -> np.ndarray:
+    """Tapered evaluation of the records from white's point of view, the same as psqt.static_evaluate()"""
+    mg_weights, eg_weights = parameters.weights()
+    features = records["features"]
+    phase = records["phase"] / STARTING_PHASE
+    return mg_weights[features].sum(axis=1)*phase + eg_weights[features].sum(axis=1)*(1-phase)
+
+
+def expected_scores(evaluations: np.ndarray, k: float) -> np.ndarray:
+    return 1 / (1 + 10 ** (-k * evaluations / 400))
+
+
+def loss(records: np.ndarray, parameters: Parameters, k: float) -> float:
+    """Mean squared error between the expected scores and the game results"""
+    results = records["result"] / 2
+    return float(np.mean((results - expected_scores(evaluate_records(records, parameters), k)) ** 2))
+
+
+def gradient(records: np.ndarray, parameters: Parameters, k: float) -> List[np.ndarray]:
+    """Gradient of loss() with respect to Parameters.arrays()"""
+    features = records["features"]
+    phase = records["phase"] / STARTING_PHASE
+    results = records["result"] / 2
+    scores = expected_scores(evaluate_records(records, parameters), k)
+    d_eval = -2 * (results - scores) * scores * (1 - scores) * k * log(10) / 400 / len(records)
+
+    flat = features.ravel()
+    d_mg = np.bincount(flat, weights=np.repeat(d_eval * phase, MAX_PIECES), minlength=PAD + 1)
+    d_eg = np.bincount(flat, weights=np.repeat(d_eval * (1 - phase), MAX_PIECES), minlength=PAD + 1)
+    # white features count positively and black ones negatively
+    d_mg_tables = (d_mg[:384] - d_mg[384:PAD]).reshape(6, 64)
+    d_eg_tables = (d_eg[:384] - d_eg[384:PAD]).reshape(6, 64)
+    d_mg_values = d_mg_tables.sum(axis=1)
+    d_eg_values = d_eg_tables.sum(axis=1)
+    d_mg_values[chess.KING - 1] = d_eg_values[chess.KING - 1] = 0
+    return [d_mg_values, d_eg_values, d_mg_tables, d_eg_tables]
+
+
+def fit_k(records: np.ndarray, parameters: Parameters, low: float = 0.05, high: float = 5.0) -> float:
+    """Golden section search for the K minimising the loss of the current tables"""
+    ratio = (5 ** 0.5 - 1) / 2
+    for _ in range(40):
+        a = high - ratio * (high - low)
+        b = low + ratio * (high - low)
+        if loss(records, parameters, a) < loss(records, parameters, b):
+            high = b
+        else:
+            low = a
+    return (low + high) / 2
+
+
+def tune(records: np.ndarray,
+         parameters: Parameters,
+         k: float,
+         epochs: int = 10,
+         batch_size: int = BATCH_SIZE,
+         lr: float = 1.0,
+         seed: int = 0,
+         verbose: bool = True
+        ) -> Parameters:
+    """
+    Mini-batch Adam over the records, the batches are contiguous slices
+    of the memory map visited in a new random order every epoch.
+
+    :param lr: step size in centipawns
+    """
+    rng = np.random.default_rng(seed)
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    arrays = parameters.arrays()
+    moments = [np.zeros_like(array) for array in arrays]
+    velocities = [np.zeros_like(array) for array in arrays]
+    step = 0
+    starts = np.arange(0, len(records), batch_size)
+
+    for epoch in range(epochs):
+        start_time = perf_counter()
+        for start in rng.permutation(starts):
+            batch = np.asarray(records[start:start + batch_size])
+            step += 1
+            for array, grad, m, v in zip(arrays, gradient(batch, parameters, k), moments, velocities):
+                m *= beta1
+                m += (1 - beta1) * grad
+                v *= beta2
+                v += (1 - beta2) * grad * grad
+                array -= lr * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + epsilon)
+        if verbose:
+            print(f"epoch {epoch + 1} loss {loss_of(records, parameters, k):.6f}"
+                  f" time {perf_counter() - start_time:.1f}s", flush=True)
+    return parameters
+
+
+def loss_of(records: np.ndarray, parameters: Parameters, k: float, chunk_size: int = 1 << 20) -> float:
+    """loss() over the whole memory map, computed chunk by chunk"""
+    total = 0.0
+    for start in range(0, len(records), chunk_size):
+        chunk = np.asarray(records[start:start + chunk_size])
+        total += loss(chunk, parameters, k) * len(chunk)
+    return total / max(len(records), 1)
+
+
+def format_table(name: str, values: np.ndarray) -> str:
+    rows = [", ".join(f"{value:4d}" for value in values[rank * 8:rank * 8 + 8]) for rank in range(8)]
+    return f"{name} = [\n    " + ",\n    ".join(rows) + "]\n"
+
+
+def write_module(path: str, parameters: Parameters, comment: str = ""):
+    """
+    Writes the tables as a Python module that can replace psqt.py:
+    the tuned tables with the names and layout of psqt.py, followed by
+    the rest of psqt.py (phases, combined tables and evaluation functions).
+    """
+    names = {piece_type: chess.piece_name(piece_type).upper() for piece_type in chess.PIECE_TYPES}
+    lines = ['"""', "PeSTO tables tuned by tuner.py", comment, '"""',
+             "import chess", "", "from math import inf", "from typing import List", ""]
+    for prefix, values in (("MG", parameters.mg_values), ("EG", parameters.eg_values)):
+        lines.append(f"{prefix}_PIECE_VALUES = {{")
+        lines += [f"    chess.{names[piece_type]}: {round(value)},"
+                  for piece_type, value in zip(chess.PIECE_TYPES, values)]
+        lines += ["}", ""]
+    lines.append("# Squares are written as if looking from the white's perspective")
+    lines.append("# with a1 in the bottom left corner.")
+    for piece_type in chess.PIECE_TYPES:
+        for prefix, tables in (("MG", parameters.mg_tables), ("EG", parameters.eg_tables)):
+            lines.append(format_table(f"{prefix}_{names[piece_type]}",
+                                      np.rint(tables[piece_type - 1]).astype(int)))
+    for prefix in ("MG", "EG"):
+        lines.append(f"{prefix}_PESTO = {{")
+        lines += [f"    chess.{names[piece_type]}: {prefix}_{names[piece_type]}," for piece_type in chess.PIECE_TYPES]
+        lines += ["}", ""]
+    with open(psqt.__file__) as source:
+        code = source.read()
+    lines.append(code[code.index(PSQT_CODE_START):])
+    with open(path, "w") as module:
+        module.write("\n".join(lines))
+
+
+def main(argv: List[str]):
+    parser = argparse.ArgumentParser(description="Texel tuning of the PeSTO tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+    extract_parser = commands.add_parser("extract", help="stream positions into the feature cache")
+    extract_parser.add_argument("cache")
+    extract_parser.add_argument("files", nargs="+")
+    tune_parser = commands.add_parser("tune", help="tune the tables on the feature cache")
+    tune_parser.add_argument("cache")
+    tune_parser.add_argument("output")
+    tune_parser.add_argument("--epochs", type=int, default=10)
+    tune_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    tune_parser.add_argument("--lr", type=float, default=1.0)
+    tune_parser.add_argument("--k", type=float, default=None, help="fitted to the current tables if not given")
+    args = parser.parse_args(argv)
+
+    if args.command == "extract":
+        start_time = perf_counter()
+        total = extract(args.cache, args.files)
+        print(f"{total} positions extracted in {perf_counter() - start_time:.1f}s")
+        return
+
+    records = load(args.cache)
+    parameters = Parameters.from_psqt()
+    k = args.k or fit_k(np.asarray(records[:1 << 20]), parameters)
+    print(f"{len(records)} positions, K {k:.4f}, loss {loss_of(records, parameters, k):.6f}")
+    tune(records, parameters, k, args.epochs, args.batch_size, args.lr)
+    write_module(args.output, parameters,
+                 f"{len(records)} positions, K {k:.4f}, loss {loss_of(records, parameters, k):.6f}")
+    print("tables written to", args.output)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,395 @@
+"""
+Persistent search worker.
+
+The UCI interface starts one worker process for the whole session instead of
+a new engine.py process for every go. The worker receives commands through a
+pipe and sends back everything the search prints (info and bestmove lines),
+line by line, through a second pipe. A listener thread in the worker watches
+the command pipe while a search runs, so stop is handled cooperatively through
+TimeManager.stop() and the process, with its transposition table (shared with
+the helper processes when there is more than one thread), move ordering
+history and pawn hash table, survives for the next move.
+A ponder search is turned into a timed one the same way, by ponderhit.
+"""
+
+import chess
+import queue
+import signal
+import sys
+import threading
+
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from traceback import format_exc
+from typing import List
+
+from timeman import SearchAborted, TimeManager
+
+# command names sent to the worker
+GO = "go"
+STOP = "stop"
+PONDERHIT = "ponderhit"
+NEW_GAME = "newgame"
+BENCH = "bench"
+PERFT = "perft"
+QUIT = "quit"
+# sent by the worker when a command without a bestmove (bench, perft) is done,
+# printed lines never contain a newline so it can't be mistaken for one
+TASK_DONE = "\n"
+
+
+class LineWriter:
+    """File-like object for sys.stdout that sends every printed line through a pipe"""
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.buffer = ""
+
+    def write(self, text: str) -> int:
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            self.connection.send(line)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class EngineWorker:
+    """
+    Interface side of the worker: starts the process and talks to it.
+    Every search gets an id, so a stop that crosses the bestmove of its search
+    doesn't stop the next one.
+    """
+
+    def __init__(self):
+        self.commands, worker_commands = Pipe()
+        self.output, worker_output = Pipe(duplex=False)
+        # not a daemon, daemonic processes can't start the helpers of a parallel search
+        self.process = Process(target=run_worker, args=(worker_commands, worker_output))
+        self.process.start()
+        worker_commands.close()
+        worker_output.close()
+        self.search_id = 0
+        self.searching = False
+        self.pondering = False
+
+    def go(self,
+           fen: str,
+           moves: List[str],
+           mode: str,
+           mode_param: int,
+           hard_limit: float,
+           searchmoves: List[str],
+           debug: bool,
+           hash_mb: int,
+           threads: int,
+           ponder: bool = False,
+           syzygy_path: str = "",
+           eval_cache_size: int = 0
+          ):
+        """
+        Starts a search of the position after the moves (uci) from fen,
+        the other arguments are those of the engine.py command line.
+        A ponder search runs without limits until ponderhit(), the time limits apply from then.
+        syzygy_path is the directory of the Syzygy tables, empty for none.
+        eval_cache_size is the number of entries of the evaluation cache, 0 for none.
+        """
+        self.search_id += 1
+        self.searching = True
+        self.commands.send((GO, self.search_id, {
+            "fen": fen, "moves": moves, "mode": mode, "mode_param": mode_param, "hard_limit": hard_limit,
+            "searchmoves": searchmoves, "debug": debug, "hash_mb": hash_mb, "threads": threads,
+            "ponder": ponder, "syzygy_path": syzygy_path, "eval_cache_size": eval_cache_size,
+        }))
+        self.pondering = ponder
+
+    def stop(self):
+        """Asks the running search to finish, it still sends its bestmove"""
+        if self.searching:
+            self.commands.send((STOP, self.search_id, None))
+
+    def ponderhit(self):
+        """The opponent played the pondered move, the running ponder search switches to its time limits"""
+        if self.searching and self.pondering:
+            self.pondering = False
+            self.commands.send((PONDERHIT, self.search_id, None))
+
+    def new_game(self):
+        """Clears the tables kept from the previous game"""
+        self.commands.send((NEW_GAME, 0, None))
+
+    def bench(self, depth: int|None, hash_mb: int):
+        """
+        Runs the benchmark of bench.py, to its default depth if None, and prints the results.
+        The worker is busy like in a search until it is done, stop() ends it early.
+        """
+        self.search_id += 1
+        self.searching = True
+        self.commands.send((BENCH, self.search_id, {"depth": depth, "hash_mb": hash_mb}))
+
+    def perft(self, fen: str, moves: List[str], depth: int, divide: bool):
+        """
+        Counts the move tree of the position to the depth with perft.py, per root move if divide.
+        The worker is busy like in a search until it is done, stop() aborts the count.
+        """
+        self.search_id += 1
+        self.searching = True
+        self.commands.send((PERFT, self.search_id, {"fen": fen, "moves": moves, "depth": depth, "divide": divide}))
+
+    def read_line(self) -> str|None:
+        """Blocks until the worker prints a line, None when the worker has exited"""
+        while True:
+            try:
+                line = self.output.recv()
+            except EOFError:
+                return None
+            if line == TASK_DONE:
+                self.searching = False
+                continue
+            if line.startswith("bestmove"):
+                self.searching = False
+                self.pondering = False
+            return line
+
+    def quit(self):
+        try:
+            self.commands.send((QUIT, self.search_id, None))
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class WorkerState:
+    """Search state of the worker process, kept between moves"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timer = None
+        self.running_id = 0
+        self.stop_id = 0
+        self.ponderhit_id = 0
+        self.tt = None
+        self.orderer = None
+        self.game = None
+        self.tablebase = None
+        # shared table of the searches with more than one thread
+        self.smp = None
+
+    def start(self, search_id: int, timer: TimeManager):
+        """
+        Makes the timer of the command with the id the one stop and ponderhit go to
+        and applies those that overtook the command.
+        """
+        with self.lock:
+            self.timer = timer
+            self.running_id = search_id
+            if self.ponderhit_id == search_id:
+                timer.ponderhit()
+            if self.stop_id == search_id:
+                timer.stop()
+
+    def finish(self):
+        with self.lock:
+            self.timer = None
+
+    def stop(self, search_id: int):
+        """Called by the listener thread"""
+        with self.lock:
+            if search_id == self.running_id and self.timer is not None:
+                self.timer.stop()
+            elif search_id > self.running_id:
+                # the stop overtook its go, it is applied when the search starts
+                self.stop_id = search_id
+
+    def ponderhit(self, search_id: int):
+        """Called by the listener thread"""
+        with self.lock:
+            if search_id == self.running_id and self.timer is not None:
+                self.timer.ponderhit()
+            elif search_id > self.running_id:
+                self.ponderhit_id = search_id
+
+    def close_smp(self):
+        """Frees the shared table"""
+        if self.smp is not None:
+            self.smp.close()
+            self.smp = None
+
+    def close(self):
+        self.close_smp()
+        if self.tablebase is not None:
+            self.tablebase.close()
+            self.tablebase = None
+
+    def new_game(self):
+        from pawns import PAWN_TABLE
+
+        self.close_smp()
+
+        if self.tt is not None:
+            self.tt.clear()
+        if self.orderer is not None:
+            self.orderer.clear()
+        if self.tablebase is not None:
+            self.tablebase.clear()
+        PAWN_TABLE.clear()
+
+    def bench(self, search_id: int, depth: int|None, hash_mb: int):
+        from bench import DEFAULT_BENCH_DEPTH, bench, summary
+
+        timer = TimeManager()
+        self.start(search_id, timer)
+        try:
+            results = bench(depth or DEFAULT_BENCH_DEPTH, hash_mb=hash_mb, timer=timer)
+        finally:
+            self.finish()
+        if timer.stopped:
+            print("info string bench stopped")
+        for line in summary(results):
+            print(line)
+
+    def perft(self, search_id: int, fen: str, moves: List[str], depth: int, divide: bool):
+        from game import Game
+        from incremental import IncrementalBoard
+        from perft import run
+
+        if self.game is None:
+            self.game = Game(IncrementalBoard)
+        # the board of the search, its make/unmake is what perft measures
+        board = self.game.set_position(fen, moves)
+        root_ply = len(board.move_stack)
+        timer = TimeManager()
+        self.start(search_id, timer)
+        try:
+            run(board, depth, divide, timer=timer)
+        except SearchAborted:
+            # the count was stopped in the middle of a line
+            while len(board.move_stack) > root_ply:
+                board.pop()
+            print("info string perft stopped")
+        finally:
+            self.finish()
+
+    def search(self,
+               search_id: int,
+               fen: str,
+               moves: List[str],
+               mode: str,
+               mode_param: int,
+               hard_limit: float,
+               searchmoves: List[str],
+               debug: bool,
+               hash_mb: int,
+               threads: int,
+               ponder: bool,
+               syzygy_path: str,
+               eval_cache_size: int
+              ):
+        # imported here and not at the top, the interface process imports this module
+        # and doesn't need the search
+        import engine
+        from game import Game
+        from incremental import IncrementalBoard
+        from ordering import MoveOrderer
+        from pawns import pawn_evaluate
+        from smp import LazySMP
+        from tablebase import Tablebase
+        from transposition import TranspositionTable, table_entries
+
+        # a new Hash or Threads setting frees the shared table and makes a new one
+        if self.smp is not None and (threads == 1 or (self.smp.threads, self.smp.hash_mb) != (threads, hash_mb)):
+            self.close_smp()
+        if threads > 1 and self.smp is None:
+            self.smp = LazySMP(threads, hash_mb)
+        if threads == 1 and (self.tt is None or self.tt.size != table_entries(hash_mb)):
+            self.tt = TranspositionTable(hash_mb)
+        if self.orderer is None:
+            self.orderer = MoveOrderer()
+        if self.game is None:
+            self.game = Game(IncrementalBoard)
+        # the tables are opened once and their files stay mapped between the searches
+        if self.tablebase is not None and self.tablebase.directory != syzygy_path:
+            self.tablebase.close()
+            self.tablebase = None
+        if self.tablebase is None and syzygy_path:
+            try:
+                self.tablebase = Tablebase(syzygy_path)
+            except OSError as error:
+                print("info string Can't open the tablebases:", error)
+        # only the moves played since the last search are pushed
+        board = self.game.set_position(fen, moves)
+        root_ply = len(board.move_stack)
+        # a fixed-depth search gets a timer without limits so it can be stopped
+        timer = TimeManager(mode_param, hard_limit, ponder=ponder) if mode == "t" else TimeManager(ponder=ponder)
+        self.start(search_id, timer)
+
+        engine.bestmove = "0000"
+        engine.score = 0
+        try:
+            engine.go(board, mode, mode_param, [chess.Move.from_uci(move) for move in searchmoves],
+                      pawn_evaluate, debug, hash_mb, threads=threads, timer=timer, eval_cache_size=eval_cache_size,
+                      tt=self.tt, orderer=self.orderer, tablebase=self.tablebase, smp=self.smp)
+        except Exception:
+            for line in format_exc().splitlines():
+                print("info string", line)
+            # the next position only pushes its new moves onto the board of the game
+            while len(board.move_stack) > root_ply:
+                board.pop()
+            print("bestmove", engine.bestmove)
+        finally:
+            self.finish()
+
+
+def listen(commands: Connection, requests: queue.Queue, state: WorkerState):
+    """Listener thread of the worker: handles stop and ponderhit right away, queues the rest for the search thread"""
+    while True:
+        try:
+            command, search_id, args = commands.recv()
+        except EOFError:
+            command, search_id, args = QUIT, state.running_id, None
+        if command == STOP or command == QUIT:
+            state.stop(search_id)
+        if command == PONDERHIT:
+            state.ponderhit(search_id)
+        elif command != STOP:
+            requests.put((command, search_id, args))
+        if command == QUIT:
+            return
+
+
+def run_worker(commands: Connection, output: Connection):
+    """Main function of the worker process"""
+    # the interface handles ctrl+c, the worker is stopped with quit
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sys.stdout = LineWriter(output)
+    # the listener thread waits for the search thread to give up the GIL,
+    # by default up to 5 ms, which would delay every stop
+    sys.setswitchinterval(0.0005)
+    state = WorkerState()
+    requests: queue.Queue = queue.Queue()
+    threading.Thread(target=listen, args=(commands, requests, state), daemon=True).start()
+
+    while True:
+        command, search_id, args = requests.get()
+        if command == QUIT:
+            break
+        if command == NEW_GAME:
+            state.new_game()
+        elif command == GO:
+            state.search(search_id, **args)
+        elif command == BENCH:
+            try:
+                state.bench(search_id, **args)
+            finally:
+                output.send(TASK_DONE)
+        elif command == PERFT:
+            try:
+                state.perft(search_id, **args)
+            finally:
+                output.send(TASK_DONE)
+    state.close()
+    output.close()
@@ -0,0 +1,147 @@
+"""
+Polyglot Zobrist hashes.
+
+zobrist_hash() gives the same keys as chess.polyglot.zobrist_hash(), but reads
+the pieces from the bitboards. child_hash() derives the key of the position
+after a move from the key of the current one without pushing the move.
+game_history() gives the keys the search checks repetitions against.
+"""
+
+import chess
+
+from chess.polyglot import POLYGLOT_RANDOM_ARRAY
+from typing import List
+
+# PIECE_KEYS[color][piece_type][square], the polyglot piece index is (piece_type - 1) * 2 + color
+# (black is 0, white 1)
+PIECE_KEYS = [[[0] * 64] + [POLYGLOT_RANDOM_ARRAY[64 * ((piece_type - 1) * 2 + color):][:64]
+                            for piece_type in chess.PIECE_TYPES]
+              for color in (chess.BLACK, chess.WHITE)]
+# white kingside, white queenside, black kingside, black queenside
+CASTLING_KEYS = POLYGLOT_RANDOM_ARRAY[768:772]
+EP_KEYS = POLYGLOT_RANDOM_ARRAY[772:780]
+TURN_KEY = POLYGLOT_RANDOM_ARRAY[780]
+
+
+def zobrist_hash(board: chess.Board) -> int:
+    """Polyglot key of the position, equal to chess.polyglot.zobrist_hash(board)"""
+    key = 0
+    for color in chess.COLORS:
+        occupied = board.occupied_co[color]
+        keys = PIECE_KEYS[color]
+        for piece_type, pieces in ((chess.PAWN, board.pawns),
+                                   (chess.KNIGHT, board.knights),
+                                   (chess.BISHOP, board.bishops),
+                                   (chess.ROOK, board.rooks),
+                                   (chess.QUEEN, board.queens),
+                                   (chess.KING, board.kings)):
+            mask = pieces & occupied
+            row = keys[piece_type]
+            while mask:
+                key ^= row[(mask & -mask).bit_length() - 1]
+                mask &= mask - 1
+    if board.castling_rights:
+        key ^= castling_hash(board)
+    key ^= ep_hash(board.ep_square, board.pawns & board.occupied_co[board.turn], board.turn)
+    if board.turn == chess.WHITE:
+        key ^= TURN_KEY
+    return key
+
+
+def castling_hash(board: chess.Board) -> int:
+    """Castling part of the key"""
+    key = 0
+    if board.has_kingside_castling_rights(chess.WHITE):
+        key ^= CASTLING_KEYS[0]
+    if board.has_queenside_castling_rights(chess.WHITE):
+        key ^= CASTLING_KEYS[1]
+    if board.has_kingside_castling_rights(chess.BLACK):
+        key ^= CASTLING_KEYS[2]
+    if board.has_queenside_castling_rights(chess.BLACK):
+        key ^= CASTLING_KEYS[3]
+    return key
+
+
+def ep_hash(ep_square: int|None, capturers: int, turn: chess.Color) -> int:
+    """
+    En passant part of the key: the file of the square, but only if a pawn
+    of the side to move stands ready to capture (legality is irrelevant).
+
+    :param capturers: pawns of the side to move
+    """
+    if ep_square is None:
+        return 0
+    pawn_square = chess.BB_SQUARES[ep_square - 8 if turn == chess.WHITE else ep_square + 8]
+    if (chess.shift_left(pawn_square) | chess.shift_right(pawn_square)) & capturers:
+        return EP_KEYS[chess.square_file(ep_square)]
+    return 0
+
+
+def child_hash(board: chess.Board, key: int, move: chess.Move) -> int:
+    """
+    Key of the position after the move, computed from the key of the current
+    position without pushing the move. Chess960 boards and null moves fall back
+    to pushing it.
+
+    :param key: zobrist_hash(board)
+    :param move: a legal move in the position
+    """
+    if board.chess960 or not move:
+        board.push(move)
+        key = zobrist_hash(board)
+        board.pop()
+        return key
+
+    us = board.turn
+    them = not us
+    from_square = move.from_square
+    to_square = move.to_square
+    piece_type = board.piece_type_at(from_square)
+    keys_us = PIECE_KEYS[us]
+
+    key ^= keys_us[piece_type][from_square] ^ TURN_KEY
+    key ^= ep_hash(board.ep_square, board.pawns & board.occupied_co[us], us)
+    old_castling = castling_hash(board) if board.castling_rights else 0
+
+    if piece_type == chess.KING and board.is_castling(move):
+        rank = chess.square_rank(from_square)
+        kingside = chess.square_file(to_square) > chess.square_file(from_square)
+        rook_from = chess.square(7 if kingside else 0, rank)
+        key ^= (keys_us[chess.KING][chess.square(6 if kingside else 2, rank)]
+                ^ keys_us[chess.ROOK][rook_from] ^ keys_us[chess.ROOK][chess.square(5 if kingside else 3, rank)])
+    else:
+        if board.occupied_co[them] & chess.BB_SQUARES[to_square]:
+            key ^= PIECE_KEYS[them][board.piece_type_at(to_square)][to_square]
+        elif piece_type == chess.PAWN and to_square == board.ep_square:
+            key ^= PIECE_KEYS[them][chess.PAWN][to_square - 8 if us == chess.WHITE else to_square + 8]
+        key ^= keys_us[move.promotion or piece_type][to_square]
+
+    # castling rights are lost by moving the king or a rook, or by losing the rook
+    if old_castling:
+        rights = board.clean_castling_rights() & ~chess.BB_SQUARES[from_square] & ~chess.BB_SQUARES[to_square]
+        if piece_type == chess.KING:
+            rights &= ~(chess.BB_RANK_1 if us == chess.WHITE else chess.BB_RANK_8)
+        new_castling = 0
+        for bit, square in enumerate((chess.H1, chess.A1, chess.H8, chess.A8)):
+            if rights & chess.BB_SQUARES[square]:
+                new_castling ^= CASTLING_KEYS[bit]
+        key ^= old_castling ^ new_castling
+
+    # after a double push the opponent may capture en passant
+    if piece_type == chess.PAWN and abs(to_square - from_square) == 16:
+        key ^= ep_hash((from_square + to_square) // 2, board.pawns & board.occupied_co[them], them)
+    return key
+
+
+def game_history(board: chess.Board) -> List[int]:
+    """
+    Keys of the positions of the game before the current one, oldest first,
+    back to the last capture or pawn move (the earlier ones can't be repeated).
+    """
+    board = board.copy()
+    keys = []
+    for _ in range(min(board.halfmove_clock, len(board.move_stack))):
+        board.pop()
+        keys.append(zobrist_hash(board))
+    keys.reverse()
+    return keys